@@ -1,5 +1,7 @@
 import os
 
+import pytest
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 root_dir_content = os.listdir(BASE_DIR)
 PROJECT_DIR_NAME = 'yatube'
@@ -37,3 +39,18 @@ pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(scope='session', autouse=True)
+def isolated_environment(django_test_environment):
+    from core import testing
+    with testing.test_environment():
+        yield
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # База откатывается после каждого теста, а сброс кэша лент ждёт
+    # фиксации транзакции, поэтому кэш очищается вместе с базой
+    from django.core.cache import cache
+    cache.clear()
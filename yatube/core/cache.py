@@ -0,0 +1,480 @@
+"""Двухуровневый кэш: L1 в памяти процесса и общий для воркеров L2.
+
+``SQLiteCache`` — общий кэш в файле SQLite, который видят все процессы
+на машине. ``TieredCache`` держит перед ним небольшой L1 с вытеснением
+по суммарному размеру значений. О каждой записи (set, incr, delete,
+clear) процесс сообщает остальным через шину — unix-сокеты в каталоге
+LOCATION, — и они выбрасывают ключ из своего L1 при следующем обращении
+к кэшу. Так сохранение поста сбрасывает версию ленты во всех воркерах.
+
+Сообщение может не дойти до процесса, который долго не читает шину;
+поэтому L1 хранит значения не дольше ``LOCAL_TIMEOUT`` секунд.
+"""
+import atexit
+import logging
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import metrics
+
+logger = logging.getLogger('core.cache')
+
+# Ключей в одном сообщении шины: датаграмма не должна быть слишком большой
+MESSAGE_KEYS = 100
+CLEAR = '*'
+# SQLite принимает не больше 999 параметров в запросе
+SQLITE_BATCH = 500
+# Раз в столько записей процесс чистит L2 от устаревших значений
+CULL_EVERY = 100
+
+
+class SQLiteCache(BaseCache):
+    """Общий кэш в файле SQLite (LOCATION); соединение на поток."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = location
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def db(self):
+        # После fork соединение родителя использовать нельзя
+        if getattr(self._local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)'
+            )
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return self._local.db
+
+    @contextmanager
+    def transaction(self):
+        db = self.db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def get(self, key, default=None, version=None):
+        row = self.db.execute(
+            'SELECT value FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self._key(key, version), time.time()),
+        ).fetchone()
+        return default if row is None else pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        made = list(keys)
+        found = {}
+        now = time.time()
+        for start in range(0, len(made), SQLITE_BATCH):
+            batch = made[start:start + SQLITE_BATCH]
+            rows = self.db.execute(
+                'SELECT key, value FROM cache WHERE key IN ({}) '
+                'AND (expires IS NULL OR expires > ?)'.format(
+                    ', '.join('?' * len(batch))
+                ),
+                (*batch, now),
+            )
+            for made_key, value in rows:
+                found[keys[made_key]] = pickle.loads(value)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = [
+            (
+                self._key(key, version),
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                expires,
+            )
+            for key, value in data.items()
+        ]
+        with self.transaction() as db:
+            db.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                rows,
+            )
+        self._maybe_cull(len(rows))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self.transaction() as db:
+            row = db.execute(
+                'SELECT 1 FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, time.time()),
+            ).fetchone()
+            if row is not None:
+                return False
+            db.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                (
+                    key,
+                    pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                    self.get_backend_timeout(timeout),
+                ),
+            )
+        self._maybe_cull(1)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        with self.transaction() as db:
+            row = db.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            db.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key),
+            )
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        updated = self.db.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (
+                self.get_backend_timeout(timeout),
+                self._key(key, version),
+                time.time(),
+            ),
+        )
+        return updated.rowcount > 0
+
+    def has_key(self, key, version=None):
+        return self.get_many([key], version=version) != {}
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        made = [self._key(key, version) for key in keys]
+        with self.transaction() as db:
+            for start in range(0, len(made), SQLITE_BATCH):
+                batch = made[start:start + SQLITE_BATCH]
+                db.execute(
+                    'DELETE FROM cache WHERE key IN ({})'.format(
+                        ', '.join('?' * len(batch))
+                    ),
+                    batch,
+                )
+
+    def clear(self):
+        self.db.execute('DELETE FROM cache')
+
+    def _maybe_cull(self, written):
+        self._writes += written
+        if self._writes < CULL_EVERY:
+            return
+        self._writes = 0
+        self.cull()
+
+    def cull(self):
+        """Удаляет устаревшие значения и, сверх MAX_ENTRIES, самые
+        близкие к устареванию."""
+        with self.transaction() as db:
+            db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+            count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+            if count <= self._max_entries:
+                return
+            excess = count - self._max_entries
+            db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY expires IS NULL, expires LIMIT ?)',
+                (max(excess, count // self._cull_frequency),),
+            )
+
+
+class InvalidationBus:
+    """Шина сброса ключей между процессами на unix-сокетах.
+
+    Каждый процесс слушает свой датаграммный сокет ``<pid>.sock`` в
+    каталоге и шлёт сообщения во все чужие. Сокеты завершившихся
+    процессов удаляются при первой неудачной отправке.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.pid = None
+        self.socket = None
+        self.path = None
+
+    def _open(self):
+        # Сокет, унаследованный при fork, читал бы родитель
+        if self.pid == os.getpid():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.pid = os.getpid()
+        self.path = os.path.join(self.directory, f'{self.pid}.sock')
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.socket.bind(self.path)
+        atexit.register(self._close, self.path)
+
+    @staticmethod
+    def _close(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def publish(self, keys):
+        self._open()
+        keys = list(keys)
+        messages = [
+            '\n'.join(keys[start:start + MESSAGE_KEYS]).encode()
+            for start in range(0, len(keys), MESSAGE_KEYS)
+        ]
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path == self.path or not name.endswith('.sock'):
+                continue
+            for message in messages:
+                try:
+                    self.socket.sendto(message, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Процесс завершился, не убрав сокет
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    break
+                except BlockingIOError:
+                    logger.warning(
+                        'Очередь шины кэша %s переполнена; его L1 '
+                        'обновится через LOCAL_TIMEOUT', name,
+                    )
+                    break
+
+    def receive(self):
+        """Ключи из пришедших сообщений; CLEAR — очистить всё."""
+        self._open()
+        keys = []
+        while True:
+            try:
+                message = self.socket.recv(65536)
+            except BlockingIOError:
+                return keys
+            keys.extend(message.decode().split('\n'))
+
+
+# Состояние L1 общее для всех потоков процесса, как у LocMemCache
+_local_caches = {}
+_lock = threading.Lock()
+
+
+class LocalState:
+    """L1 одного процесса: значения, их размер и шина."""
+
+    def __init__(self, directory):
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.RLock()
+        self.bus = InvalidationBus(directory)
+        # Растёт при каждом изменении L1; значение из L2, прочитанное
+        # до изменения, в L1 не кладётся
+        self.generation = 0
+
+
+class TieredCache(BaseCache):
+    """L1 в памяти процесса перед общим кэшем из OPTIONS['SHARED'].
+
+    LOCATION — каталог шины сброса. OPTIONS: ``SHARED`` — алиас L2,
+    ``LOCAL_MAX_BYTES`` — объём L1, ``LOCAL_MAX_ENTRY_BYTES`` — значения
+    крупнее в L1 не попадают, ``LOCAL_TIMEOUT`` — сколько L1 верит
+    значению без сообщений шины.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.max_bytes = options.get('LOCAL_MAX_BYTES', 16 * 1024 * 1024)
+        self.max_entry_bytes = options.get(
+            'LOCAL_MAX_ENTRY_BYTES', 1024 * 1024
+        )
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 60)
+        with _lock:
+            state = _local_caches.get(location)
+            if state is None:
+                state = _local_caches[location] = LocalState(location)
+        self.state = state
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _sync(self):
+        """Выбрасывает из L1 ключи, изменённые другими процессами."""
+        keys = self.state.bus.receive()
+        if not keys:
+            return
+        with self.state.lock:
+            self.state.generation += 1
+            if CLEAR in keys:
+                self.state.entries.clear()
+                self.state.size = 0
+                return
+            for key in keys:
+                self._forget(key)
+
+    def _forget(self, key):
+        entry = self.state.entries.pop(key, None)
+        if entry is not None:
+            self.state.size -= len(entry[1])
+
+    def _lookup(self, key):
+        entry = self.state.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._forget(key)
+            return None
+        self.state.entries.move_to_end(key)
+        return entry[1]
+
+    def _remember(self, key, value, timeout=DEFAULT_TIMEOUT, generation=None):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        lifetime = self.local_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            lifetime = min(lifetime, timeout)
+        with self.state.lock:
+            if generation is not None and generation != self.state.generation:
+                # Пока значение читалось из L2, ключи менялись
+                return
+            self._forget(key)
+            if len(data) > self.max_entry_bytes or lifetime <= 0:
+                return
+            self.state.entries[key] = (time.monotonic() + lifetime, data)
+            self.state.size += len(data)
+            while self.state.size > self.max_bytes:
+                _, (_, evicted) = self.state.entries.popitem(last=False)
+                self.state.size -= len(evicted)
+
+    def _changed(self, keys):
+        """Отмечает локальную запись и сообщает о ней другим процессам."""
+        with self.state.lock:
+            self.state.generation += 1
+            for key in keys:
+                self._forget(key)
+        self.state.bus.publish(keys)
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        made = {self._key(key, version): key for key in keys}
+        found = {}
+        with self.state.lock:
+            for made_key, key in made.items():
+                data = self._lookup(made_key)
+                if data is not None:
+                    found[key] = pickle.loads(data)
+            generation = self.state.generation
+        missing = [key for key in made.values() if key not in found]
+        metrics.count_lookups('l1', len(found), len(missing))
+        if not missing:
+            return found
+        fetched = self.shared.get_many(missing, version=version)
+        for key, value in fetched.items():
+            self._remember(
+                self._key(key, version), value, generation=generation
+            )
+        found.update(fetched)
+        return found
+
+    def has_key(self, key, version=None):
+        return bool(self.get_many([key], version=version))
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set_many(data, timeout, version=version)
+        made = {self._key(key, version): value for key, value in data.items()}
+        self._changed(made)
+        for key, value in made.items():
+            self._remember(key, value, timeout)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if not self.shared.add(key, value, timeout, version=version):
+            return False
+        made = self._key(key, version)
+        self._changed([made])
+        self._remember(made, value, timeout)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        made = self._key(key, version)
+        self._changed([made])
+        self._remember(made, value)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        if not keys:
+            return
+        self.shared.delete_many(keys, version=version)
+        self._changed([self._key(key, version) for key in keys])
+
+    def clear(self):
+        self.shared.clear()
+        with self.state.lock:
+            self.state.generation += 1
+            self.state.entries.clear()
+            self.state.size = 0
+        self.state.bus.publish([CLEAR])
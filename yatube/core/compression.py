@@ -0,0 +1,248 @@
+"""Сжатие ответов gzip и brotli.
+
+``CompressionMiddleware`` сжимает ответ кодировкой из Accept-Encoding:
+brotli, если установлен пакет ``brotli``, иначе gzip. Страницы с
+CSRF-токеном не сжимаются (BREACH).
+
+``CompressedResponse`` хранит ответ в кэше уже сжатым. Тело режется по
+меткам фрагментов на куски, каждый кусок — блоки raw deflate, закрытые
+``Z_SYNC_FLUSH``. Такие блоки можно склеить с фрагментами, сжатыми
+отдельно, в один поток gzip, а CRC32 текста собрать из CRC кусков без
+их распаковки. Поэтому сжимаются только фрагменты запроса. Потоки
+brotli так не склеиваются, и brotli-копия хранится только для ответов
+без фрагментов.
+
+Сколько байт было и стало, видно в метриках
+``yatube_compression_input_bytes_total`` и
+``yatube_compression_output_bytes_total``.
+"""
+import re
+import struct
+import zlib
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from . import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Заголовок gzip без имени файла и времени изменения
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+# Пустой последний блок deflate
+FINAL_BLOCK = b'\x03\x00'
+COMPRESSIBLE = re.compile(
+    r'^(text/|application/(json|javascript|xml)|image/svg\+xml)'
+)
+
+
+def available_encodings():
+    """Кодировки в порядке предпочтения."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def accepted_encodings(request):
+    """Кодировки из Accept-Encoding без q=0."""
+    accepted = set()
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    for item in header.split(','):
+        name, _, params = item.partition(';')
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def choose_encoding(request, encodings=None):
+    """Первая из encodings, которую принимает клиент; None — без сжатия."""
+    accepted = accepted_encodings(request)
+    for encoding in encodings or available_encodings():
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+def deflate(data, level):
+    """Блоки raw deflate, которые можно склеивать с другими."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def gzip_trailer(crc, length):
+    return struct.pack('<II', crc & 0xffffffff, length & 0xffffffff)
+
+
+def crc32_combine(crc, chunk_crc, length, zeros_crc):
+    """CRC32 склейки текста с CRC crc и куска с CRC chunk_crc.
+
+    CRC32 аффинна, поэтому хватает CRC нулей длины куска; zeros_crc —
+    CRC32 этих нулей от начального значения.
+    """
+    return zlib.crc32(bytes(length), crc) ^ chunk_crc ^ zeros_crc
+
+
+def compress(data, encoding, level=None):
+    """data, сжатые кодировкой encoding."""
+    if encoding == 'br':
+        return brotli.compress(
+            data, quality=level or settings.COMPRESSION_BROTLI_QUALITY
+        )
+    level = level or settings.COMPRESSION_GZIP_LEVEL
+    return b''.join((
+        GZIP_HEADER, deflate(data, level), FINAL_BLOCK,
+        gzip_trailer(zlib.crc32(data), len(data)),
+    ))
+
+
+def record(stage, encoding, original, compressed):
+    """Байты до и после сжатия; stage — 'cache' или 'response'."""
+    metrics.inc(
+        'yatube_compression_input_bytes_total', original,
+        stage=stage, encoding=encoding,
+    )
+    metrics.inc(
+        'yatube_compression_output_bytes_total', compressed,
+        stage=stage, encoding=encoding,
+    )
+
+
+def is_compressible(request, response):
+    if response.streaming or response.has_header('Content-Encoding'):
+        return False
+    # Токен CSRF в сжатом ответе подбирается атакой BREACH
+    if request.META.get('CSRF_COOKIE_USED'):
+        return False
+    content_type = response.get('Content-Type', '')
+    return (
+        COMPRESSIBLE.match(content_type) is not None
+        and len(response.content) >= settings.COMPRESSION_MIN_LENGTH
+    )
+
+
+def compress_response(request, response):
+    """Сжимает response кодировкой, которую принимает клиент."""
+    if not is_compressible(request, response):
+        return response
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = choose_encoding(request)
+    if encoding is None:
+        return response
+    original = len(response.content)
+    compressed = compress(response.content, encoding)
+    if len(compressed) >= original:
+        return response
+    record('response', encoding, original, len(compressed))
+    response.content = compressed
+    response['Content-Length'] = str(len(compressed))
+    response['Content-Encoding'] = encoding
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        # Сжатое тело не совпадает байт в байт с исходным
+        response['ETag'] = 'W/' + etag
+    return response
+
+
+class Chunk:
+    """Кусок тела между фрагментами, сжатый в блоки raw deflate."""
+
+    def __init__(self, data, level):
+        self.deflated = deflate(data, level)
+        self.crc = zlib.crc32(data)
+        self.length = len(data)
+        self.zeros_crc = zlib.crc32(bytes(self.length))
+
+    def inflate(self):
+        return zlib.decompressobj(-zlib.MAX_WBITS).decompress(self.deflated)
+
+
+class CompressedResponse:
+    """Ответ для кэша с телом, сжатым заранее.
+
+    holes — регулярное выражение меток фрагментов; группы метки
+    передаются в fill при выдаче ответа.
+    """
+
+    def __init__(self, response, holes=None):
+        self.status_code = response.status_code
+        self.charset = response.charset
+        self.headers = [
+            (header, value) for header, value in response.items()
+            if header.lower() != 'content-length'
+        ]
+        content = response.content
+        level = settings.CACHED_PAGE_GZIP_LEVEL
+        if holes is None:
+            parts, step = [content], 1
+        else:
+            parts, step = holes.split(content), holes.groups + 1
+        self.chunks = [Chunk(part, level) for part in parts[::step]]
+        self.holes = [
+            tuple(parts[index + 1:index + step])
+            for index in range(0, len(parts) - 1, step)
+        ]
+        self.brotli = None
+        if brotli is not None and not self.holes:
+            self.brotli = brotli.compress(
+                content, quality=settings.CACHED_PAGE_BROTLI_QUALITY
+            )
+            record('cache', 'br', len(content), len(self.brotli))
+        record(
+            'cache', 'gzip', len(content),
+            sum(len(chunk.deflated) for chunk in self.chunks),
+        )
+
+    def encodings(self):
+        return ('br', 'gzip') if self.brotli is not None else ('gzip',)
+
+    def render(self, request, fill=None):
+        """Ответ для request; fill(*группы метки) даёт байты фрагмента."""
+        fragments = [fill(*groups) for groups in self.holes]
+        encoding = choose_encoding(request, self.encodings())
+        if encoding == 'br':
+            body = self.brotli
+            original = self.chunks[0].length
+        elif encoding == 'gzip':
+            body, original = self.gzip(fragments)
+        else:
+            body = self.identity(fragments)
+        response = HttpResponse(body, status=self.status_code)
+        for header, value in self.headers:
+            response[header] = value
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if encoding is not None:
+            record('response', encoding, original, len(body))
+            response['Content-Encoding'] = encoding
+            response['Content-Length'] = str(len(body))
+        return response
+
+    def identity(self, fragments):
+        parts = [self.chunks[0].inflate()]
+        for fragment, chunk in zip(fragments, self.chunks[1:]):
+            parts.extend((fragment, chunk.inflate()))
+        return b''.join(parts)
+
+    def gzip(self, fragments):
+        """Поток gzip из готовых кусков и сжатых фрагментов и его
+        исходная длина."""
+        level = settings.COMPRESSION_GZIP_LEVEL
+        first = self.chunks[0]
+        parts = [GZIP_HEADER, first.deflated]
+        crc, length = first.crc, first.length
+        for fragment, chunk in zip(fragments, self.chunks[1:]):
+            parts.extend((deflate(fragment, level), chunk.deflated))
+            crc = crc32_combine(
+                zlib.crc32(fragment, crc), chunk.crc, chunk.length,
+                chunk.zeros_crc,
+            )
+            length += len(fragment) + chunk.length
+        parts.extend((FINAL_BLOCK, gzip_trailer(crc, length)))
+        return b''.join(parts), length
@@ -0,0 +1,31 @@
+"""Размер пачек для bulk_create и bulk_update.
+
+SQLite ограничивает число переменных в одном запросе
+(``max_query_params``, 999 в сборках старше 3.32), а не число строк.
+Каждая строка INSERT занимает по переменной на поле, а каждый объект
+bulk_update — по две на поле (``WHEN pk THEN значение``) и ещё одну
+в ``WHERE pk IN``. Если у базы лимита нет, пачка не ограничивается.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import AutoField
+
+
+def _batch_size(params_per_row, using):
+    limit = connections[using].features.max_query_params
+    if limit is None:
+        return None
+    return max(limit // params_per_row, 1)
+
+
+def insert_batch_size(model, using=DEFAULT_DB_ALIAS):
+    """Сколько строк model помещается в один INSERT."""
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not isinstance(field, AutoField)
+    ]
+    return _batch_size(len(fields), using)
+
+
+def update_batch_size(fields, using=DEFAULT_DB_ALIAS):
+    """Сколько объектов помещается в один UPDATE из bulk_update."""
+    return _batch_size(2 * len(fields) + 1, using)
@@ -0,0 +1,207 @@
+"""Поиск N+1: ленивых загрузок связанных объектов в цикле.
+
+Пока работает ``detect_lazy_loads``, каждый queryset, вернувший больше
+одного объекта, запоминается как пачка. Если у объектов одной пачки
+одно и то же связанное поле (``post.author``, ``user.counters``,
+``author.posts``) загружается отдельным запросом хотя бы дважды — это
+N+1. Место указывается по шаблону и строке, где было обращение, а вне
+шаблона — по строке кода.
+
+Дескрипторы Django подменяются один раз на процесс: при загрузке
+``LazyLoadMiddleware`` или при первом включении, под блокировкой. Пачки
+и загрузки хранятся в переменной потока, поэтому запросы в соседних
+потоках друг другу не мешают, а без активного поиска подмены только
+проверяют эту переменную.
+"""
+import itertools
+import logging
+import os
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+import django
+from django.db.models.fields import related_descriptors
+from django.db.models.query import ModelIterable, QuerySet
+from django.template.base import Node
+
+logger = logging.getLogger('core.lazyloads')
+
+MODES = ('log', 'raise')
+# Сколько ленивых загрузок одного поля в одной пачке считать N+1
+THRESHOLD = 2
+
+_local = threading.local()
+_install_lock = threading.Lock()
+_installed = False
+_batches = itertools.count(1)
+DJANGO_DIR = os.path.dirname(django.__file__)
+
+
+class LazyLoadError(Exception):
+    pass
+
+
+class Tracker:
+    """Пачки объектов и ленивые загрузки в пределах одного запроса."""
+
+    def __init__(self, mode):
+        self.mode = mode
+        # id(объекта) → (номер пачки, объект); объект держится, чтобы
+        # его id не достался новому
+        self.batches = {}
+        self.loads = Counter()
+        self.reported = []
+
+    def add_batch(self, objects):
+        batch = next(_batches)
+        for obj in objects:
+            self.batches[id(obj)] = (batch, obj)
+
+    def record(self, instance, field):
+        entry = self.batches.get(id(instance))
+        if entry is None or entry[1] is not instance:
+            return
+        key = (entry[0], type(instance).__name__, field)
+        self.loads[key] += 1
+        if self.loads[key] != THRESHOLD:
+            return
+        message = (
+            f'N+1: {type(instance).__name__}.{field} загружается '
+            f'отдельным запросом для каждого объекта; {location()}'
+        )
+        self.reported.append(message)
+        if self.mode == 'raise':
+            raise LazyLoadError(message)
+        logger.warning(message)
+
+
+def location():
+    """Шаблон и строка или строка кода, откуда пришло обращение."""
+    frame = sys._getframe(1)
+    code_line = None
+    while frame is not None:
+        code = frame.f_code
+        if code is Node.render_annotated.__code__:
+            node = frame.f_locals.get('self')
+            token = getattr(node, 'token', None)
+            origin = getattr(node, 'origin', None)
+            if token is not None and origin is not None:
+                name = origin.template_name or origin.name
+                return f'шаблон {name}, строка {token.lineno}'
+        if code_line is None and not (
+            code.co_filename.startswith(DJANGO_DIR)
+            or code.co_filename == __file__
+        ):
+            code_line = f'{code.co_filename}:{frame.f_lineno}'
+        frame = frame.f_back
+    return code_line or 'место неизвестно'
+
+
+def _tracker():
+    return getattr(_local, 'tracker', None)
+
+
+def _patch_fetch_all():
+    fetch_all = QuerySet._fetch_all
+
+    def _fetch_all(self):
+        fetched = self._result_cache is not None
+        fetch_all(self)
+        tracker = _tracker()
+        if (
+            tracker is not None
+            and not fetched
+            and self._iterable_class is ModelIterable
+            and len(self._result_cache) > 1
+        ):
+            tracker.add_batch(self._result_cache)
+
+    QuerySet._fetch_all = _fetch_all
+
+
+def _patch_forward():
+    forward = related_descriptors.ForwardManyToOneDescriptor
+    get_object = forward.get_object
+
+    def forward_get_object(self, instance):
+        tracker = _tracker()
+        if tracker is not None:
+            tracker.record(instance, self.field.name)
+        return get_object(self, instance)
+
+    forward.get_object = forward_get_object
+
+
+def _patch_reverse_one():
+    reverse_one = related_descriptors.ReverseOneToOneDescriptor
+    reverse_one_get = reverse_one.__get__
+
+    def reverse_one_to_one_get(self, instance, cls=None):
+        tracker = _tracker()
+        if (
+            tracker is not None
+            and instance is not None
+            and not self.related.is_cached(instance)
+        ):
+            tracker.record(instance, self.related.get_accessor_name())
+        return reverse_one_get(self, instance, cls)
+
+    reverse_one.__get__ = reverse_one_to_one_get
+
+
+def _patch_reverse_many():
+    reverse_many = related_descriptors.ReverseManyToOneDescriptor
+    reverse_many_get = reverse_many.__get__
+
+    def reverse_many_get_manager(self, instance, cls=None):
+        manager = reverse_many_get(self, instance, cls)
+        tracker = _tracker()
+        if tracker is not None and instance is not None:
+            cache_name = getattr(
+                manager, 'prefetch_cache_name', None
+            ) or self.field.remote_field.get_cache_name()
+            prefetched = getattr(instance, '_prefetched_objects_cache', {})
+            if cache_name not in prefetched:
+                tracker.record(instance, self.rel.get_accessor_name())
+        return manager
+
+    # ManyToManyDescriptor наследует __get__, поэтому подмена общая
+    reverse_many.__get__ = reverse_many_get_manager
+
+
+def install():
+    """Подменяет загрузку querysetов и связанных полей; один раз.
+
+    Потоки, пришедшие одновременно, ждут, пока подмена закончится, и
+    не подменяют повторно.
+    """
+    global _installed
+    if _installed:
+        return
+    with _install_lock:
+        if _installed:
+            return
+        _patch_fetch_all()
+        _patch_forward()
+        _patch_reverse_one()
+        _patch_reverse_many()
+        _installed = True
+
+
+@contextmanager
+def detect_lazy_loads(mode='raise'):
+    """Ищет N+1 внутри блока; mode — 'log' или 'raise'.
+
+    Возвращает Tracker, в reported которого собраны найденные места.
+    """
+    if mode not in MODES:
+        raise ValueError(f'Неизвестный режим поиска N+1: {mode}')
+    install()
+    previous = _tracker()
+    _local.tracker = tracker = Tracker(mode)
+    try:
+        yield tracker
+    finally:
+        _local.tracker = previous
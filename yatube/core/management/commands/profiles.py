@@ -0,0 +1,98 @@
+import io
+import pstats
+import tracemalloc
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import profiling
+
+SORT_KEYS = ('cumulative', 'tottime', 'calls')
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает сохранённые профили запросов; с именем профиля — самые '
+        'дорогие функции и места выделения памяти.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'name',
+            nargs='?',
+            help='Имя профиля из списка или latest.',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Сколько строк показать.',
+        )
+        parser.add_argument(
+            '--sort',
+            choices=SORT_KEYS,
+            default='cumulative',
+            help='Порядок функций в графе вызовов.',
+        )
+        parser.add_argument(
+            '--callers',
+            action='store_true',
+            help='Показать, откуда вызывались самые дорогие функции.',
+        )
+        parser.add_argument(
+            '--token',
+            action='store_true',
+            help='Выдать подписанный токен для заголовка X-Profile.',
+        )
+
+    def handle(self, *args, **options):
+        if options['token']:
+            minutes = settings.PROFILE_TOKEN_MAX_AGE / 60
+            self.stdout.write(profiling.make_token())
+            self.stderr.write(f'Токен действует {minutes:g} мин.')
+            return
+        summaries = profiling.list_profiles()
+        if not options['name']:
+            self.list(summaries)
+            return
+        name = options['name']
+        if name == 'latest':
+            if not summaries:
+                raise CommandError('Профилей нет.')
+            name = summaries[0]['name']
+        elif name not in {summary['name'] for summary in summaries}:
+            raise CommandError(f'Профиль {name} не найден.')
+        self.show(name, options)
+
+    def list(self, summaries):
+        if not summaries:
+            self.stdout.write(f'Профилей в {profiling.profile_dir()} нет.')
+            return
+        for summary in summaries:
+            created = datetime.fromtimestamp(summary['created'])
+            self.stdout.write(
+                f'{summary["name"]}  {created:%Y-%m-%d %H:%M:%S}  '
+                f'{summary["status"]}  {summary["duration"] * 1000:8.1f} мс  '
+                f'запросов {summary["queries"]}  '
+                f'память {summary["memory_peak"] / 1024:.0f} КиБ  '
+                f'{summary["method"]} {summary["path"]}'
+            )
+
+    def show(self, name, options):
+        calls, allocations = profiling.paths(name)
+        limit = options['limit']
+        self.stdout.write(f'Граф вызовов {name}:')
+        # OutputWrapper добавляет перевод строки к каждой записи, а pstats
+        # печатает строку по частям
+        report = io.StringIO()
+        stats = pstats.Stats(calls, stream=report)
+        stats.strip_dirs().sort_stats(options['sort'])
+        stats.print_stats(limit)
+        if options['callers']:
+            stats.print_callers(limit)
+        self.stdout.write(report.getvalue())
+        self.stdout.write(f'Выделения памяти {name}:')
+        snapshot = tracemalloc.Snapshot.load(allocations)
+        for statistic in snapshot.statistics('lineno')[:limit]:
+            self.stdout.write(str(statistic))
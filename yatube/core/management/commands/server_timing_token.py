@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.timing import make_token
+
+
+class Command(BaseCommand):
+    help = (
+        'Выдаёт подписанный токен для заголовка X-Server-Timing, который '
+        'включает заголовок Server-Timing в ответах.'
+    )
+
+    def handle(self, *args, **options):
+        hours = settings.SERVER_TIMING_TOKEN_MAX_AGE / 3600
+        self.stdout.write(make_token())
+        self.stderr.write(f'Токен действует {hours:g} ч.')
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.slowqueries import SCAN_TABLES, aggregate, read_log
+
+
+class Command(BaseCommand):
+    help = (
+        'Складывает журнал медленных запросов по нормализованному SQL и '
+        'отмечает полные просмотры таблиц постов, комментариев и подписок.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--log',
+            default=settings.SLOW_QUERY_LOG,
+            help='Журнал; ротированные копии читаются вместе с ним.',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Сколько запросов показать.',
+        )
+        parser.add_argument(
+            '--scans-only',
+            action='store_true',
+            help='Только запросы с полным просмотром таблиц.',
+        )
+
+    def handle(self, *args, **options):
+        summary = aggregate(read_log(options['log']))
+        scans = [group for group in summary if group['full_scans']]
+        if options['scans_only']:
+            summary = scans
+        if not summary:
+            self.stdout.write('Медленных запросов нет.')
+            return
+        for group in summary[:options['limit']]:
+            self.show(group)
+        if scans:
+            tables = sorted({
+                table for group in scans for table in group['full_scans']
+            })
+            self.stdout.write(self.style.WARNING(
+                f'Полный просмотр {", ".join(tables)} в {len(scans)} '
+                f'запросах; проверяемые таблицы: {", ".join(SCAN_TABLES)}.'
+            ))
+
+    def show(self, group):
+        header = (
+            f'{group["count"]} раз, всего {group["total_ms"]:.1f} мс, '
+            f'в среднем {group["mean_ms"]:.1f} мс, '
+            f'максимум {group["max_ms"]:.1f} мс'
+        )
+        if group['full_scans']:
+            header += self.style.ERROR(
+                f'  ПОЛНЫЙ ПРОСМОТР {", ".join(group["full_scans"])}'
+            )
+        self.stdout.write(header)
+        self.stdout.write(f'  {group["sql"]}')
+        example = group['example']
+        self.stdout.write(f'  параметры: {example["params"]}')
+        if group['views']:
+            self.stdout.write(f'  view: {", ".join(group["views"])}')
+        for line in example['stack'][:3]:
+            self.stdout.write(f'  из {line}')
+        for line in group['plan']:
+            self.stdout.write(f'  план: {line}')
+        self.stdout.write('')
@@ -0,0 +1,206 @@
+"""Метрики приложения в текстовом формате Prometheus.
+
+Счётчики и гистограммы копятся в памяти процесса под блокировкой, без
+обращений к диску на каждый запрос. Не чаще чем раз в
+``METRICS_FLUSH_INTERVAL`` секунд процесс атомарно переписывает свой
+файл ``<pid>.json`` в ``METRICS_DIR``. Страница метрик складывает файлы
+всех процессов, поэтому при нескольких воркерах видны общие суммы.
+Каталог стоит очищать при перезапуске приложения.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+# Гистограммы и верхние границы их корзин
+HISTOGRAMS = {
+    'yatube_request_duration_seconds': (
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+    ),
+    'yatube_db_queries_per_request': (1, 2, 5, 10, 20, 50, 100),
+    'yatube_image_upload_bytes': (
+        10 ** 4, 10 ** 5, 5 * 10 ** 5, 10 ** 6, 2 * 10 ** 6, 5 * 10 ** 6,
+        10 ** 7,
+    ),
+}
+HELP = {
+    'yatube_request_duration_seconds': 'Время обработки запроса по URL.',
+    'yatube_responses_total': 'Ответы по URL и коду статуса.',
+    'yatube_db_queries_total': 'Запросы к базе по URL.',
+    'yatube_db_queries_per_request': 'Запросов к базе за один запрос.',
+    'yatube_cache_requests_total': 'Обращения к кэшам: попадания и промахи.',
+    'yatube_cache_rebuilds_total': (
+        'Перестройки страниц лент по причине: нет, устарела, заранее.'
+    ),
+    'yatube_cache_coalesced_total': (
+        'Запросы, не перестраивавшие страницу, пока её строил другой.'
+    ),
+    'yatube_compression_input_bytes_total': (
+        'Байт до сжатия: в кэше страниц (cache) и в ответах (response).'
+    ),
+    'yatube_compression_output_bytes_total': (
+        'Байт после сжатия: в кэше страниц (cache) и в ответах (response).'
+    ),
+    'yatube_image_upload_bytes': 'Размер загруженных картинок постов.',
+}
+
+
+def _key(name, labels):
+    return json.dumps([name, sorted(labels.items())], ensure_ascii=False)
+
+
+class Registry:
+    """Значения метрик одного процесса."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.clear()
+
+    def clear(self):
+        self.counters = defaultdict(float)
+        # ключ → [число в каждой корзине и в +Inf, сумма]
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[_key(name, labels)] += value
+
+    def observe(self, name, value, **labels):
+        buckets = HISTOGRAMS[name]
+        key = _key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [
+                    [0] * (len(buckets) + 1), 0.0,
+                ]
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    break
+            else:
+                index = len(buckets)
+            histogram[0][index] += 1
+            histogram[1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': {
+                    key: [list(counts), total]
+                    for key, (counts, total) in self.histograms.items()
+                },
+            }
+
+    def flush(self, directory=None, name=None):
+        """Атомарно записывает значения процесса в его файл."""
+        directory = directory or metrics_dir()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, name or f'{os.getpid()}.json')
+        descriptor, temporary = tempfile.mkstemp(dir=directory)
+        with os.fdopen(descriptor, 'w') as output:
+            json.dump(self.snapshot(), output, ensure_ascii=False)
+        os.replace(temporary, path)
+        self.last_flush = time.monotonic()
+
+    def maybe_flush(self):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 1)
+        if time.monotonic() - self.last_flush >= interval:
+            self.flush()
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+
+
+def count_lookups(cache, hits, misses):
+    """Попадания и промахи пакетного чтения кэша cache."""
+    if hits:
+        inc('yatube_cache_requests_total', hits, cache=cache, result='hit')
+    if misses:
+        inc(
+            'yatube_cache_requests_total', misses, cache=cache,
+            result='miss',
+        )
+
+
+def metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None) or os.path.join(
+        tempfile.gettempdir(), 'yatube-metrics'
+    )
+
+
+def collect(directory=None):
+    """Сумма значений из файлов всех процессов."""
+    directory = directory or metrics_dir()
+    counters = defaultdict(float)
+    histograms = {}
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as source:
+                data = json.load(source)
+        except (OSError, ValueError):
+            # Файл удалили или переписывают прямо сейчас
+            continue
+        for key, value in data['counters'].items():
+            counters[key] += value
+        for key, (counts, total) in data['histograms'].items():
+            merged = histograms.setdefault(key, [[0] * len(counts), 0.0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+    return {'counters': counters, 'histograms': histograms}
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\').replace(
+            '"', r'\"'
+        ).replace('\n', r'\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _number(value):
+    return repr(int(value)) if float(value).is_integer() else repr(value)
+
+
+def render(data):
+    """Текст страницы метрик в формате Prometheus 0.0.4."""
+    series = defaultdict(list)
+    for key, value in sorted(data['counters'].items()):
+        name, pairs = json.loads(key)
+        series[name].append(f'{name}{_labels(pairs)} {_number(value)}')
+    for key, (counts, total) in sorted(data['histograms'].items()):
+        name, pairs = json.loads(key)
+        cumulative = 0
+        bounds = [repr(b) for b in HISTOGRAMS.get(name, ())] + ['+Inf']
+        for bound, count in zip(bounds, counts):
+            cumulative += count
+            series[name].append(
+                f'{name}_bucket{_labels(pairs + [["le", bound]])} '
+                f'{cumulative}'
+            )
+        series[name].append(f'{name}_sum{_labels(pairs)} {_number(total)}')
+        series[name].append(f'{name}_count{_labels(pairs)} {cumulative}')
+    lines = []
+    for name in sorted(series):
+        kind = 'histogram' if name in HISTOGRAMS else 'counter'
+        lines.append(f'# HELP {name} {HELP.get(name, name)}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(series[name])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,222 @@
+import logging
+import time
+
+from django.conf import settings
+
+from . import compression, lazyloads, metrics, profiling, timing
+from .queries import QueryBudgetExceeded, record_queries
+from .slowqueries import log_slow_queries
+
+logger = logging.getLogger('core.queries')
+
+
+class QueryCountMiddleware:
+    """Считает запросы к базе, их время и повторы за каждый запрос.
+
+    Итог пишется в лог ``core.queries`` и, если включён
+    ``QUERY_COUNT_HEADERS``, в заголовки ответа. Превышение бюджета
+    view из ``query_budget`` — предупреждение в логе или исключение при
+    ``QUERY_BUDGET_STRICT``. Стоит до ``SessionMiddleware`` и
+    ``AuthenticationMiddleware``, чтобы учесть запросы сессии и
+    пользователя. Middleware выше него к базе не обращаются и берут
+    итог из ``request.queries`` после ответа.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.query_budget = None
+        with record_queries() as recorder:
+            request.queries = recorder
+            response = self.get_response(request)
+        milliseconds = recorder.duration * 1000
+        logger.debug(
+            '%s %s: запросов %d за %.1f мс, повторов %d',
+            request.method, request.path, recorder.count, milliseconds,
+            recorder.duplicates,
+        )
+        if getattr(settings, 'QUERY_COUNT_HEADERS', False):
+            response['X-Query-Count'] = recorder.count
+            response['X-Query-Time'] = f'{milliseconds:.1f}'
+            response['X-Query-Duplicates'] = recorder.duplicates
+        budget = request.query_budget
+        if budget is not None and recorder.count > budget:
+            message = (
+                f'{request.method} {request.path}: {recorder.count} '
+                f'запросов при бюджете {budget}'
+            )
+            repeated = recorder.most_repeated()
+            if repeated:
+                message += (
+                    f'; {repeated[1]} раз выполнен запрос {repeated[0]}'
+                )
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
+
+
+class SlowQueryMiddleware:
+    """Пишет в журнал ``core.slowqueries`` запросы к базе дольше
+    ``SLOW_QUERY_THRESHOLD_MS`` вместе с view и планом выполнения."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with log_slow_queries() as slow_logger:
+            request.slow_queries = slow_logger
+            return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.slow_queries.view = (
+            f'{view_func.__module__}.{view_func.__name__}'
+        )
+
+
+class LazyLoadMiddleware:
+    """Ищет N+1 в view и шаблонах при включённом ``LAZY_LOAD_CHECK``.
+
+    Режим 'log' пишет найденное в лог ``core.lazyloads``, 'raise'
+    поднимает ``LazyLoadError`` с именем шаблона и строкой.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if getattr(settings, 'LAZY_LOAD_CHECK', None):
+            # Подмена до первого запроса, а не в потоке запроса
+            lazyloads.install()
+
+    def __call__(self, request):
+        mode = getattr(settings, 'LAZY_LOAD_CHECK', None)
+        if not mode:
+            return self.get_response(request)
+        with lazyloads.detect_lazy_loads(mode):
+            return self.get_response(request)
+
+
+class MetricsMiddleware:
+    """Время ответа, коды статуса и число запросов к базе по URL.
+
+    Стоит первым в MIDDLEWARE; число запросов берёт у
+    ``QueryCountMiddleware``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        metrics.observe(
+            'yatube_request_duration_seconds', elapsed, view=view
+        )
+        metrics.inc(
+            'yatube_responses_total', view=view,
+            status=str(response.status_code),
+        )
+        queries = getattr(request, 'queries', None)
+        if queries is not None:
+            metrics.inc('yatube_db_queries_total', queries.count, view=view)
+            metrics.observe(
+                'yatube_db_queries_per_request', queries.count, view=view
+            )
+        metrics.registry.maybe_flush()
+        return response
+
+
+class ServerTimingMiddleware:
+    """Заголовок Server-Timing с фазами db, template, thumbnail и cache.
+
+    Замер включается подписанным заголовком X-Server-Timing (токен
+    выдаёт команда server_timing_token) или cookie, которую получает
+    сотрудник. Стоит после AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Подмена до первого запроса, а не в потоке запроса
+        timing.install()
+
+    def __call__(self, request):
+        if not timing.is_enabled(request):
+            response = self.get_response(request)
+            if timing.is_staff(request):
+                response.set_cookie(
+                    settings.SERVER_TIMING_COOKIE_NAME,
+                    timing.make_token(),
+                    max_age=settings.SERVER_TIMING_TOKEN_MAX_AGE,
+                    httponly=True,
+                    samesite='Lax',
+                )
+            return response
+        recorder = getattr(request, 'queries', None)
+        before = (recorder.count, recorder.duration) if recorder else None
+        start = time.perf_counter()
+        with timing.measure() as timings:
+            response = self.get_response(request)
+        queries = None
+        if recorder is not None:
+            queries = (
+                recorder.count - before[0], recorder.duration - before[1]
+            )
+        response['Server-Timing'] = timings.header(
+            time.perf_counter() - start, queries
+        )
+        return response
+
+
+class ProfilingMiddleware:
+    """Профилирует запрос под cProfile и tracemalloc по требованию.
+
+    Включается подписанным заголовком X-Profile или выборкой
+    ``PROFILE_SAMPLE_RATE``; имя профиля возвращается в заголовке
+    X-Profile-Id. Стоит сразу после ``MetricsMiddleware``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling.should_profile(request):
+            return self.get_response(request)
+        with profiling.profile() as result:
+            response = self.get_response(request)
+        queries = getattr(request, 'queries', None)
+        try:
+            name = result.save({
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'queries': queries.count if queries is not None else None,
+                'created': time.time(),
+            })
+        except OSError:
+            profiling.logger.exception('Не удалось сохранить профиль запроса')
+            return response
+        response['X-Profile-Id'] = name
+        return response
+
+
+class CompressionMiddleware:
+    """Сжимает ответы gzip или brotli по Accept-Encoding.
+
+    Ответы страниц из кэша лент уже сжаты и проходят без изменений.
+    Стоит после ``ProfilingMiddleware``, чтобы время сжатия попадало в
+    метрики и профиль.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return compression.compress_response(
+            request, self.get_response(request)
+        )
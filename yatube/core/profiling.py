@@ -0,0 +1,185 @@
+"""Профилирование отдельных запросов на работающем сервере.
+
+Запрос профилируется, если в нём есть подписанный заголовок X-Profile
+(токен выдаёт ``manage.py profiles --token``) или он попал в выборку
+``PROFILE_SAMPLE_RATE``. Запрос выполняется под cProfile и tracemalloc;
+граф вызовов (``.prof``, формат pstats), снимок памяти (``.alloc``) и
+сводка (``.json``) пишутся в ``PROFILE_DIR``. Хранятся последние
+``PROFILE_KEEP`` профилей, более старые удаляются.
+
+tracemalloc общий на процесс: при одновременных профилях снимок памяти
+включает выделения соседних потоков.
+"""
+import cProfile
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.conf import settings
+from django.core import signing
+
+logger = logging.getLogger('core.profiling')
+
+TOKEN_SALT = 'core.profiling'
+TOKEN_VALUE = 'profile'
+# Выделения самого tracemalloc и импорта в снимок не попадают
+ALLOCATION_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+_lock = threading.Lock()
+_active = 0
+_owns_tracemalloc = False
+
+
+def profile_dir():
+    return getattr(settings, 'PROFILE_DIR', None) or os.path.join(
+        tempfile.gettempdir(), 'yatube-profiles'
+    )
+
+
+def make_token():
+    """Подписанное значение заголовка X-Profile."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(TOKEN_VALUE)
+
+
+def check_token(token):
+    try:
+        value = signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            token, max_age=settings.PROFILE_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return False
+    return value == TOKEN_VALUE
+
+
+def should_profile(request):
+    """Подписанный заголовок или попадание в выборку."""
+    token = request.META.get('HTTP_X_PROFILE')
+    if token:
+        return check_token(token)
+    rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+    return bool(rate) and random.random() < rate
+
+
+def _start_tracemalloc():
+    global _active, _owns_tracemalloc
+    with _lock:
+        if not _active and not tracemalloc.is_tracing():
+            tracemalloc.start(settings.PROFILE_TRACEMALLOC_FRAMES)
+            _owns_tracemalloc = True
+        _active += 1
+
+
+def _stop_tracemalloc():
+    global _active, _owns_tracemalloc
+    with _lock:
+        _active -= 1
+        if not _active and _owns_tracemalloc:
+            tracemalloc.stop()
+            _owns_tracemalloc = False
+
+
+class Profile:
+    """Результат профилирования одного запроса."""
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.snapshot = None
+        self.duration = None
+        self.memory = None
+
+    def save(self, summary, directory=None):
+        """Пишет дампы в кольцо и возвращает имя профиля."""
+        directory = directory or profile_dir()
+        os.makedirs(directory, exist_ok=True)
+        name = '{}-{}'.format(
+            datetime.now().strftime('%Y%m%d-%H%M%S-%f'), os.getpid()
+        )
+        base = os.path.join(directory, name)
+        self.profiler.dump_stats(base + '.prof')
+        self.snapshot.dump(base + '.alloc')
+        summary = dict(
+            summary,
+            name=name,
+            duration=self.duration,
+            memory_current=self.memory[0],
+            memory_peak=self.memory[1],
+        )
+        # Сводка пишется последней: по ней list() находит готовые профили
+        descriptor, temporary = tempfile.mkstemp(dir=directory)
+        with os.fdopen(descriptor, 'w') as output:
+            json.dump(summary, output, ensure_ascii=False)
+        os.replace(temporary, base + '.json')
+        prune(directory)
+        return name
+
+
+@contextmanager
+def profile():
+    """Выполняет блок под cProfile и tracemalloc; возвращает Profile."""
+    result = Profile()
+    _start_tracemalloc()
+    start = time.perf_counter()
+    try:
+        result.profiler.enable()
+        try:
+            yield result
+        finally:
+            result.profiler.disable()
+            result.duration = time.perf_counter() - start
+            result.memory = tracemalloc.get_traced_memory()
+            result.snapshot = tracemalloc.take_snapshot().filter_traces(
+                ALLOCATION_FILTERS
+            )
+    finally:
+        _stop_tracemalloc()
+
+
+def list_profiles(directory=None):
+    """Сводки сохранённых профилей, от новых к старым."""
+    directory = directory or profile_dir()
+    try:
+        names = sorted(os.listdir(directory), reverse=True)
+    except FileNotFoundError:
+        return []
+    summaries = []
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as source:
+                summaries.append(json.load(source))
+        except (OSError, ValueError):
+            # Профиль удалили из кольца прямо сейчас
+            continue
+    return summaries
+
+
+def prune(directory=None, keep=None):
+    """Оставляет в каталоге только последние keep профилей."""
+    directory = directory or profile_dir()
+    if keep is None:
+        keep = settings.PROFILE_KEEP
+    for summary in list_profiles(directory)[keep:]:
+        for extension in ('.json', '.prof', '.alloc'):
+            try:
+                os.remove(os.path.join(directory, summary['name'] + extension))
+            except FileNotFoundError:
+                pass
+
+
+def paths(name, directory=None):
+    """Пути к графу вызовов и снимку памяти профиля name."""
+    base = os.path.join(directory or profile_dir(), name)
+    return base + '.prof', base + '.alloc'
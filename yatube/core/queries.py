@@ -0,0 +1,70 @@
+"""Учёт запросов к базе за время обработки запроса.
+
+``QueryRecorder`` подключается к соединениям через
+``connection.execute_wrapper`` и поэтому работает и без DEBUG. View
+объявляет допустимое число запросов декоратором ``query_budget``;
+превышение пишется в лог, а при ``QUERY_BUDGET_STRICT`` (в тестах)
+поднимает ``QueryBudgetExceeded``.
+"""
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryRecorder:
+    """Считает запросы, их суммарное время и повторы."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql, repr(params)] += 1
+
+    @property
+    def duplicates(self):
+        """Сколько запросов повторили уже выполненные с теми же
+        параметрами."""
+        return sum(count - 1 for count in self.statements.values())
+
+    def most_repeated(self):
+        """Самый частый повтор: (SQL, число выполнений) или None."""
+        if not self.duplicates:
+            return None
+        (sql, _), count = self.statements.most_common(1)[0]
+        return sql, count
+
+
+@contextmanager
+def record_queries():
+    """Записывает запросы ко всем базам внутри блока."""
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+def query_budget(limit):
+    """Объявляет, что view обходится не больше чем limit запросами.
+
+    Бюджет считает весь запрос, вместе с сессией и пользователем, при
+    пустом кэше.
+    """
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
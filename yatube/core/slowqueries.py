@@ -0,0 +1,188 @@
+"""Журнал медленных запросов к базе с планами выполнения.
+
+Запрос дольше ``SLOW_QUERY_THRESHOLD_MS`` пишется в лог
+``core.slowqueries`` одной строкой JSON: нормализованный SQL, параметры,
+view, стек вызова и ``EXPLAIN QUERY PLAN``. В настройках лог направлен в
+``RotatingFileHandler``; команда ``slow_queries`` складывает записи по
+нормализованному SQL и отмечает полные просмотры больших таблиц.
+
+План снимается через курсор без обёрток Django, поэтому EXPLAIN не
+попадает ни в счётчик запросов, ни в сам журнал.
+"""
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+import django
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('core.slowqueries')
+
+# Таблицы, полный просмотр которых отмечает команда slow_queries
+SCAN_TABLES = ('posts_post', 'posts_comment', 'posts_follow')
+STACK_DEPTH = 10
+# Запросы, план которых снимается: EXPLAIN их не выполняет
+EXPLAINED = ('SELECT', 'UPDATE', 'DELETE')
+DJANGO_DIR = os.path.dirname(django.__file__)
+# Обёртки execute из core не интересны в стеке
+CORE_DIR = os.path.dirname(__file__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACES = re.compile(r'\s+')
+# «SCAN posts_post» или «SCAN TABLE posts_post» без индекса
+_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?"?(\w+)"?(?!.*\bUSING\b)')
+
+
+def normalize(sql):
+    """SQL без литералов и с одинаковыми списками IN."""
+    sql = _STRING.sub('?', sql.replace('%s', '?'))
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def full_scans(plan, tables=SCAN_TABLES):
+    """Таблицы из tables, которые план читает целиком."""
+    scanned = []
+    for line in plan:
+        match = _FULL_SCAN.match(line)
+        if match and match.group(1) in tables:
+            scanned.append(match.group(1))
+    return scanned
+
+
+def explain(connection, sql, params):
+    """Строки плана SELECT, UPDATE и DELETE; пустой список для остальных."""
+    if not sql.lstrip().upper().startswith(EXPLAINED):
+        return []
+    prefix = (
+        'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    )
+    cursor = connection.create_cursor()
+    try:
+        cursor.execute(prefix + sql, params)
+        rows = cursor.fetchall()
+    except Exception as error:
+        return [f'EXPLAIN не удался: {error}']
+    finally:
+        cursor.close()
+    # В SQLite деталь плана — последний столбец строки
+    return [str(row[-1]) for row in rows]
+
+
+def call_stack():
+    """Строки кода проекта, из которых пришёл запрос."""
+    lines = []
+    frame = sys._getframe(1)
+    while frame is not None and len(lines) < STACK_DEPTH:
+        filename = frame.f_code.co_filename
+        if not (
+            filename.startswith(DJANGO_DIR)
+            or filename.startswith(CORE_DIR)
+            or 'site-packages' in filename
+        ):
+            lines.append(
+                f'{filename}:{frame.f_lineno} в {frame.f_code.co_name}'
+            )
+        frame = frame.f_back
+    return lines
+
+
+class SlowQueryLogger:
+    """Обёртка execute, которая пишет в журнал медленные запросы.
+
+    Атрибут view задаётся, когда становится известен вызываемый view.
+    """
+
+    def __init__(self, view=None):
+        self.view = view
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            if duration * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS:
+                self.log(context['connection'], sql, params, many, duration)
+
+    def log(self, connection, sql, params, many, duration):
+        record = {
+            'time': time.time(),
+            'duration_ms': round(duration * 1000, 3),
+            'database': connection.alias,
+            'sql': normalize(sql),
+            'params': repr(params),
+            'view': self.view,
+            'stack': call_stack(),
+            'plan': [] if many else explain(connection, sql, params),
+        }
+        logger.warning(json.dumps(record, ensure_ascii=False))
+
+
+@contextmanager
+def log_slow_queries(view=None):
+    """Пишет в журнал медленные запросы ко всем базам внутри блока."""
+    slow_logger = SlowQueryLogger(view)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(slow_logger))
+        yield slow_logger
+
+
+def read_log(path):
+    """Записи журнала и его ротированных копий, от старых к новым."""
+    paths = [path]
+    index = 1
+    while os.path.exists(f'{path}.{index}'):
+        paths.append(f'{path}.{index}')
+        index += 1
+    records = []
+    for current in reversed(paths):
+        try:
+            with open(current, encoding='utf-8') as source:
+                lines = source.readlines()
+        except FileNotFoundError:
+            continue
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def aggregate(records, tables=SCAN_TABLES):
+    """Сводка по нормализованному SQL, от самого затратного."""
+    groups = defaultdict(lambda: {
+        'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'views': set(),
+        'plan': [], 'full_scans': [], 'example': None,
+    })
+    for record in records:
+        group = groups[record['sql']]
+        group['count'] += 1
+        group['total_ms'] += record['duration_ms']
+        if record['duration_ms'] >= group['max_ms']:
+            group['max_ms'] = record['duration_ms']
+            group['example'] = record
+        if record.get('view'):
+            group['views'].add(record['view'])
+        if record.get('plan'):
+            group['plan'] = record['plan']
+            group['full_scans'] = full_scans(record['plan'], tables)
+    summary = []
+    for sql, group in groups.items():
+        group['sql'] = sql
+        group['mean_ms'] = group['total_ms'] / group['count']
+        group['views'] = sorted(group['views'])
+        summary.append(group)
+    summary.sort(key=lambda group: group['total_ms'], reverse=True)
+    return summary
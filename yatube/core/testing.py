@@ -0,0 +1,80 @@
+"""Окружение тестов: свой каталог для общего кэша, строгие бюджеты
+запросов и обработчики on_commit.
+
+Общий кэш (core.cache) переживает перезапуск и виден всем процессам,
+поэтому без этого тесты читали бы страницы, закэшированные сервером
+разработки или прошлым прогоном на другой базе. Превышение бюджета
+запросов в тестах — ошибка, а не запись в лог.
+"""
+import copy
+import os
+import shutil
+import tempfile
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+@contextmanager
+def isolated_caches():
+    """Переносит файлы кэшей и шину во временный каталог."""
+    directory = tempfile.mkdtemp(prefix='yatube-test-cache-')
+    caches = copy.deepcopy(settings.CACHES)
+    for alias, params in caches.items():
+        if 'LOCATION' in params and params['BACKEND'].startswith('core.'):
+            params['LOCATION'] = os.path.join(directory, alias)
+    try:
+        with override_settings(CACHES=caches):
+            yield directory
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+@contextmanager
+def test_environment():
+    """Отдельные кэши и строгие бюджеты запросов на весь прогон."""
+    with ExitStack() as stack:
+        stack.enter_context(isolated_caches())
+        stack.enter_context(override_settings(QUERY_BUDGET_STRICT=True))
+        yield
+
+
+@contextmanager
+def capture_on_commit_callbacks(using=DEFAULT_DB_ALIAS, execute=False):
+    """Обработчики on_commit, зарегистрированные в блоке.
+
+    TestCase не фиксирует транзакцию, и обработчики не срабатывают;
+    execute=True выполняет их на выходе из блока, как после фиксации.
+    Это TestCase.captureOnCommitCallbacks из Django 3.2.
+    """
+    callbacks = []
+    connection = connections[using]
+    start = len(connection.run_on_commit)
+    try:
+        yield callbacks
+    finally:
+        while True:
+            added = connection.run_on_commit[start:]
+            start = len(connection.run_on_commit)
+            if not added:
+                break
+            callbacks.extend(func for sids, func in added)
+            if not execute:
+                break
+            # Обработчики могут зарегистрировать новые
+            for _, func in added:
+                func()
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._environment = test_environment()
+        self._environment.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self._environment.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,166 @@
+"""Разбивка времени запроса по фазам для заголовка Server-Timing.
+
+Фазы: db (запросы к базе), template (отрисовка шаблонов), thumbnail
+(поиск и построение миниатюр), cache (обращения к кэшам) и total.
+Фазы могут пересекаться: отрисовка шаблона включает миниатюры и кэш,
+поэтому их сумма не обязана совпадать с total. Вложенные вызовы одной
+фазы (шаблон внутри шаблона) учитываются один раз.
+
+Шаблоны, кэши и sorl подменяются один раз на процесс: при загрузке
+``ServerTimingMiddleware`` или при первом замере, под блокировкой.
+Замер хранится в переменной потока, поэтому запросы в соседних потоках
+друг другу не мешают, а без активного замера обёртки только проверяют
+эту переменную.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core import signing
+
+PHASES = ('db', 'template', 'thumbnail', 'cache')
+CACHE_METHODS = (
+    'add', 'get', 'set', 'get_many', 'set_many', 'delete', 'delete_many',
+    'get_or_set', 'has_key', 'incr', 'decr', 'touch',
+)
+TOKEN_SALT = 'core.timing'
+TOKEN_VALUE = 'server-timing'
+
+_local = threading.local()
+_install_lock = threading.Lock()
+_installed = False
+
+
+class Timings:
+    """Длительности фаз одного запроса в секундах."""
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.depth = defaultdict(int)
+        self.counts = defaultdict(int)
+
+    def header(self, total, queries=None):
+        """Значение Server-Timing: фазы и total в миллисекундах."""
+        durations = dict(self.durations)
+        if queries is not None:
+            durations['db'] = queries[1]
+            self.counts['db'] = queries[0]
+        parts = []
+        for name in PHASES:
+            if name not in durations:
+                continue
+            part = f'{name};dur={durations[name] * 1000:.1f}'
+            if self.counts[name]:
+                part += f';desc="{self.counts[name]}"'
+            parts.append(part)
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+
+@contextmanager
+def phase(name):
+    """Засчитывает время блока в фазу name текущего замера."""
+    timings = getattr(_local, 'timings', None)
+    if timings is None or timings.depth[name]:
+        # Замера нет или это вложенный вызов той же фазы
+        yield
+        return
+    timings.depth[name] += 1
+    timings.counts[name] += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.durations[name] += time.perf_counter() - start
+        timings.depth[name] -= 1
+
+
+def timed(name, function):
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if getattr(_local, 'timings', None) is None:
+            return function(*args, **kwargs)
+        with phase(name):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def install():
+    """Оборачивает отрисовку шаблонов, кэши и sorl; один раз."""
+    global _installed
+    if _installed:
+        return
+    with _install_lock:
+        if not _installed:
+            _install()
+            _installed = True
+
+
+def _install():
+    from django.core.cache import caches
+    from django.template.base import Template
+    from sorl.thumbnail.base import ThumbnailBackend
+
+    Template.render = timed('template', Template.render)
+    ThumbnailBackend.get_thumbnail = timed(
+        'thumbnail', ThumbnailBackend.get_thumbnail
+    )
+    patched = set()
+    for alias in settings.CACHES:
+        backend = type(caches[alias])
+        if backend in patched:
+            continue
+        patched.add(backend)
+        for method in CACHE_METHODS:
+            if hasattr(backend, method):
+                setattr(
+                    backend, method, timed('cache', getattr(backend, method))
+                )
+
+
+@contextmanager
+def measure():
+    """Собирает фазы внутри блока; возвращает Timings."""
+    install()
+    previous = getattr(_local, 'timings', None)
+    _local.timings = timings = Timings()
+    try:
+        yield timings
+    finally:
+        _local.timings = previous
+
+
+def make_token():
+    """Подписанное значение заголовка X-Server-Timing."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(TOKEN_VALUE)
+
+
+def check_token(token):
+    try:
+        value = signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            token, max_age=settings.SERVER_TIMING_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return False
+    return value == TOKEN_VALUE
+
+
+def is_enabled(request):
+    """Нужен ли замер: подписанный заголовок или cookie сотрудника."""
+    token = request.META.get('HTTP_X_SERVER_TIMING') or request.COOKIES.get(
+        settings.SERVER_TIMING_COOKIE_NAME
+    )
+    return bool(token) and check_token(token)
+
+
+def is_staff(request):
+    """Сотрудник ли пользователь, если его уже загрузил view.
+
+    Пользователь не загружается специально: страницы из кэша обходятся
+    без запросов к базе.
+    """
+    user = getattr(request, '_cached_user', None)
+    return bool(user is not None and user.is_staff)
@@ -1,5 +1,9 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
 
+from . import metrics as app_metrics
+
 
 def page_not_found(request, exception):
     # Переменная exception содержит отладочную информацию;
@@ -21,3 +25,14 @@ def permission_denied(request, exception):
 def csrf_failure(request, reason=''):
     template = 'core/403csrf.html'
     return render(request, template)
+
+
+def metrics(request):
+    """Метрики всех процессов приложения в формате Prometheus."""
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    app_metrics.registry.flush()
+    return HttpResponse(
+        app_metrics.render(app_metrics.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Comment, Follow, Group, Post
+from .search import filter_comments, filter_posts
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -19,6 +20,12 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Ищем по поисковому индексу, а не LIKE по всей таблице
+        if not search_term:
+            return queryset, False
+        return filter_posts(queryset, search_term), False
+
 
 class CommentAdmin(admin.ModelAdmin):
     list_display = (
@@ -32,6 +39,11 @@ class CommentAdmin(admin.ModelAdmin):
     list_filter = ("created",)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return filter_comments(queryset, search_term), False
+
 
 class FollowAdmin(admin.ModelAdmin):
     list_display = (
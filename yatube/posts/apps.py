@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PostsConfig(AppConfig):
     name = 'posts'
     verbose_name = 'Управление постами'
+
+    def ready(self):
+        # Подключаем обработчики сигналов моделей
+        from . import signals  # noqa: F401
@@ -0,0 +1,158 @@
+"""Замеры времени ответа и числа запросов к базе по страницам.
+
+Страницы запрашиваются тестовым клиентом Django внутри процесса, без
+сети, поэтому в замер попадают middleware, view и шаблоны. Результат —
+словарь, пригодный для записи в JSON и сравнения с прошлым прогоном.
+"""
+import math
+import platform
+import time
+
+import django
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Comment, Follow, Group, Post, User
+
+PERCENTILES = (50, 95, 99)
+# Хост из ALLOWED_HOSTS: тестовый клиент по умолчанию шлёт testserver
+HOST = 'localhost'
+
+
+def percentile(values, share):
+    """Перцентиль по ближайшему рангу; values отсортированы."""
+    if not values:
+        return None
+    rank = max(math.ceil(share / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def summarize(timings, queries, errors):
+    """Сводка по одной странице: перцентили времени и число запросов."""
+    timings = sorted(timings)
+    result = {
+        'requests': len(timings),
+        'errors': errors,
+        'mean_ms': round(sum(timings) / len(timings), 3) if timings else None,
+    }
+    for share in PERCENTILES:
+        value = percentile(timings, share)
+        result[f'p{share}_ms'] = round(value, 3) if value is not None else None
+    result['queries'] = {
+        'min': min(queries) if queries else None,
+        'max': max(queries) if queries else None,
+        'mean': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+    return result
+
+
+def targets():
+    """Страницы для замера: имя, адрес и пользователь для входа.
+
+    Берутся самый комментируемый пост с группой, его автор и
+    пользователь с наибольшим числом подписок, чтобы страницы были
+    не пустыми.
+    """
+    post = Post.objects.filter(group__isnull=False).select_related(
+        'author', 'group'
+    ).order_by('-comments_count', '-pk').first()
+    if post is None:
+        return []
+    result = [
+        ('posts:index', reverse('posts:index'), None),
+        (
+            'posts:group_list',
+            reverse('posts:group_list', args=[post.group.slug]),
+            None,
+        ),
+        (
+            'posts:profile',
+            reverse('posts:profile', args=[post.author.username]),
+            None,
+        ),
+        (
+            'posts:post_detail',
+            reverse('posts:post_detail', args=[post.pk]),
+            None,
+        ),
+    ]
+    follower = User.objects.annotate(
+        follows=Count('follower')
+    ).filter(follows__gt=0).order_by('-follows', 'pk').first()
+    if follower is not None:
+        result.append(
+            ('posts:follow_index', reverse('posts:follow_index'), follower)
+        )
+    return result
+
+
+def measure(url, user, requests, cold=False):
+    """Запрашивает url requests раз и возвращает сводку.
+
+    Без cold первый запрос прогревает кэши и в замер не входит; с cold
+    кэш очищается перед каждым запросом.
+    """
+    client = Client(HTTP_HOST=HOST)
+    if user is not None:
+        client.force_login(user)
+    if not cold:
+        client.get(url)
+    timings = []
+    queries = []
+    errors = 0
+    for _ in range(requests):
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(len(captured))
+        if response.status_code != 200:
+            errors += 1
+    return summarize(timings, queries, errors)
+
+
+def run(requests, cold=False):
+    """Замеряет все страницы из targets() и описывает набор данных."""
+    return {
+        'meta': {
+            'created': timezone.now().isoformat(),
+            'requests': requests,
+            'cold': cold,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'dataset': {
+                'users': User.objects.count(),
+                'groups': Group.objects.count(),
+                'posts': Post.objects.count(),
+                'comments': Comment.objects.count(),
+                'follows': Follow.objects.count(),
+            },
+        },
+        'views': {
+            name: measure(url, user, requests, cold)
+            for name, url, user in targets()
+        },
+    }
+
+
+def regressions(result, baseline, max_ratio, metric='p95_ms'):
+    """Страницы, где metric вырос больше чем в max_ratio раз.
+
+    Возвращает список (имя, было, стало).
+    """
+    found = []
+    for name, current in result['views'].items():
+        previous = baseline.get('views', {}).get(name)
+        if not previous or not previous.get(metric):
+            continue
+        if current[metric] > previous[metric] * max_ratio:
+            found.append((name, previous[metric], current[metric]))
+    return found
@@ -0,0 +1,301 @@
+"""Кэш страниц лент с версионными ключами.
+
+У каждой ленты (главная, группа, профиль) есть номер версии в кэше,
+ключ которого — путь ленты. Версия хранится вместе с кэшированной
+страницей, поэтому сигналы об изменении постов, групп и комментариев
+сбрасывают кэш ленты одним ``incr`` и страницы можно хранить долго.
+
+Страницу устаревшей версии или с истёкшим сроком перестраивает один
+запрос (блокировка через ``cache.add``), остальные тем временем получают
+прежнюю страницу. Незадолго до истечения срока страница с некоторой
+вероятностью перестраивается заранее (XFetch): чем дольше она строится,
+тем раньше.
+
+Страница одна для всех посетителей: фрагменты с данными пользователя
+(шапка, вкладки подписок, кнопка подписки) тег ``hole`` заменяет
+метками, а ``fill_holes`` рендерит их для каждого запроса. Текст постов
+экранируется, поэтому метку в страницу может поставить только тег.
+
+В кэше страница хранится сжатой (``core.compression.CompressedResponse``):
+клиенту, принимающему gzip, уходят готовые сжатые куски, и сжимаются
+только фрагменты.
+"""
+import hashlib
+import logging
+import math
+import os
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from urllib.parse import parse_qsl, unquote, urlencode
+
+from core import metrics
+from core.compression import CompressedResponse
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.urls import resolve
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'feed_version:{}'
+PAGE_KEY = '{prefix}.{url}'
+LOCK_KEY = '{}.lock'
+HOLE = '<!--hole:{name}?{params}-->'
+HOLE_PATTERN = re.compile(rb'<!--hole:([^?>]+)\?([^>]*)-->')
+# Как часто проверять, не перестроил ли страницу другой запрос
+WAIT_STEP = 0.05
+
+_rewarm_executor = None
+
+
+def version_key(path):
+    """Ключ версии ленты.
+
+    reverse() отдаёт путь в процентной кодировке, а request.path —
+    раскодированным; оба приводятся к раскодированному виду.
+    """
+    return VERSION_KEY.format(unquote(path))
+
+
+def feed_version(path):
+    """Текущая версия ленты; новая версия начинается с текущего времени.
+
+    Так версия, потерянная при вытеснении из кэша, не совпадёт со
+    старой и не вернёт устаревшие страницы.
+    """
+    key = version_key(path)
+    version = cache.get(key)
+    if version is None:
+        version = int(time.time() * 1000)
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_versions(paths):
+    for path in paths:
+        try:
+            cache.incr(version_key(path))
+        except ValueError:
+            # Версии нет — страниц этой ленты в кэше тоже нет
+            pass
+    schedule_rewarm(paths)
+
+
+def invalidate_feeds(paths):
+    """Сбрасывает кэш лент с путями paths после фиксации транзакции.
+
+    Иначе запрос, прочитавший новую версию до фиксации, построил бы
+    страницу из прежних строк и сохранил её под новой версией.
+    """
+    paths = list(paths)
+    transaction.on_commit(lambda: bump_versions(paths))
+
+
+def page_key(request, key_prefix):
+    """Ключ страницы: URL со строкой запроса.
+
+    Версии ленты в ключе нет: она хранится вместе со страницей, чтобы
+    прежнюю страницу можно было отдать, пока строится новая.
+    """
+    url = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return PAGE_KEY.format(prefix=key_prefix, url=url)
+
+
+def hole_marker(name, params):
+    """Метка фрагмента name с параметрами-строками params."""
+    return HOLE.format(name=name, params=urlencode(sorted(params.items())))
+
+
+def render_hole(request, name, params, charset):
+    """Фрагмент по группам метки, отрендеренный для request."""
+    fragment = render_to_string(
+        name.decode(), dict(parse_qsl(params.decode())), request=request
+    )
+    return fragment.encode(charset)
+
+
+def fill_holes(response, request):
+    """Ответ не из кэша с фрагментами, отрендеренными для request."""
+    if response.streaming or b'<!--hole:' not in response.content:
+        return response
+    filled = HttpResponse(
+        HOLE_PATTERN.sub(
+            lambda match: render_hole(
+                request, *match.groups(), response.charset
+            ),
+            response.content,
+        ),
+        status=response.status_code,
+    )
+    for header, value in response.items():
+        if header.lower() != 'content-length':
+            filled[header] = value
+    return filled
+
+
+def render_page(page, request):
+    """Ответ по странице из кэша или только что построенному ответу."""
+    if not isinstance(page, CompressedResponse):
+        return fill_holes(page, request)
+    return page.render(
+        request,
+        lambda name, params: render_hole(request, name, params, page.charset),
+    )
+
+
+def page_state(entry, version, timeout):
+    """'fresh', 'early' (пора перестроить заранее), 'stale' или
+    'missing'."""
+    if entry is None:
+        return 'missing'
+    entry_version, _, built, duration = entry
+    expires = built + timeout
+    if entry_version != version or time.time() >= expires:
+        return 'stale'
+    # XFetch: случайный запас до срока, в среднем duration * beta;
+    # 1 - random() не бывает нулём
+    early = -duration * settings.FEED_CACHE_EARLY_BETA * math.log(
+        1 - random.random()
+    )
+    if time.time() + early >= expires:
+        return 'early'
+    return 'fresh'
+
+
+def build_page(build, request, key, version, timeout):
+    """Строит страницу и кладёт её в кэш сжатой вместе с версией.
+
+    Страницу, отмеченную request.page_incomplete (например, без части
+    миниатюр), кэш не сохраняет.
+    """
+    start = time.perf_counter()
+    response = build()
+    duration = time.perf_counter() - start
+    if (
+        response.status_code != 200
+        or response.streaming
+        or response.cookies
+        or getattr(request, 'page_incomplete', False)
+    ):
+        return response
+    page = CompressedResponse(response, HOLE_PATTERN)
+    cache.set(
+        key,
+        (version, page, time.time(), duration),
+        timeout + settings.FEED_CACHE_STALE_TIMEOUT,
+    )
+    return page
+
+
+def wait_for_page(key, version):
+    """Ждёт страницу, которую строит другой запрос; None по таймауту."""
+    deadline = time.monotonic() + settings.FEED_CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        entry = cache.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+    return None
+
+
+def coalesce(build, key_prefix, key, version, entry, state):
+    """Ответ, пока страницу строит другой запрос.
+
+    Это прежняя страница, а без неё — новая, если дождаться её
+    удалось; иначе страница строится без записи в кэш.
+    """
+    if entry is not None:
+        response, outcome = entry[1], state
+    else:
+        response = wait_for_page(key, version)
+        outcome = 'timeout' if response is None else 'waited'
+    metrics.inc(
+        'yatube_cache_coalesced_total', cache=key_prefix, outcome=outcome
+    )
+    metrics.inc(
+        'yatube_cache_requests_total', cache=key_prefix,
+        result='miss' if response is None else 'hit',
+    )
+    return build() if response is None else response
+
+
+def serve_page(build, request, key_prefix, timeout):
+    """Страница из кэша; перестраивает её только один запрос."""
+    key = page_key(request, key_prefix)
+    version = feed_version(request.path)
+    entry = cache.get(key)
+    state = page_state(entry, version, timeout)
+    if state == 'fresh':
+        metrics.inc(
+            'yatube_cache_requests_total', cache=key_prefix, result='hit'
+        )
+        return entry[1]
+    lock = LOCK_KEY.format(key)
+    if not cache.add(lock, os.getpid(), settings.FEED_CACHE_LOCK_TIMEOUT):
+        return coalesce(build, key_prefix, key, version, entry, state)
+    metrics.inc('yatube_cache_requests_total', cache=key_prefix, result='miss')
+    metrics.inc('yatube_cache_rebuilds_total', cache=key_prefix, reason=state)
+    try:
+        return build_page(build, request, key, version, timeout)
+    finally:
+        cache.delete(lock)
+
+
+def cache_feed(key_prefix, timeout=None):
+    """Кэширует GET-ответы ленты до изменения её версии.
+
+    Страница общая для всех посетителей; фрагменты с данными
+    пользователя заполняются для каждого запроса.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            # Страница ошибки рендерится после view и меток не получает
+            request.punch_holes = True
+            try:
+                response = serve_page(
+                    lambda: view(request, *args, **kwargs),
+                    request,
+                    key_prefix,
+                    timeout or settings.FEED_CACHE_TIMEOUT,
+                )
+            finally:
+                request.punch_holes = False
+            return render_page(response, request)
+        return wrapper
+    return decorator
+
+
+def rewarm(paths):
+    """Заново строит первые страницы лент для анонимного посетителя."""
+    try:
+        for path in paths:
+            request = RequestFactory().get(path)
+            request.user = AnonymousUser()
+            match = resolve(path)
+            match.func(request, *match.args, **match.kwargs)
+    except Exception:
+        logger.exception('Не удалось прогреть кэш лент %s', paths)
+    finally:
+        connection.close()
+
+
+def schedule_rewarm(paths):
+    """Прогревает ленты в фоне после фиксации транзакции."""
+    global _rewarm_executor
+    if not settings.FEED_CACHE_REWARM:
+        return
+    if _rewarm_executor is None:
+        _rewarm_executor = ThreadPoolExecutor(max_workers=1)
+    paths = list(paths)
+    transaction.on_commit(lambda: _rewarm_executor.submit(rewarm, paths))
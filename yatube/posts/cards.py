@@ -0,0 +1,71 @@
+"""Кэш отрисованных карточек постов для лент.
+
+Карточка хранится под ключом из id поста и метки изменения (время
+изменения и число комментариев), поэтому правка поста сама даёт новый
+ключ. Страница ленты собирается из кэша одним ``get_many``; рисуются
+только отсутствующие карточки. Изменения группы и автора, которые
+тоже видны на карточке, удаляют карточки их постов явно.
+
+Миниатюры при отрисовке не строятся: пока миниатюры нет, карточка
+показывает оригинал, не кэшируется, а миниатюра строится в фоне.
+"""
+from core.metrics import count_lookups
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from .thumbnails import get_thumbnail_formats, picture, schedule_thumbnails
+
+CARD_KEY = 'post_card:{pk}:{stamp}'
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+
+
+def card_key(pk, updated, comments_count):
+    stamp = f'{updated.timestamp():.6f}.{comments_count}'
+    return CARD_KEY.format(pk=pk, stamp=stamp)
+
+
+def render_cards(posts):
+    """HTML карточек постов в порядке posts и признак, что у всех
+    карточек есть миниатюры."""
+    keys = [
+        card_key(post.pk, post.updated, post.comments_count)
+        for post in posts
+    ]
+    cards = cache.get_many(keys)
+    to_render = [
+        (post, key) for post, key in zip(posts, keys) if key not in cards
+    ]
+    count_lookups('post_card', len(keys) - len(to_render), len(to_render))
+    # Первая геометрия из POST_THUMBNAILS — миниатюра карточки
+    geometry, options = settings.POST_THUMBNAILS[0]
+    thumbnails = get_thumbnail_formats(
+        [post.image.name for post, _ in to_render], geometry, build=False,
+        **options
+    )
+    missing = {}
+    unbuilt = []
+    for post, key in to_render:
+        formats = thumbnails.get(post.image.name, {})
+        cards[key] = render_to_string(
+            CARD_TEMPLATE,
+            {'post': post, **picture(post, formats, geometry, options)},
+        )
+        if post.image and not formats:
+            unbuilt.append(post.image.name)
+        else:
+            missing[key] = cards[key]
+    if missing:
+        cache.set_many(missing, settings.POST_CARD_TIMEOUT)
+    schedule_thumbnails(unbuilt)
+    return [cards[key] for key in keys], not unbuilt
+
+
+def invalidate_cards(posts):
+    """Удаляет из кэша карточки постов из queryset posts."""
+    cache.delete_many([
+        card_key(*values)
+        for values in posts.values_list(
+            'pk', 'updated', 'comments_count'
+        ).iterator()
+    ])
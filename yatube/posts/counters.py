@@ -0,0 +1,119 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются сигналами одним UPDATE ``x = x + 1`` в транзакции
+записи модели. Если они всё же разошлись с данными (массовые
+операции, ручные правки в базе), их чинит ``reconcile``.
+"""
+from core.db import insert_batch_size, update_batch_size
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Post, User, UserCounter
+
+USER_COUNTERS = {
+    'posts_count': (Post, 'author'),
+    'followers_count': (Follow, 'author'),
+    'following_count': (Follow, 'user'),
+}
+POST_COUNTERS = {
+    'comments_count': (Comment, 'post'),
+}
+
+
+def _deltas(**deltas):
+    return {
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+    }
+
+
+def bump_user(user_id, **deltas):
+    """Изменяет счётчики пользователя.
+
+    Строка создаётся, только если счётчики растут. При удалении
+    пользователя каскад удаляет его строку раньше постов и подписок, и
+    сигналы их удаления не должны создавать её заново; уменьшать в
+    отсутствующей строке нечего, расхождения чинит ``reconcile``.
+    """
+    counters = UserCounter.objects.filter(user_id=user_id)
+    if counters.update(**_deltas(**deltas)):
+        return
+    if any(delta > 0 for delta in deltas.values()):
+        UserCounter.objects.get_or_create(user_id=user_id)
+        counters.update(**_deltas(**deltas))
+
+
+def bump_post(post_id, **deltas):
+    Post.objects.filter(pk=post_id).update(**_deltas(**deltas))
+
+
+def _actual(model, field):
+    """Подзапрос с фактическим числом строк model для внешнего pk."""
+    rows = model.objects.filter(
+        **{field: OuterRef('pk')}
+    ).order_by().values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+def _repair(queryset, counters, read, write, dry_run):
+    """Сравнивает сохранённые счётчики с фактическими и чинит расхождения.
+
+    read(obj) возвращает объект со счётчиками, write(objs, fields)
+    сохраняет исправленные объекты.
+    """
+    actual = {
+        f'actual_{name}': _actual(*spec) for name, spec in counters.items()
+    }
+    fixed = []
+    for obj in queryset.annotate(**actual).iterator():
+        target = read(obj)
+        changed = False
+        for name in counters:
+            value = getattr(obj, f'actual_{name}')
+            if getattr(target, name) != value:
+                setattr(target, name, value)
+                changed = True
+        if changed:
+            fixed.append(target)
+    if not dry_run:
+        write(fixed, list(counters))
+    return len(fixed)
+
+
+def reconcile(dry_run=False):
+    """Пересчитывает все счётчики.
+
+    Возвращает число созданных строк счётчиков пользователей и число
+    исправленных строк пользователей и постов.
+    """
+    missing = User.objects.filter(counters__isnull=True).values_list(
+        'pk', flat=True
+    )
+    created = missing.count()
+    if created and not dry_run:
+        UserCounter.objects.bulk_create(
+            (UserCounter(user_id=pk) for pk in missing.iterator()),
+            batch_size=insert_batch_size(UserCounter),
+            ignore_conflicts=True,
+        )
+    users = _repair(
+        User.objects.select_related('counters').filter(
+            counters__isnull=False
+        ),
+        USER_COUNTERS,
+        lambda user: user.counters,
+        lambda objs, fields: UserCounter.objects.bulk_update(
+            objs, fields, batch_size=update_batch_size(fields)
+        ),
+        dry_run,
+    )
+    posts = _repair(
+        Post.objects.only('pk', *POST_COUNTERS),
+        POST_COUNTERS,
+        lambda post: post,
+        lambda objs, fields: Post.objects.bulk_update(
+            objs, fields, batch_size=update_batch_size(fields)
+        ),
+        dry_run,
+    )
+    return {'created': created, 'users': users, 'posts': posts}
@@ -0,0 +1,207 @@
+"""Лента подписок: материализованные «входящие» каждого пользователя.
+
+Новый пост раскладывается по входящим подписчиков при сохранении
+(fan-out on write), поэтому чтение ленты — один диапазон по индексу
+``(user, pub_date)``. Когда подписчиков у автора становится больше
+``settings.FEED_FANOUT_LIMIT``, в его счётчиках отмечается
+``pull_since``: новые посты больше не раскладываются, ленты подписчиков
+дочитывают их напрямую из постов (pull on read).
+
+Обратно на раскладку автор переходит, только когда подписчиков не
+больше ``settings.FEED_FANOUT_RESUME``: без этого зазора автор у самой
+границы переключался бы на каждой паре подписки и отписки. Посты,
+написанные с ``pull_since``, раскладываются по входящим в фоне после
+фиксации транзакции; до конца раскладки автор остаётся в режиме pull.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from core.db import insert_batch_size
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Now
+
+from .models import FeedEntry, Follow, Post, UserCounter
+
+logger = logging.getLogger(__name__)
+
+# Ключ курсорной пагинации ленты подписок
+FEED_KEYS = ('feed_pub_date', 'feed_post_id')
+# Пост, сохранённый в момент переключения, мог получить pub_date чуть
+# раньше pull_since и не попасть во входящие
+PULL_OVERLAP = timedelta(minutes=5)
+
+_backfill_executor = None
+
+
+def is_pull_author(author_id):
+    """Посты автора читаются напрямую, а не из входящих."""
+    return UserCounter.objects.filter(
+        user_id=author_id, pull_since__isnull=False
+    ).exists()
+
+
+def pull_authors(user):
+    """Авторы из подписок пользователя, чьи посты читаются напрямую."""
+    return list(
+        Follow.objects.filter(
+            user=user, author__counters__pull_since__isnull=False
+        ).values_list('author_id', flat=True)
+    )
+
+
+def _create_entries(entries):
+    FeedEntry.objects.bulk_create(
+        entries,
+        batch_size=insert_batch_size(FeedEntry),
+        ignore_conflicts=True,
+    )
+
+
+def fan_out_post(post):
+    """Кладёт новый пост во входящие всех подписчиков автора."""
+    if is_pull_author(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    _create_entries(
+        FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+        for user_id in followers.iterator()
+    )
+
+
+def fill_feed(user_id, author_id):
+    """Дописывает во входящие посты автора после подписки на него.
+
+    У автора в режиме pull дописываются только посты до pull_since:
+    остальные лента читает напрямую.
+    """
+    posts = Post.objects.filter(author_id=author_id)
+    since = UserCounter.objects.filter(user_id=author_id).values_list(
+        'pull_since', flat=True
+    ).first()
+    if since is not None:
+        posts = posts.filter(pub_date__lt=since)
+    _create_entries(
+        FeedEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+        for pk, pub_date in posts.values_list('pk', 'pub_date').iterator()
+    )
+
+
+def followed(author_id):
+    """Переводит автора в режим pull, когда подписчиков больше
+    FEED_FANOUT_LIMIT."""
+    UserCounter.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.FEED_FANOUT_LIMIT,
+        pull_since__isnull=True,
+    ).update(pull_since=Now())
+
+
+def unfollowed(author_id):
+    """Возвращает автора на раскладку, когда подписчиков не больше
+    FEED_FANOUT_RESUME; раскладка идёт в фоне после фиксации."""
+    resume = UserCounter.objects.filter(
+        user_id=author_id,
+        followers_count__lte=settings.FEED_FANOUT_RESUME,
+        pull_since__isnull=False,
+    ).exists()
+    if resume:
+        schedule_backfill(author_id)
+
+
+def sync_pull_modes():
+    """Отмечает режим pull у авторов, подписчики которых добавлены в
+    обход сигналов (например, при наполнении базы)."""
+    UserCounter.objects.filter(
+        followers_count__gt=settings.FEED_FANOUT_LIMIT,
+        pull_since__isnull=True,
+    ).update(pull_since=Now())
+
+
+def backfill(author_id):
+    """Раскладывает посты автора, написанные в режиме pull, и
+    возвращает его на раскладку.
+
+    Ничего не делает, если автор уже не в режиме pull или подписчиков
+    снова больше FEED_FANOUT_RESUME. Возвращает число постов.
+    """
+    with transaction.atomic():
+        since = UserCounter.objects.select_for_update().filter(
+            user_id=author_id,
+            followers_count__lte=settings.FEED_FANOUT_RESUME,
+            pull_since__isnull=False,
+        ).values_list('pull_since', flat=True).first()
+        if since is None:
+            return 0
+        UserCounter.objects.filter(user_id=author_id).update(pull_since=None)
+        posts = list(
+            Post.objects.filter(
+                author_id=author_id, pub_date__gte=since - PULL_OVERLAP
+            ).values_list('pk', 'pub_date')
+        )
+        if posts:
+            followers = Follow.objects.filter(
+                author_id=author_id
+            ).values_list('user_id', flat=True)
+            _create_entries(
+                FeedEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+                for user_id in followers.iterator()
+                for pk, pub_date in posts
+            )
+    return len(posts)
+
+
+def _run_backfill(author_id):
+    try:
+        backfill(author_id)
+    except Exception:
+        logger.exception('Не удалось разложить посты автора %s', author_id)
+    finally:
+        connection.close()
+
+
+def schedule_backfill(author_id):
+    """Запускает backfill после фиксации транзакции.
+
+    При FEED_BACKFILL_WORKERS=0 раскладка идёт в текущем потоке.
+    """
+    global _backfill_executor
+    if not settings.FEED_BACKFILL_WORKERS:
+        transaction.on_commit(lambda: backfill(author_id))
+        return
+    if _backfill_executor is None:
+        _backfill_executor = ThreadPoolExecutor(
+            max_workers=settings.FEED_BACKFILL_WORKERS
+        )
+    transaction.on_commit(
+        lambda: _backfill_executor.submit(_run_backfill, author_id)
+    )
+
+
+def clear_feed(user_id, author_id):
+    """Убирает из входящих посты автора после отписки."""
+    FeedEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def follow_feed(user):
+    """Посты ленты подписок с ключами пагинации FEED_KEYS."""
+    pulled = pull_authors(user)
+    if not pulled:
+        return Post.objects.filter(feed_entries__user=user).annotate(
+            feed_pub_date=F('feed_entries__pub_date'),
+            feed_post_id=F('feed_entries__post_id'),
+        )
+    # Гибридный режим: входящие плюс посты «популярных» авторов
+    inbox = FeedEntry.objects.filter(user=user).values('post_id')
+    return Post.objects.filter(
+        Q(pk__in=inbox) | Q(author_id__in=pulled)
+    ).annotate(
+        feed_pub_date=F('pub_date'),
+        feed_post_id=F('pk'),
+    )
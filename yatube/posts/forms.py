@@ -1,5 +1,8 @@
+from core import metrics
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
+from .images import normalize
 from .models import Comment, Post
 
 
@@ -18,6 +21,14 @@ class PostForm(forms.ModelForm):
             'group': "Группа, к которой будет относиться пост",
         }
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        # Новую картинку уменьшаем и очищаем от метаданных до сохранения
+        if isinstance(image, UploadedFile):
+            metrics.observe('yatube_image_upload_bytes', image.size)
+            return normalize(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,104 @@
+"""Обработка загруженных картинок постов.
+
+Перед сохранением картинка поворачивается по EXIF, уменьшается до
+``POST_IMAGE_MAX_SIZE`` и пересохраняется без метаданных. Рядом с
+сохранённым файлом хранилище кладёт его вариант в WebP. Размеры
+картинки и крошечная заглушка для показа до загрузки хранятся в посте.
+"""
+import base64
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# Параметры пересохранения по форматам
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 80, 'method': 4},
+}
+# Наибольшая сторона заглушки в пикселях
+PLACEHOLDER_SIZE = 16
+
+
+def webp_name(name):
+    """Имя WebP-варианта файла; у файлов WebP варианта нет."""
+    root, extension = os.path.splitext(name)
+    if extension.lower() == '.webp':
+        return None
+    return root + '.webp'
+
+
+def normalize(upload):
+    """Уменьшенная картинка без метаданных в том же формате.
+
+    Анимированные картинки возвращаются как есть: пересохранение
+    оставило бы только первый кадр.
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    if getattr(image, 'is_animated', False):
+        upload.seek(0)
+        return upload
+    format = image.format
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(settings.POST_IMAGE_MAX_SIZE, Image.LANCZOS)
+    if format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    # Метаданные (EXIF, комментарии) не передаются в save и пропадают
+    image.save(buffer, format, **SAVE_OPTIONS.get(format, {}))
+    return ContentFile(buffer.getvalue(), name=upload.name)
+
+
+def to_webp(content):
+    """Содержимое картинки в WebP."""
+    image = Image.open(content)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert(
+            'RGBA' if 'transparency' in image.info else 'RGB'
+        )
+    buffer = BytesIO()
+    image.save(buffer, 'WEBP', **SAVE_OPTIONS['WEBP'])
+    return ContentFile(buffer.getvalue())
+
+
+def describe(content):
+    """Ширина, высота и заглушка картинки (data URI маленького JPEG)."""
+    content.seek(0)
+    image = Image.open(content)
+    width, height = image.size
+    preview = image.convert('RGB')
+    preview.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    buffer = BytesIO()
+    preview.save(buffer, 'JPEG', quality=40)
+    content.seek(0)
+    placeholder = base64.b64encode(buffer.getvalue()).decode()
+    return width, height, f'data:image/jpeg;base64,{placeholder}'
+
+
+def thumbnail_size(width, height, geometry, crop=None, upscale=None,
+                   **options):
+    """Размер миниатюры sorl по размерам оригинала, без открытия файла.
+
+    Повторяет масштабирование и обрезку движка sorl; None, если размеры
+    картинки не записаны.
+    """
+    from sorl.thumbnail.conf import settings as thumbnail_settings
+    from sorl.thumbnail.helpers import toint
+    from sorl.thumbnail.parsers import parse_geometry
+
+    if not width or not height:
+        return None
+    if upscale is None:
+        upscale = thumbnail_settings.THUMBNAIL_UPSCALE
+    target = parse_geometry(geometry, width / height)
+    factors = (target[0] / width, target[1] / height)
+    factor = max(factors) if crop else min(factors)
+    if factor < 1 or upscale:
+        width, height = toint(width * factor), toint(height * factor)
+    if crop and crop != 'noop':
+        width, height = min(width, target[0]), min(height, target[1])
+    return width, height
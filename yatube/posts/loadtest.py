@@ -0,0 +1,330 @@
+"""Нагрузочное тестирование WSGI-приложения смесью сценариев.
+
+Каждый клиент — отдельный поток со своими cookie. Клиент выбирает
+сценарий по весам и выполняет его шаги, вызывая
+``yatube.wsgi.application`` напрямую, без сети и веб-сервера: в замер
+попадают middleware, CSRF, сессии, view, шаблоны и база. Время ответа
+копится по имени URL, из него считаются запросы в секунду, доля
+ошибок, перцентили и гистограмма.
+
+Сценарии с записью создают комментарии и посты, поэтому запускать
+нагрузку стоит на отдельной базе, заполненной командой ``seed_data``.
+"""
+import io
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 SESSION_KEY)
+from django.db.models import Count
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.urls import Resolver404, resolve, reverse
+from PIL import Image
+
+from .benchmarks import PERCENTILES, percentile
+from .models import Post, User
+
+# Сценарии и их веса по умолчанию
+SCENARIOS = {
+    'anonymous_index': 60,
+    'follow_feed': 25,
+    'comment': 10,
+    'upload': 5,
+}
+# Верхние границы корзин гистограммы, мс
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+HOST = 'localhost'
+# Сколько последних постов комментируется в сценарии comment
+RECENT_POSTS = 100
+
+
+def parse_mix(value):
+    """Разбирает строку вида ``comment=10,upload=5`` в словарь весов."""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f'Неизвестный сценарий: {name}')
+        try:
+            mix[name] = int(weight)
+        except ValueError:
+            raise ValueError(f'Вес сценария {name} должен быть числом')
+        if mix[name] < 0:
+            raise ValueError(f'Вес сценария {name} меньше нуля')
+    if not any(mix.values()):
+        raise ValueError('Нужен хотя бы один сценарий с весом больше нуля')
+    return mix
+
+
+def url_name(path):
+    try:
+        return resolve(path).view_name
+    except Resolver404:
+        return path
+
+
+def sample_image(rng):
+    """Небольшая картинка случайного цвета в JPEG."""
+    content = io.BytesIO()
+    color = tuple(rng.randrange(256) for _ in range(3))
+    Image.new('RGB', (320, 240), color).save(content, 'JPEG')
+    return content.getvalue()
+
+
+class Stats:
+    """Время ответов и ошибки по именам URL, общие для всех потоков."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def add(self, name, elapsed, status):
+        with self.lock:
+            self.timings[name].append(elapsed)
+            self.statuses[name][status] += 1
+            if status is None or status >= 400:
+                self.errors[name] += 1
+
+    def report(self, duration):
+        """Сводка по URL: rps, ошибки, перцентили и гистограмма."""
+        views = {}
+        for name, timings in sorted(self.timings.items()):
+            timings = sorted(timings)
+            histogram = {f'le_{bound}': 0 for bound in BUCKETS}
+            histogram['inf'] = 0
+            for value in timings:
+                for bound in BUCKETS:
+                    if value <= bound:
+                        histogram[f'le_{bound}'] += 1
+                        break
+                else:
+                    histogram['inf'] += 1
+            view = {
+                'requests': len(timings),
+                'errors': self.errors[name],
+                'error_rate': round(self.errors[name] / len(timings), 4),
+                'rps': round(len(timings) / duration, 2),
+                'mean_ms': round(sum(timings) / len(timings), 3),
+            }
+            for share in PERCENTILES:
+                view[f'p{share}_ms'] = round(percentile(timings, share), 3)
+            view['histogram_ms'] = histogram
+            view['statuses'] = {
+                str(status): count
+                for status, count in self.statuses[name].items()
+            }
+            views[name] = view
+        total = sum(view['requests'] for view in views.values())
+        errors = sum(view['errors'] for view in views.values())
+        return {
+            'duration_s': round(duration, 3),
+            'requests': total,
+            'errors': errors,
+            'rps': round(total / duration, 2) if duration else None,
+            'views': views,
+        }
+
+
+class WSGIClient:
+    """Клиент, вызывающий WSGI-приложение и хранящий cookie."""
+
+    def __init__(self, application, stats):
+        self.application = application
+        self.stats = stats
+        self.cookies = SimpleCookie()
+
+    def login(self, user):
+        """Открывает сессию пользователя без проверки пароля."""
+        engine = import_module(settings.SESSION_ENGINE)
+        session = engine.SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        self.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+    def csrf_token(self):
+        morsel = self.cookies.get(settings.CSRF_COOKIE_NAME)
+        return morsel.value if morsel else ''
+
+    def request(self, method, path, data=None, files=None):
+        """Выполняет запрос и возвращает статус (None при исключении)."""
+        url = urlsplit(path)
+        body = b''
+        content_type = ''
+        if method == 'POST':
+            fields = dict(data or {})
+            fields['csrfmiddlewaretoken'] = self.csrf_token()
+            fields.update(files or {})
+            body = encode_multipart(BOUNDARY, fields)
+            content_type = MULTIPART_CONTENT
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'SERVER_NAME': HOST,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': HOST,
+            'HTTP_COOKIE': '; '.join(
+                f'{key}={morsel.value}'
+                for key, morsel in self.cookies.items()
+            ),
+            'CONTENT_TYPE': content_type,
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split()[0])
+            for header, value in headers:
+                if header.lower() == 'set-cookie':
+                    self.cookies.load(value)
+
+        start = time.perf_counter()
+        try:
+            result = self.application(environ, start_response)
+            try:
+                for _ in result:
+                    pass
+            finally:
+                # close() отправляет request_finished и закрывает
+                # соединение с базой
+                if hasattr(result, 'close'):
+                    result.close()
+        except Exception:
+            response['status'] = None
+        elapsed = (time.perf_counter() - start) * 1000
+        self.stats.add(url_name(url.path), elapsed, response.get('status'))
+        return response.get('status')
+
+
+class Scenarios:
+    """Шаги сценариев; каждый метод — одно действие пользователя."""
+
+    def __init__(self, client, rng, user, post_ids):
+        self.client = client
+        self.rng = rng
+        self.user = user
+        self.post_ids = post_ids
+        self.logged_in = False
+
+    def ensure_login(self):
+        if not self.logged_in and self.user is not None:
+            self.client.login(self.user)
+            self.logged_in = True
+        return self.logged_in
+
+    def anonymous_index(self):
+        # Свой клиент без cookie: аноним не делит сессию с пользователем
+        anonymous = WSGIClient(self.client.application, self.client.stats)
+        anonymous.request('GET', reverse('posts:index'))
+
+    def follow_feed(self):
+        if self.ensure_login():
+            self.client.request('GET', reverse('posts:follow_index'))
+
+    def comment(self):
+        if not self.ensure_login() or not self.post_ids:
+            return
+        post_id = self.rng.choice(self.post_ids)
+        self.client.request(
+            'GET', reverse('posts:post_detail', args=[post_id])
+        )
+        self.client.request(
+            'POST',
+            reverse('posts:add_comment', args=[post_id]),
+            {'text': f'Комментарий под нагрузкой {self.rng.random()}'},
+        )
+
+    def upload(self):
+        if not self.ensure_login():
+            return
+        self.client.request('GET', reverse('posts:post_create'))
+        image = io.BytesIO(sample_image(self.rng))
+        image.name = 'load.jpg'
+        self.client.request(
+            'POST',
+            reverse('posts:post_create'),
+            {'text': f'Пост под нагрузкой {self.rng.random()}'},
+            {'image': image},
+        )
+
+
+def users_for(clients):
+    """Пользователи для клиентов: сначала те, у кого есть подписки."""
+    users = list(
+        User.objects.annotate(follows=Count('follower'))
+        .order_by('-follows', 'pk')[:clients]
+    )
+    return [users[i % len(users)] if users else None for i in range(clients)]
+
+
+def run(clients=10, duration=30, iterations=None, mix=None,
+        random_seed=None):
+    """Гоняет clients потоков duration секунд или iterations сценариев.
+
+    Возвращает сводку ``Stats.report`` с описанием прогона в meta.
+    """
+    from yatube.wsgi import application
+
+    mix = mix or SCENARIOS
+    names = [name for name, weight in mix.items() if weight]
+    weights = [mix[name] for name in names]
+    post_ids = list(
+        Post.objects.order_by('-pub_date', '-id').values_list(
+            'pk', flat=True
+        )[:RECENT_POSTS]
+    )
+    users = users_for(clients)
+    stats = Stats()
+    deadline = time.monotonic() + duration
+
+    def client_loop(number):
+        rng = random.Random(
+            None if random_seed is None else random_seed + number
+        )
+        scenarios = Scenarios(
+            WSGIClient(application, stats), rng, users[number], post_ids
+        )
+        done = 0
+        while time.monotonic() < deadline and (
+            iterations is None or done < iterations
+        ):
+            name = rng.choices(names, weights)[0]
+            getattr(scenarios, name)()
+            done += 1
+
+    threads = [
+        threading.Thread(target=client_loop, args=(number,), daemon=True)
+        for number in range(clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report = stats.report(time.perf_counter() - start)
+    report['meta'] = {
+        'clients': clients,
+        'mix': dict(zip(names, weights)),
+        'seed': random_seed,
+    }
+    return report
@@ -0,0 +1,137 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from posts.models import Comment, Follow, Post
+from posts.seeding import seed
+
+PAGE = 11
+
+
+class Rollback(Exception):
+    pass
+
+
+def hot_queries():
+    """Запросы лент и страницы поста, которые обслуживают индексы."""
+    post = Post.objects.order_by('?').values('pk', 'author', 'group').first()
+    follow = Follow.objects.values('user', 'author').first()
+    if post is None:
+        raise CommandError('Нет постов: задайте --posts или заполните базу.')
+    queries = {
+        'index': Post.objects.order_by('-pub_date', '-id')[:PAGE],
+        'profile': Post.objects.filter(
+            author_id=post['author']
+        ).order_by('-pub_date', '-id')[:PAGE],
+        'comments': Comment.objects.filter(
+            post_id=post['pk']
+        ).order_by('-created'),
+    }
+    if post['group']:
+        queries['group_list'] = Post.objects.filter(
+            group_id=post['group']
+        ).order_by('-pub_date', '-id')[:PAGE]
+    if follow:
+        queries['follow'] = Follow.objects.filter(
+            user_id=follow['user'], author_id=follow['author']
+        )
+    return queries
+
+
+def explain(queryset, phase):
+    """План запроса; метка phase делает текст запроса уникальным.
+
+    Иначе SQLite вернёт план из кэша подготовленных запросов, не
+    заметив удалённых индексов.
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{connection.ops.explain_query_prefix()} {sql} /* {phase} */',
+            params,
+        )
+        return '\n'.join(
+            '    ' + ' '.join(str(value) for value in row)
+            for row in cursor.fetchall()
+        )
+
+
+def measure(queryset, repeat):
+    """Медиана времени выполнения запроса в миллисекундах."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        list(queryset.all())
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает планы и время запросов лент с составными индексами '
+        'и без них. Все изменения в базе откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts',
+            type=int,
+            default=0,
+            help='Сколько синтетических постов создать на время замера.',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Сколько раз выполнять каждый запрос.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['posts']:
+                    posts = options['posts']
+                    users = max(posts // 100, 2)
+                    seed(
+                        users=users,
+                        groups=max(posts // 1000, 1),
+                        posts=posts,
+                        comments=posts,
+                        follows=users * 10,
+                        derived=False,
+                    )
+                self.compare(options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def compare(self, repeat):
+        queries = hot_queries()
+        results = {}
+        for name, queryset in queries.items():
+            results[name] = [
+                explain(queryset, 'indexed'), measure(queryset, repeat)
+            ]
+        indexes = [
+            index.name
+            for model in (Post, Comment, Follow)
+            for index in model._meta.indexes
+        ]
+        with connection.cursor() as cursor:
+            for index in indexes:
+                cursor.execute(
+                    f'DROP INDEX {connection.ops.quote_name(index)}'
+                )
+        for name, queryset in queries.items():
+            results[name] += [
+                explain(queryset, 'plain'), measure(queryset, repeat)
+            ]
+        for name, (plan, ms, plain_plan, plain_ms) in results.items():
+            self.stdout.write(
+                f'{name}: {plain_ms:.3f} мс без индексов, '
+                f'{ms:.3f} мс с ними\n'
+                f'  план без индексов:\n{plain_plan}\n'
+                f'  план с индексами:\n{plan}'
+            )
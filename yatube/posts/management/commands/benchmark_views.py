@@ -0,0 +1,69 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.benchmarks import PERCENTILES, regressions, run
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет перцентили времени ответа и число запросов к базе для '
+        'страниц постов и пишет результат в JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=50,
+            help='Сколько раз запрашивать каждую страницу.',
+        )
+        parser.add_argument(
+            '--output',
+            default='benchmark.json',
+            help='Куда записать результат.',
+        )
+        parser.add_argument(
+            '--cold',
+            action='store_true',
+            help='Очищать кэш перед каждым запросом.',
+        )
+        parser.add_argument(
+            '--compare',
+            metavar='BASELINE',
+            help='JSON прошлого прогона для сравнения.',
+        )
+        parser.add_argument(
+            '--max-regression',
+            type=float,
+            default=1.2,
+            help='Во сколько раз может вырасти p95 относительно BASELINE.',
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests должно быть больше нуля.')
+        result = run(options['requests'], cold=options['cold'])
+        if not result['views']:
+            raise CommandError('Нет постов с группой: заполните базу.')
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+        for name, view in result['views'].items():
+            timings = ', '.join(
+                f'p{share} {view[f"p{share}_ms"]:.1f}' for share in PERCENTILES
+            )
+            self.stdout.write(
+                f'{name}: {timings} мс, запросов {view["queries"]["max"]}, '
+                f'ошибок {view["errors"]}'
+            )
+        self.stdout.write(f'Результат записан в {options["output"]}')
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as baseline:
+                found = regressions(
+                    result, json.load(baseline), options['max_regression']
+                )
+            if found:
+                raise CommandError('Замедлились страницы: ' + ', '.join(
+                    f'{name} ({before:.1f} → {after:.1f} мс)'
+                    for name, before, after in found
+                ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import build_all
+
+
+class Command(BaseCommand):
+    help = 'Строит миниатюры для уже загруженных картинок постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Число процессов; 0 — строить в текущем процессе.',
+        )
+
+    def handle(self, *args, **options):
+        names = Post.objects.exclude(image='').values_list(
+            'image', flat=True
+        ).iterator()
+        built = build_all(names, workers=options['workers'])
+        self.stdout.write(f'Построено миниатюр: {built}')
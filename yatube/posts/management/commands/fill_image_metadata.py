@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models.functions import Now
+
+from posts.images import describe
+from posts.models import Post
+from posts.signals import invalidate_posts
+
+
+class Command(BaseCommand):
+    help = 'Заполняет размеры и заглушки картинок уже загруженных постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько постов читать из базы за раз.',
+        )
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        pending = Post.objects.exclude(image='').filter(
+            image_width__isnull=True
+        ).order_by('pk')
+        filled = missing = 0
+        last = 0
+        while True:
+            batch = list(
+                pending.filter(pk__gt=last).values_list('pk', 'image')[
+                    :options['batch_size']
+                ]
+            )
+            if not batch:
+                break
+            last = batch[-1][0]
+            described = {}
+            for pk, name in batch:
+                try:
+                    with storage.open(name) as content:
+                        described[pk] = describe(content)
+                except Exception:
+                    missing += 1
+                    self.stderr.write(f'Не удалось прочитать: {name}')
+            if not described:
+                continue
+            with transaction.atomic():
+                for pk, (width, height, placeholder) in described.items():
+                    Post.objects.filter(pk=pk).update(
+                        image_width=width,
+                        image_height=height,
+                        image_placeholder=placeholder,
+                        updated=Now(),
+                    )
+                # update() не шлёт сигналов, поэтому кэш лент и карточки
+                # сбрасываются здесь
+                invalidate_posts(Post.objects.filter(pk__in=described))
+            filled += len(described)
+        self.stdout.write(
+            f'Заполнено постов: {filled}\n'
+            f'Не прочитано картинок: {missing}'
+        )
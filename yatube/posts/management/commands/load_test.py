@@ -0,0 +1,87 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.benchmarks import PERCENTILES
+from posts.loadtest import SCENARIOS, parse_mix, run
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагружает WSGI-приложение параллельными клиентами со смесью '
+        'сценариев и выводит rps, ошибки и время ответа по URL. '
+        'Сценарии создают комментарии и посты: запускайте на отдельной '
+        'базе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clients',
+            type=int,
+            default=10,
+            help='Число параллельных клиентов.',
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=30,
+            help='Длительность нагрузки в секундах.',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=None,
+            help='Сколько сценариев выполнить каждому клиенту.',
+        )
+        parser.add_argument(
+            '--mix',
+            default=','.join(
+                f'{name}={weight}' for name, weight in SCENARIOS.items()
+            ),
+            help='Веса сценариев, например anonymous_index=60,comment=10.',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Начальное значение генератора для повторяемой смеси.',
+        )
+        parser.add_argument(
+            '--output',
+            default=None,
+            help='Куда записать результат в JSON.',
+        )
+
+    def handle(self, *args, **options):
+        if options['clients'] < 1:
+            raise CommandError('--clients должно быть больше нуля.')
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as error:
+            raise CommandError(error)
+        report = run(
+            clients=options['clients'],
+            duration=options['duration'],
+            iterations=options['iterations'],
+            mix=mix,
+            random_seed=options['seed'],
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+        self.stdout.write(
+            f'Запросов: {report["requests"]}, ошибок: {report["errors"]}, '
+            f'{report["rps"]} в секунду за {report["duration_s"]} с'
+        )
+        for name, view in report['views'].items():
+            timings = ', '.join(
+                f'p{share} {view[f"p{share}_ms"]:.1f}' for share in PERCENTILES
+            )
+            self.stdout.write(
+                f'{name}: {view["requests"]} запросов, {view["rps"]}/с, '
+                f'ошибок {view["error_rate"]:.1%}, {timings} мс'
+            )
+            self.stdout.write('  ' + ' '.join(
+                f'{bucket}:{count}'
+                for bucket, count in view['histogram_ms'].items()
+            ))
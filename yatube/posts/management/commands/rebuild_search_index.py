@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Строит поисковый индекс постов и комментариев заново.'
+
+    def handle(self, *args, **options):
+        indexed = rebuild_index()
+        self.stdout.write(f'Проиндексировано текстов: {indexed}')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов, комментариев и подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не исправляя.',
+        )
+
+    def handle(self, *args, **options):
+        result = reconcile(dry_run=options['dry_run'])
+        prefix = 'Найдено' if options['dry_run'] else 'Исправлено'
+        self.stdout.write(
+            f'Без счётчиков пользователей: {result["created"]}\n'
+            f'{prefix} пользователей: {result["users"]}\n'
+            f'{prefix} постов: {result["posts"]}'
+        )
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.storage import is_sharded, reshard
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов из общего каталога posts/ '
+        'в хранилище по хэшу содержимого и дописывает их варианты WebP.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько имён файлов читать из базы за раз.',
+        )
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        files = posts = missing = 0
+        last = ''
+        while True:
+            # Имена читаются пачками по возрастанию, а не все сразу
+            names = list(
+                Post.objects.filter(image__gt=last).order_by(
+                    'image'
+                ).values_list('image', flat=True).distinct()[
+                    :options['batch_size']
+                ]
+            )
+            if not names:
+                break
+            last = names[-1]
+            for name in names:
+                if is_sharded(name):
+                    storage.save_variants(name)
+                    continue
+                moved = reshard(name, storage)
+                if moved is None:
+                    missing += 1
+                    self.stderr.write(f'Нет файла: {name}')
+                    continue
+                files += 1
+                posts += moved
+        self.stdout.write(
+            f'Перенесено файлов: {files}\n'
+            f'Обновлено постов: {posts}\n'
+            f'Не найдено файлов: {missing}'
+        )
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+
+from posts.seeding import seed
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу случайными пользователями, группами, постами, '
+        'комментариями и подписками для замеров производительности.'
+    )
+
+    def add_arguments(self, parser):
+        for name, default in (
+            ('users', 1000),
+            ('groups', 50),
+            ('posts', 10000),
+            ('comments', 20000),
+            ('follows', 10000),
+        ):
+            parser.add_argument(
+                f'--{name}',
+                type=int,
+                default=default,
+                help=f'Сколько создать (по умолчанию {default}).',
+            )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько записей создавать за раз.',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Начальное значение генератора для повторяемых данных.',
+        )
+        parser.add_argument(
+            '--skip-derived',
+            action='store_true',
+            help='Не пересчитывать счётчики, ленты и поисковый индекс.',
+        )
+
+    def handle(self, *args, **options):
+        created = seed(
+            users=options['users'],
+            groups=options['groups'],
+            posts=options['posts'],
+            comments=options['comments'],
+            follows=options['follows'],
+            batch_size=options['batch_size'],
+            random_seed=options['seed'],
+            derived=not options['skip_derived'],
+            log=self.stdout.write,
+        )
+        self.stdout.write('\n'.join(
+            f'Создано {name}: {count}' for name, count in created.items()
+        ))
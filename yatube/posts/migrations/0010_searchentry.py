@@ -0,0 +1,150 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:18
+
+import re
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Копия разбора текста из posts.search на момент миграции: миграция не
+# должна зависеть от того, как индексирует текущий код
+TEXT_WEIGHT = 2
+COMMENT_WEIGHT = 1
+TERM_LENGTH = 32
+
+WORD = re.compile(r'[0-9a-zа-яё]+')
+STOP_WORDS = frozenset((
+    'а', 'без', 'бы', 'в', 'во', 'вот', 'все', 'вы', 'да', 'для', 'до',
+    'его', 'ее', 'её', 'если', 'же', 'за', 'и', 'из', 'или', 'им', 'их',
+    'к', 'как', 'ли', 'мне', 'мы', 'на', 'над', 'не', 'нет', 'ни', 'но',
+    'о', 'об', 'он', 'она', 'они', 'от', 'по', 'под', 'при', 'с', 'со',
+    'так', 'там', 'то', 'тот', 'ты', 'у', 'уже', 'что', 'это', 'я',
+))
+
+RV = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+PERFECTIVE_GERUND = re.compile(
+    r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$'
+)
+REFLEXIVE = re.compile(r'(с[яь])$')
+ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|'
+    r'ую|юю|ая|яя|ою|ею)$'
+)
+PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|'
+    r'ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|'
+    r'((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|'
+    r'ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+DERIVATIONAL_ENDING = re.compile(r'ость?$')
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+
+
+def stem(word):
+    """Основа русского слова по алгоритму Snowball; латиница без изменений."""
+    match = RV.match(word)
+    if match is None:
+        return word
+    start, rv = match.groups()
+    stripped = PERFECTIVE_GERUND.sub('', rv, 1)
+    if stripped == rv:
+        rv = REFLEXIVE.sub('', rv, 1)
+        stripped = ADJECTIVE.sub('', rv, 1)
+        if stripped != rv:
+            rv = PARTICIPLE.sub('', stripped, 1)
+        else:
+            stripped = VERB.sub('', rv, 1)
+            rv = NOUN.sub('', rv, 1) if stripped == rv else stripped
+    else:
+        rv = stripped
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    if DERIVATIONAL.match(rv):
+        rv = DERIVATIONAL_ENDING.sub('', rv, 1)
+    if rv.endswith('ь'):
+        rv = rv[:-1]
+    else:
+        rv = SUPERLATIVE.sub('', rv, 1)
+        if rv.endswith('нн'):
+            rv = rv[:-1]
+    return start + rv
+
+
+def terms(text):
+    """Основы слов текста без стоп-слов, с повторами."""
+    result = []
+    for word in WORD.findall(text.lower().replace('ё', 'е')):
+        if word in STOP_WORDS:
+            continue
+        result.append(stem(word) if 'а' <= word[0] <= 'я' else word)
+    return [term[:TERM_LENGTH] for term in result if term]
+
+
+def _batch_size(schema_editor, fields):
+    # SQLite ограничивает число переменных в запросе, а не строк:
+    # каждая строка INSERT занимает по переменной на поле
+    limit = schema_editor.connection.features.max_query_params
+    return max(limit // fields, 1) if limit else None
+
+
+def fill_search_index(apps, schema_editor):
+    """Индексирует уже опубликованные посты и комментарии."""
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    SearchEntry = apps.get_model('posts', 'SearchEntry')
+    sources = (
+        (Post.objects.values_list('pk', 'text', 'pk'), TEXT_WEIGHT, False),
+        (
+            Comment.objects.values_list('post_id', 'text', 'pk'),
+            COMMENT_WEIGHT,
+            True,
+        ),
+    )
+    for rows, weight, is_comment in sources:
+        SearchEntry.objects.bulk_create(
+            (
+                SearchEntry(
+                    term=term,
+                    post_id=post_id,
+                    comment_id=pk if is_comment else None,
+                    weight=count * weight,
+                )
+                for post_id, text, pk in rows.iterator()
+                for term, count in Counter(terms(text)).items()
+            ),
+            batch_size=_batch_size(schema_editor, 4),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_post_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=32, verbose_name='Основа слова')),
+                ('weight', models.PositiveIntegerField(verbose_name='Вес')),
+                ('comment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='posts.Comment', verbose_name='Комментарий')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='posts.Post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Запись поискового индекса',
+                'verbose_name_plural': 'Записи поискового индекса',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='searchentry',
+            index=models.Index(fields=['term', 'post', 'weight'], name='search_term_post_idx'),
+        ),
+        migrations.RunPython(fill_search_index, migrations.RunPython.noop),
+    ]
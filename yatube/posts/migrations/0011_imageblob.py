@@ -0,0 +1,67 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:24
+
+from django.core.files.storage import FileSystemStorage
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible(path='posts.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище из posts.storage для состояния моделей миграции.
+
+    Миграция не импортирует код приложения: схеме нужно только то же
+    описание поля, а файлы миграция не сохраняет.
+    """
+
+
+def _batch_size(schema_editor, fields):
+    # SQLite ограничивает число переменных в запросе, а не строк:
+    # каждая строка INSERT занимает по переменной на поле
+    limit = schema_editor.connection.features.max_query_params
+    return max(limit // fields, 1) if limit else None
+
+
+def fill_image_blobs(apps, schema_editor):
+    """Считает ссылки постов на уже загруженные картинки."""
+    Post = apps.get_model('posts', 'Post')
+    ImageBlob = apps.get_model('posts', 'ImageBlob')
+    ImageBlob.objects.bulk_create(
+        (
+            ImageBlob(name=name, refcount=refcount)
+            for name, refcount in Post.objects.exclude(image='').values(
+                'image'
+            ).annotate(refcount=Count('pk')).values_list(
+                'image', 'refcount'
+            ).order_by().iterator()
+        ),
+        batch_size=_batch_size(schema_editor, 2),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_searchentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('refcount', models.PositiveIntegerField(default=0, verbose_name='Число ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл картинки',
+                'verbose_name_plural': 'Файлы картинок',
+            },
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.RunPython(fill_image_blobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.16 on 2026-10-18 07:40
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Now
+
+
+def mark_pull_authors(apps, schema_editor):
+    """Отмечает авторов, которых уже читают напрямую.
+
+    Когда они перешли в режим pull, неизвестно, поэтому pull_since —
+    их первый пост: при возврате на раскладку разложатся все посты.
+    """
+    Post = apps.get_model('posts', 'Post')
+    UserCounter = apps.get_model('posts', 'UserCounter')
+    first_post = Post.objects.filter(author_id=OuterRef('user_id')).order_by(
+    ).values('author_id').annotate(first=Min('pub_date')).values('first')
+    UserCounter.objects.filter(
+        followers_count__gt=settings.FEED_FANOUT_LIMIT
+    ).update(pull_since=Coalesce(Subquery(first_post), Now()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercounter',
+            name='pull_since',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Посты читаются напрямую с'),
+        ),
+        migrations.RunPython(mark_pull_authors, migrations.RunPython.noop),
+    ]
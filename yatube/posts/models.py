@@ -1,8 +1,24 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
+
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 LEN_POST_TEXT = 15
+# Счётчики меняются только UPDATE из posts.counters
+POST_COUNTER_FIELDS = ('comments_count',)
+
+
+class AtomicSaveMixin:
+    """Сохраняет модель в транзакции вместе с обработчиками post_save.
+
+    Сигналы обновляют счётчики и ленты подписок; запись модели и эти
+    изменения фиксируются или откатываются вместе.
+    """
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
 
 
 class Group(models.Model):
@@ -14,7 +30,7 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+class Post(AtomicSaveMixin, models.Model):
     text = models.TextField(
         'Текст поста',
         help_text='Введите текст поста'
@@ -23,6 +39,11 @@ class Post(models.Model):
         'Дата публикации',
         auto_now_add=True,
     )
+    # Метка изменения входит в ключ кэша карточки поста
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -44,22 +65,99 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
     # Аргумент upload_to указывает директорию,
     # в которую будут загружаться пользовательские файлы.
+    # Внутри неё файлы раскладываются по хэшу содержимого.
+    # Размеры и заглушка картинки заполняются при загрузке, чтобы
+    # шаблонам не нужно было открывать файл
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    image_placeholder = models.TextField(
+        'Заглушка картинки',
+        blank=True,
+        editable=False,
+    )
+    # Число комментариев поддерживается сигналами, а не COUNT(*)
+    comments_count = models.PositiveIntegerField(
+        'Комментариев',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ['-pub_date']
         # добавлено недавно
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Ленты читаются по убыванию (pub_date, id): id нужен курсору
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.text[:LEN_POST_TEXT]
 
+    def save(self, *args, **kwargs):
+        """Сохраняет пост, не трогая счётчики существующей строки.
+
+        Иначе пост, загруженный до нового комментария (форма
+        редактирования, админка), записал бы старое число комментариев.
+        """
+        if (
+            not args
+            and not self._state.adding
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        ):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in POST_COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
 
-class Comment(models.Model):
+class ImageBlob(models.Model):
+    """Число постов, ссылающихся на файл картинки.
+
+    Одинаковые картинки хранятся одним файлом, и удалять его можно,
+    только когда на него не ссылается ни один пост.
+    """
+    name = models.CharField('Файл', max_length=255, unique=True)
+    refcount = models.PositiveIntegerField('Число ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self):
+        return self.name
+
+
+class Comment(AtomicSaveMixin, models.Model):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -78,12 +176,17 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(
+                fields=['post', '-created'], name='comment_post_created_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:LEN_POST_TEXT]
 
 
-class Follow(models.Model):
+class Follow(AtomicSaveMixin, models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -108,6 +211,114 @@ class Follow(models.Model):
                 name='author_not_user'
             ),
         ]
+        # Уникальность начинается с автора, а подписки читаются
+        # по пользователю
+        indexes = [
+            models.Index(
+                fields=['user', 'author'], name='follow_user_author_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user.username} подписался на {self.author.username}'
+
+
+class UserCounter(models.Model):
+    """Счётчики пользователя, поддерживаемые при записи."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counters',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+    # С этого момента посты автора не раскладываются по входящим
+    pull_since = models.DateTimeField(
+        'Посты читаются напрямую с', null=True, blank=True
+    )
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return f'Счётчики {self.user.username}'
+
+
+class SearchEntry(models.Model):
+    """Строка инвертированного индекса: основа слова в тексте поста
+    или комментария к нему."""
+    TERM_LENGTH = 32
+
+    term = models.CharField('Основа слова', max_length=TERM_LENGTH)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='search_entries',
+        verbose_name='Пост',
+    )
+    # Пусто, если слово из текста самого поста
+    comment = models.ForeignKey(
+        Comment,
+        on_delete=models.CASCADE,
+        related_name='search_entries',
+        blank=True,
+        null=True,
+        verbose_name='Комментарий',
+    )
+    weight = models.PositiveIntegerField('Вес')
+
+    class Meta:
+        verbose_name = 'Запись поискового индекса'
+        verbose_name_plural = 'Записи поискового индекса'
+        indexes = [
+            models.Index(
+                fields=['term', 'post', 'weight'],
+                name='search_term_post_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return self.term
+
+
+class FeedEntry(models.Model):
+    """Пост автора во «входящих» подписчика (fan-out on write)."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Подписчик',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пост',
+    )
+    # Копия Post.pub_date: лента подписок читается одним диапазоном
+    # по индексу (user, pub_date) без сортировки постов
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ['-pub_date']
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи ленты подписок'
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_user_pub_date_idx',
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique feed entry'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.post} для {self.user.username}'
@@ -0,0 +1,152 @@
+"""Курсорная (keyset) пагинация лент постов.
+
+Страница выбирается не по номеру, а по позиции последней показанной
+записи: запрос получает условие ``(pub_date, id) < (x, y)`` и LIMIT,
+поэтому N-я страница стоит столько же, сколько первая, а COUNT(*)
+не выполняется вовсе.
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.core import signing
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+CURSOR_SALT = 'posts.paginator.cursor'
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, str):
+        parsed = parse_datetime(value)
+        if parsed is not None:
+            return parsed
+    return value
+
+
+def encode_cursor(values, direction, number):
+    """Упаковывает позицию в ленте в непрозрачный подписанный токен."""
+    payload = json.dumps(
+        [[_encode_value(value) for value in values], direction, number],
+        separators=(',', ':'),
+    )
+    token = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+    return signing.Signer(salt=CURSOR_SALT).sign(token)
+
+
+def decode_cursor(cursor):
+    """Возвращает (values, direction, number) или None для чужого токена."""
+    try:
+        token = signing.Signer(salt=CURSOR_SALT).unsign(cursor)
+        token += '=' * (-len(token) % 4)
+        values, direction, number = json.loads(
+            base64.urlsafe_b64decode(token.encode())
+        )
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or not isinstance(number, int):
+        return None
+    return [_decode_value(value) for value in values], direction, number
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор по ключу ``keys`` (по умолчанию ``pub_date``, ``id``).
+
+    Записи идут по убыванию ключа. Номер страницы хранится в курсоре
+    и нужен только для отображения: число страниц заранее неизвестно,
+    ``num_pages`` показывает лишь, есть ли страница после текущей.
+    """
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'id')):
+        super().__init__(object_list, per_page)
+        self.keys = tuple(keys)
+        self._num_pages = 1
+
+    @property
+    def num_pages(self):
+        return self._num_pages
+
+    def _position(self, values, lookup):
+        """Условие «строго за позицией values» для составного ключа."""
+        condition = None
+        for index, key in enumerate(self.keys):
+            step = Q(**dict(zip(self.keys[:index], values[:index])))
+            step &= Q(**{f'{key}__{lookup}': values[index]})
+            condition = step if condition is None else condition | step
+        return condition
+
+    def _values(self, obj):
+        return [getattr(obj, key) for key in self.keys]
+
+    def _ordered(self, descending=True):
+        sign = '-' if descending else ''
+        return self.object_list.order_by(*(sign + key for key in self.keys))
+
+    def _build_page(self, items, number, has_previous, has_next):
+        self._num_pages = number + 1 if has_next else number
+        page = Page(items, number, self)
+        page.previous_cursor = None
+        page.next_cursor = None
+        if items and has_previous:
+            page.previous_cursor = encode_cursor(
+                self._values(items[0]), PREVIOUS, number - 1
+            )
+        if items and has_next:
+            page.next_cursor = encode_cursor(
+                self._values(items[-1]), NEXT, number + 1
+            )
+        return page
+
+    def page_by_number(self, number):
+        """Страница по номеру: OFFSET без COUNT(*), для старых ссылок."""
+        try:
+            number = max(int(number), 1)
+        except (TypeError, ValueError):
+            number = 1
+        bottom = (number - 1) * self.per_page
+        items = list(self._ordered()[bottom:bottom + self.per_page + 1])
+        if not items and number > 1:
+            return self.page_by_number(1)
+        return self._build_page(
+            items[:self.per_page],
+            number,
+            has_previous=number > 1,
+            has_next=len(items) > self.per_page,
+        )
+
+    def get_cursor_page(self, cursor=None, number=None):
+        """Страница по курсору; без курсора — по номеру или первая."""
+        position = decode_cursor(cursor) if cursor else None
+        if position is None or len(position[0]) != len(self.keys):
+            return self.page_by_number(number)
+        values, direction, number = position
+        if direction == NEXT:
+            queryset = self._ordered().filter(self._position(values, 'lt'))
+            items = list(queryset[:self.per_page + 1])
+            has_more = len(items) > self.per_page
+            items = items[:self.per_page]
+            has_previous, has_next = True, has_more
+            number = max(number, 2)
+        else:
+            queryset = self._ordered(descending=False).filter(
+                self._position(values, 'gt')
+            )
+            items = list(queryset[:self.per_page + 1])
+            has_more = len(items) > self.per_page
+            items = items[:self.per_page][::-1]
+            has_previous, has_next = has_more, True
+            # Дошли до начала ленты — это первая страница, что бы ни
+            # было записано в курсоре.
+            number = max(number, 2) if has_more else 1
+        if not items:
+            return self.page_by_number(1)
+        return self._build_page(items, number, has_previous, has_next)
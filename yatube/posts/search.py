@@ -0,0 +1,235 @@
+"""Полнотекстовый поиск по постам и комментариям.
+
+Текст разбивается на слова, слова приводятся к основе стеммером
+Портера для русского языка (Snowball), и основы записываются в
+инвертированный индекс ``SearchEntry``: основа → пост с весом. Поиск
+читает только строки индекса с основами запроса и ранжирует посты по
+сумме весов, умноженных на IDF основы (редкие слова важнее).
+"""
+import math
+import re
+from collections import Counter
+
+from django.core.cache import cache
+from django.db.models import (Case, Count, F, IntegerField, Sum, Value,
+                              When)
+
+from .models import Comment, Post, SearchEntry
+
+# Ключ курсорной пагинации результатов поиска
+SEARCH_KEYS = ('score', 'id')
+# Слово из текста поста весит больше, чем из комментария к нему
+TEXT_WEIGHT = 2
+COMMENT_WEIGHT = 1
+MAX_QUERY_TERMS = 8
+BATCH_SIZE = 1000
+DOCUMENTS_KEY = 'search:documents'
+DOCUMENTS_TIMEOUT = 60 * 10
+
+WORD = re.compile(r'[0-9a-zа-яё]+')
+STOP_WORDS = frozenset((
+    'а', 'без', 'бы', 'в', 'во', 'вот', 'все', 'вы', 'да', 'для', 'до',
+    'его', 'ее', 'её', 'если', 'же', 'за', 'и', 'из', 'или', 'им', 'их',
+    'к', 'как', 'ли', 'мне', 'мы', 'на', 'над', 'не', 'нет', 'ни', 'но',
+    'о', 'об', 'он', 'она', 'они', 'от', 'по', 'под', 'при', 'с', 'со',
+    'так', 'там', 'то', 'тот', 'ты', 'у', 'уже', 'что', 'это', 'я',
+))
+
+RV = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+PERFECTIVE_GERUND = re.compile(
+    r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$'
+)
+REFLEXIVE = re.compile(r'(с[яь])$')
+ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|'
+    r'ую|юю|ая|яя|ою|ею)$'
+)
+PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|'
+    r'ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|'
+    r'((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|'
+    r'ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+DERIVATIONAL_ENDING = re.compile(r'ость?$')
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+
+
+def stem(word):
+    """Основа русского слова по алгоритму Snowball; латиница без изменений."""
+    match = RV.match(word)
+    if match is None:
+        return word
+    start, rv = match.groups()
+    stripped = PERFECTIVE_GERUND.sub('', rv, 1)
+    if stripped == rv:
+        rv = REFLEXIVE.sub('', rv, 1)
+        stripped = ADJECTIVE.sub('', rv, 1)
+        if stripped != rv:
+            rv = PARTICIPLE.sub('', stripped, 1)
+        else:
+            stripped = VERB.sub('', rv, 1)
+            rv = NOUN.sub('', rv, 1) if stripped == rv else stripped
+    else:
+        rv = stripped
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    if DERIVATIONAL.match(rv):
+        rv = DERIVATIONAL_ENDING.sub('', rv, 1)
+    if rv.endswith('ь'):
+        rv = rv[:-1]
+    else:
+        rv = SUPERLATIVE.sub('', rv, 1)
+        if rv.endswith('нн'):
+            rv = rv[:-1]
+    return start + rv
+
+
+def terms(text):
+    """Основы слов текста без стоп-слов, с повторами."""
+    result = []
+    for word in WORD.findall(text.lower().replace('ё', 'е')):
+        if word in STOP_WORDS:
+            continue
+        result.append(stem(word) if 'а' <= word[0] <= 'я' else word)
+    return [term[:SearchEntry.TERM_LENGTH] for term in result if term]
+
+
+def _entries(post_id, text, weight, comment_id=None):
+    return [
+        SearchEntry(
+            term=term,
+            post_id=post_id,
+            comment_id=comment_id,
+            weight=count * weight,
+        )
+        for term, count in Counter(terms(text)).items()
+    ]
+
+
+def index_post(post):
+    """Переиндексирует текст поста (комментарии не трогает)."""
+    SearchEntry.objects.filter(post=post, comment__isnull=True).delete()
+    SearchEntry.objects.bulk_create(_entries(post.pk, post.text, TEXT_WEIGHT))
+
+
+def index_comment(comment):
+    SearchEntry.objects.filter(comment=comment).delete()
+    SearchEntry.objects.bulk_create(
+        _entries(comment.post_id, comment.text, COMMENT_WEIGHT, comment.pk)
+    )
+
+
+def rebuild_index():
+    """Строит индекс заново; возвращает число проиндексированных текстов."""
+    SearchEntry.objects.all().delete()
+    indexed = 0
+    sources = (
+        (Post.objects.values_list('pk', 'text'), TEXT_WEIGHT, False),
+        (
+            Comment.objects.values_list('post_id', 'text', 'pk'),
+            COMMENT_WEIGHT,
+            True,
+        ),
+    )
+    for rows, weight, is_comment in sources:
+        batch = []
+        for row in rows.iterator():
+            comment_id = row[2] if is_comment else None
+            batch.extend(_entries(row[0], row[1], weight, comment_id))
+            indexed += 1
+            if len(batch) >= BATCH_SIZE:
+                SearchEntry.objects.bulk_create(batch)
+                batch = []
+        SearchEntry.objects.bulk_create(batch)
+    cache.delete(DOCUMENTS_KEY)
+    return indexed
+
+
+def _idf(query_terms):
+    """Целочисленный IDF основ запроса (BM25, умноженный на 1000)."""
+    documents = cache.get_or_set(
+        DOCUMENTS_KEY, Post.objects.count, DOCUMENTS_TIMEOUT
+    )
+    frequencies = dict(
+        SearchEntry.objects.filter(term__in=query_terms)
+        .values('term')
+        .annotate(posts=Count('post', distinct=True))
+        .values_list('term', 'posts')
+    )
+    return {
+        term: int(1000 * math.log(
+            (documents - frequencies.get(term, 0) + 0.5)
+            / (frequencies.get(term, 0) + 0.5)
+            + 1
+        ))
+        for term in query_terms
+    }
+
+
+def query_terms(query):
+    """Различные основы слов запроса, не больше MAX_QUERY_TERMS."""
+    return list(dict.fromkeys(terms(query)))[:MAX_QUERY_TERMS]
+
+
+def search_posts(query):
+    """Посты, содержащие все слова запроса, с рангом в поле score.
+
+    Слово может встретиться в тексте поста или в комментарии к нему.
+    Ранг целочисленный, поэтому по (score, id) работает курсорная
+    пагинация.
+    """
+    wanted = query_terms(query)
+    if not wanted:
+        return Post.objects.annotate(
+            score=Value(0, output_field=IntegerField())
+        ).none()
+    idf = _idf(wanted)
+    found = Post.objects.filter(
+        search_entries__term__in=wanted
+    ).annotate(
+        score=Sum(
+            Case(
+                *(
+                    When(
+                        search_entries__term=term,
+                        then=F('search_entries__weight') * value,
+                    )
+                    for term, value in idf.items()
+                ),
+                output_field=IntegerField(),
+            )
+        ),
+        matched=Count('search_entries__term', distinct=True),
+    ).filter(matched=len(wanted)).order_by('-score', '-id')
+    # When над связью делает JOIN с индексом внешним, и SQLite тогда
+    # перебирает все посты. Фильтр по term и так отбрасывает посты без
+    # строк индекса, поэтому JOIN возвращается во внутренний: план
+    # начинается с поиска основ по индексу
+    found.query.demote_joins([
+        alias for alias, join in found.query.alias_map.items()
+        if join.table_name == SearchEntry._meta.db_table
+    ])
+    return found
+
+
+def filter_posts(queryset, query):
+    """Сужает queryset постов до найденных по индексу."""
+    return queryset.filter(pk__in=search_posts(query).values('pk'))
+
+
+def filter_comments(queryset, query):
+    """Сужает queryset комментариев до содержащих все слова запроса."""
+    wanted = query_terms(query)
+    if not wanted:
+        return queryset.none()
+    found = SearchEntry.objects.filter(
+        term__in=wanted, comment__isnull=False
+    ).values('comment').annotate(
+        matched=Count('term', distinct=True)
+    ).filter(matched=len(wanted)).values('comment')
+    return queryset.filter(pk__in=found)
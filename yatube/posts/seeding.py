@@ -0,0 +1,182 @@
+"""Генерация больших наборов данных для замеров производительности.
+
+Записи создаются через ``bulk_create`` пачками, поэтому сигналы не
+срабатывают; счётчики, ленты подписок и поисковый индекс после
+генерации строятся отдельно.
+"""
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+from faker import Faker
+
+from . import counters, feeds, search
+from .models import Comment, Follow, Group, Post, User
+
+# За сколько дней до текущего момента раскладываются даты постов
+SPAN_DAYS = 365
+
+
+@contextmanager
+def manual_pub_date():
+    """Позволяет задать дату публикации: иначе её выставит
+    auto_now_add."""
+    field = Post._meta.get_field('pub_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def chunks(objects, size):
+    chunk = []
+    for obj in objects:
+        chunk.append(obj)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _last_pk(model):
+    return model.objects.order_by('-pk').values_list(
+        'pk', flat=True
+    ).first() or 0
+
+
+def _create(model, objects, batch_size, **kwargs):
+    """Создаёт объекты пачками и возвращает queryset новых строк.
+
+    На SQLite ``bulk_create`` не возвращает id, поэтому новые строки
+    находятся по id больше прежнего максимального.
+    """
+    last = _last_pk(model)
+    for chunk in chunks(objects, batch_size):
+        model.objects.bulk_create(chunk, **kwargs)
+    return model.objects.filter(pk__gt=last)
+
+
+def _ids(model):
+    return list(model.objects.values_list('pk', flat=True))
+
+
+def seed(users=0, groups=0, posts=0, comments=0, follows=0,
+         batch_size=1000, random_seed=None, derived=True, log=None):
+    """Создаёт пользователей, группы, посты, комментарии и подписки.
+
+    Посты и комментарии достаются случайным существующим и новым
+    пользователям и группам. При derived=True затем пересчитываются
+    счётчики, ленты подписок и поисковый индекс. Возвращает число
+    созданных записей по моделям.
+    """
+    log = log or (lambda message: None)
+    rng = random.Random(random_seed)
+    fake = Faker('ru_RU')
+    fake.seed_instance(random_seed)
+    now = timezone.now()
+    span = int(timedelta(days=SPAN_DAYS).total_seconds())
+
+    log(f'Пользователи: {users}')
+    first_user = _last_pk(User)
+    _create(
+        User,
+        (
+            User(
+                username=f'{fake.user_name()}_{first_user + i}',
+                first_name=fake.first_name(),
+                last_name=fake.last_name(),
+                password='!',
+            )
+            for i in range(users)
+        ),
+        batch_size,
+    )
+    user_ids = _ids(User)
+    if not user_ids:
+        raise ValueError('Нет пользователей для постов')
+
+    log(f'Группы: {groups}')
+    first_group = _last_pk(Group)
+    _create(
+        Group,
+        (
+            Group(
+                title=fake.sentence(nb_words=3)[:200],
+                slug=f'group-{first_group + i}',
+                description=fake.paragraph(),
+            )
+            for i in range(groups)
+        ),
+        batch_size,
+    )
+    group_ids = _ids(Group)
+
+    log(f'Посты: {posts}')
+    with manual_pub_date():
+        _create(
+            Post,
+            (
+                Post(
+                    text=fake.paragraph(nb_sentences=5),
+                    author_id=rng.choice(user_ids),
+                    group_id=rng.choice(group_ids) if (
+                        group_ids and rng.random() < 0.7
+                    ) else None,
+                    pub_date=now - timedelta(seconds=rng.randrange(span)),
+                    updated=now,
+                )
+                for _ in range(posts)
+            ),
+            batch_size,
+        )
+    post_ids = _ids(Post)
+
+    log(f'Комментарии: {comments}')
+    created_comments = _create(
+        Comment,
+        (
+            Comment(
+                post_id=rng.choice(post_ids),
+                author_id=rng.choice(user_ids),
+                text=fake.sentence(),
+            )
+            for _ in range(comments if post_ids else 0)
+        ),
+        batch_size,
+    )
+
+    log(f'Подписки: {follows}')
+
+    def follow_pairs():
+        for _ in range(follows if len(user_ids) > 1 else 0):
+            user_id, author_id = rng.sample(user_ids, 2)
+            yield Follow(user_id=user_id, author_id=author_id)
+
+    created_follows = _create(
+        Follow, follow_pairs(), batch_size, ignore_conflicts=True
+    )
+
+    if derived:
+        log('Счётчики')
+        counters.reconcile()
+        feeds.sync_pull_modes()
+        log('Ленты подписок')
+        # Новые посты могли достаться и авторам прежних подписок
+        for user_id, author_id in Follow.objects.values_list(
+            'user_id', 'author_id'
+        ).iterator():
+            feeds.fill_feed(user_id, author_id)
+        log('Поисковый индекс')
+        search.rebuild_index()
+        cache.clear()
+    return {
+        'users': users,
+        'groups': groups,
+        'posts': posts,
+        'comments': created_comments.count(),
+        'follows': created_follows.count(),
+    }
@@ -0,0 +1,226 @@
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+from django.urls import NoReverseMatch, reverse
+
+from . import counters, feeds, images, search, storage
+from .cache import invalidate_feeds
+from .cards import invalidate_cards
+from .models import Comment, Follow, Group, Post, User, UserCounter
+
+
+def feed_path(name, **kwargs):
+    try:
+        return reverse(name, kwargs=kwargs)
+    except NoReverseMatch:
+        # У ленты нет адреса (например, slug не по шаблону URL),
+        # значит, нет и её страниц в кэше
+        return None
+
+
+def group_path(slug):
+    return feed_path('posts:group_list', slug=slug) if slug else None
+
+
+def profile_path(username):
+    return feed_path('posts:profile', username=username)
+
+
+def invalidate(*paths):
+    invalidate_feeds({path for path in paths if path})
+
+
+def invalidate_post_feeds(post, previous_group_slug=None):
+    """Сбрасывает кэш лент, в которых показан пост."""
+    invalidate(
+        reverse('posts:index'),
+        profile_path(post.author.username),
+        group_path(post.group.slug if post.group_id else None),
+        group_path(previous_group_slug),
+    )
+
+
+def invalidate_posts(posts):
+    """Сбрасывает карточки постов из queryset posts и кэш их лент.
+
+    Нужна после update(), который не шлёт сигналов.
+    """
+    invalidate_cards(posts)
+    authors_groups = list(
+        posts.values_list('author__username', 'group__slug').distinct()
+    )
+    invalidate(
+        reverse('posts:index'),
+        *(profile_path(username) for username, _ in authors_groups),
+        *(group_path(slug) for _, slug in authors_groups),
+    )
+
+
+def describe_image(post):
+    """Заполняет размеры и заглушку новой картинки, пока она в памяти."""
+    image = post.image
+    if not image:
+        post.image_width = post.image_height = None
+        post.image_placeholder = ''
+    elif not image._committed:
+        (
+            post.image_width, post.image_height, post.image_placeholder
+        ) = images.describe(image.file)
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields, **kwargs):
+    """Запоминает прежнее имя пользователя.
+
+    Страница профиля закэширована и под прежним именем.
+    """
+    instance._previous_username = None
+    if not instance.pk or (
+        update_fields is not None and 'username' not in update_fields
+    ):
+        return
+    instance._previous_username = User.objects.filter(
+        pk=instance.pk
+    ).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    if created:
+        UserCounter.objects.get_or_create(user=instance)
+        return
+    if update_fields and set(update_fields) <= {'last_login', 'password'}:
+        # Вход и смена пароля не меняют того, что видно в лентах
+        return
+    # Имя автора показано на карточках его постов
+    invalidate_cards(instance.posts.all())
+    group_slugs = Group.objects.filter(
+        posts__author=instance
+    ).values_list('slug', flat=True).distinct()
+    previous_username = getattr(instance, '_previous_username', None)
+    invalidate(
+        reverse('posts:index'),
+        profile_path(instance.username),
+        profile_path(previous_username) if previous_username else None,
+        *(group_path(slug) for slug in group_slugs),
+    )
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, **kwargs):
+    """Запоминает прежние группу и картинку поста.
+
+    Ленту прежней группы тоже надо сбросить, а со старой картинки —
+    снять ссылку. Для новой картинки записываются размеры и заглушка.
+    """
+    instance._previous_group_slug = None
+    instance._previous_image = None
+    if instance.pk:
+        previous = Post.objects.filter(pk=instance.pk).values_list(
+            'group__slug', 'image'
+        ).first()
+        if previous is not None:
+            (
+                instance._previous_group_slug, instance._previous_image
+            ) = previous
+    describe_image(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, update_fields, **kwargs):
+    """Раскладывает новый пост по лентам подписчиков."""
+    if created:
+        counters.bump_user(instance.author_id, posts_count=1)
+        feeds.fan_out_post(instance)
+    previous_image = getattr(instance, '_previous_image', None)
+    if instance.image.name != previous_image:
+        storage.acquire(instance.image.name)
+        storage.release(previous_image)
+    if not update_fields or 'text' in update_fields:
+        search.index_post(instance)
+    invalidate_post_feeds(
+        instance, getattr(instance, '_previous_group_slug', None)
+    )
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, posts_count=-1)
+    storage.release(instance.image.name)
+    invalidate_post_feeds(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, update_fields, **kwargs):
+    if created:
+        counters.bump_post(instance.post_id, comments_count=1)
+    if not update_fields or 'text' in update_fields:
+        search.index_comment(instance)
+    # На карточках постов в лентах показано число комментариев
+    invalidate_post_feeds(instance.post)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_post(instance.post_id, comments_count=-1)
+    post = Post.objects.filter(pk=instance.post_id).first()
+    if post is not None:
+        invalidate_post_feeds(post)
+
+
+@receiver(pre_save, sender=Group)
+def group_saving(sender, instance, **kwargs):
+    instance._previous_slug = None
+    if instance.pk:
+        instance._previous_slug = Group.objects.filter(
+            pk=instance.pk
+        ).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, **kwargs):
+    """Сбрасывает ленту группы и главную со ссылками на группу."""
+    invalidate_cards(instance.posts.all())
+    invalidate(
+        reverse('posts:index'),
+        group_path(instance.slug),
+        group_path(getattr(instance, '_previous_slug', None)),
+    )
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    # Посты останутся без группы обновлением без смены метки изменения
+    invalidate_cards(instance.posts.all())
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    invalidate(reverse('posts:index'), group_path(instance.slug))
+
+
+def invalidate_follow_profiles(follow):
+    """Сбрасывает профили со счётчиками подписок и кнопкой подписки."""
+    invalidate(
+        profile_path(follow.author.username),
+        profile_path(follow.user.username),
+    )
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.author_id, followers_count=1)
+        counters.bump_user(instance.user_id, following_count=1)
+        feeds.followed(instance.author_id)
+        feeds.fill_feed(instance.user_id, instance.author_id)
+        invalidate_follow_profiles(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, followers_count=-1)
+    counters.bump_user(instance.user_id, following_count=-1)
+    feeds.clear_feed(instance.user_id, instance.author_id)
+    feeds.unfollowed(instance.author_id)
+    invalidate_follow_profiles(instance)
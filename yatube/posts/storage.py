@@ -0,0 +1,229 @@
+"""Хранилище картинок постов, адресуемое по содержимому.
+
+Имя файла — SHA-256 его содержимого, файл лежит во вложенных каталогах
+по первым символам хэша: ``posts/ab/cd/abcd….jpg``. Так в одном
+каталоге не скапливаются все загрузки, а одинаковые картинки хранятся
+одним файлом. Рядом с картинкой хранится её вариант в WebP. Сколько
+постов ссылаются на файл, считает ``ImageBlob``; строка без ссылок
+означает, что файл ждёт удаления после фиксации транзакции.
+"""
+import hashlib
+import logging
+import os
+import re
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+logger = logging.getLogger(__name__)
+
+# Уровни вложенности и число символов хэша на уровень
+SHARD_DEPTH = 2
+SHARD_WIDTH = 2
+SHARDED_NAME = re.compile(
+    r'(^|/)' + r'[0-9a-f]{%d}/' % SHARD_WIDTH * SHARD_DEPTH
+    + r'[0-9a-f]{64}(\.\w+)?$'
+)
+
+
+def content_hash(content):
+    """SHA-256 содержимого файла, прочитанного по частям."""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sharded_name(name, digest):
+    """Имя файла по хэшу в каталоге исходного имени."""
+    directory = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    shards = [
+        digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH]
+        for i in range(SHARD_DEPTH)
+    ]
+    return '/'.join(
+        part for part in (directory, *shards, digest + extension) if part
+    )
+
+
+def is_sharded(name):
+    return bool(SHARDED_NAME.search(name))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, которое не пишет уже сохранённое содержимое.
+
+    Ссылку на сохранённый файл нужно учесть через acquire() в той же
+    транзакции, что и save(): до её фиксации файл не удалится.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = sharded_name(name, content_hash(content))
+        with transaction.atomic(savepoint=False):
+            # Сначала строка, потом файл: remove_unused() стирает файл,
+            # только удалив эту строку в своей транзакции
+            lock(name)
+            if self.exists(name):
+                return name
+            name = super().save(name, content, max_length=max_length)
+        self.save_variants(name)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # Имя по хэшу занято только тем же содержимым: суффикс не нужен
+        if is_sharded(name):
+            return name
+        return super().get_available_name(name, max_length=max_length)
+
+    def _save(self, name, content):
+        if not is_sharded(name):
+            return super()._save(name, content)
+        # Одно и то же содержимое могут сохранять одновременно: файл
+        # пишется во временный и подменяется целиком
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        temp_path = '{}.{}.tmp'.format(full_path, uuid.uuid4().hex)
+        try:
+            fd = os.open(temp_path, self.OS_OPEN_FLAGS, 0o666)
+            with open(fd, 'wb') as temp:
+                for chunk in content.chunks():
+                    temp.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, full_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return name
+
+    def save_variants(self, name):
+        """Пишет рядом с картинкой name её вариант в WebP."""
+        from .images import to_webp, webp_name
+
+        variant = webp_name(name)
+        if variant is None or self.exists(variant):
+            return
+        try:
+            with self.open(name) as original:
+                content = to_webp(original)
+        except Exception:
+            logger.exception('Не удалось сделать WebP для %s', name)
+            return
+        # Имя варианта выводится из имени картинки, а не из хэша
+        FileSystemStorage.save(self, variant, content)
+
+
+def lock(name):
+    """Блокирует строку ImageBlob файла name до конца транзакции."""
+    from .models import ImageBlob
+
+    ImageBlob.objects.filter(name=name).update(refcount=F('refcount'))
+
+
+def acquire(name, count=1):
+    """Учитывает count новых ссылок постов на файл name."""
+    from .models import ImageBlob
+
+    if not name:
+        return
+    updated = ImageBlob.objects.filter(name=name).update(
+        refcount=F('refcount') + count
+    )
+    if not updated:
+        _, created = ImageBlob.objects.get_or_create(
+            name=name, defaults={'refcount': count}
+        )
+        if not created:
+            ImageBlob.objects.filter(name=name).update(
+                refcount=F('refcount') + count
+            )
+
+
+def release(name):
+    """Снимает ссылку на файл name; файл без ссылок удаляется после
+    фиксации."""
+    from .models import ImageBlob
+
+    if not name:
+        return
+    ImageBlob.objects.filter(name=name, refcount__gt=0).update(
+        refcount=F('refcount') - 1
+    )
+    if ImageBlob.objects.filter(name=name, refcount=0).exists():
+        transaction.on_commit(lambda: remove_unused(name))
+
+
+def remove_unused(name):
+    """Удаляет файл name, если на него так и не появилось ссылок.
+
+    Строка ImageBlob без ссылок удаляется условием refcount=0, и файл
+    стирается в той же транзакции. save() блокирует ту же строку до
+    проверки файла и учитывает ссылку в своей транзакции, поэтому
+    либо удаление не найдёт строку без ссылок, либо save() увидит,
+    что файла уже нет, и запишет его заново.
+    """
+    from .models import ImageBlob
+
+    with transaction.atomic():
+        deleted, _ = ImageBlob.objects.filter(name=name, refcount=0).delete()
+        if deleted:
+            remove_file(name)
+
+
+def remove_file(name):
+    """Удаляет файл вместе с его вариантом и миниатюрами."""
+    from sorl.thumbnail import delete
+
+    from .images import webp_name
+    from .models import Post
+
+    try:
+        variant = webp_name(name)
+        if variant is not None:
+            Post._meta.get_field('image').storage.delete(variant)
+        delete(name)
+    except Exception:
+        logger.exception('Не удалось удалить файл %s', name)
+
+
+def reshard(name, storage):
+    """Переносит файл name в хранилище по хэшу вместе с его постами.
+
+    Возвращает число постов, перешедших на новый файл, или None, если
+    исходного файла нет.
+    """
+    from django.db.models.functions import Now
+
+    from .models import ImageBlob, Post
+    from .signals import invalidate_posts
+
+    if not storage.exists(name):
+        return None
+    with transaction.atomic():
+        with storage.open(name) as content:
+            new_name = storage.save(name, content)
+        posts = Post.objects.filter(image=name)
+        # update() не шлёт сигналов, поэтому кэш лент и карточки
+        # сбрасываются здесь, пока посты ещё находятся по старому имени
+        invalidate_posts(posts)
+        moved = posts.update(image=new_name, updated=Now())
+        if new_name == name:
+            ImageBlob.objects.filter(name=name).delete()
+        else:
+            # Старый файл ждёт удаления, как после release()
+            ImageBlob.objects.update_or_create(
+                name=name, defaults={'refcount': 0}
+            )
+            transaction.on_commit(lambda: remove_unused(name))
+        acquire(new_name, moved)
+    return moved
@@ -0,0 +1,33 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from ..cache import hole_marker
+from ..models import Follow
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, **params):
+    """Фрагмент с данными пользователя.
+
+    На кэшируемой странице вместо фрагмента ставится метка, которую
+    cache_feed заполняет для каждого запроса, на остальных фрагмент
+    рендерится сразу. Фрагмент видит только params, request и user.
+    """
+    params = {key: str(value) for key, value in params.items()}
+    request = context.get('request')
+    if getattr(request, 'punch_holes', False):
+        return mark_safe(hole_marker(name, params))
+    fragment = context.template.engine.get_template(name)
+    with context.push(**params):
+        return fragment.render(context)
+
+
+@register.simple_tag(takes_context=True)
+def is_following(context, author_id):
+    """Подписан ли текущий пользователь на автора."""
+    user = context.get('user')
+    if user is None or not user.is_authenticated:
+        return False
+    return Follow.objects.filter(user=user, author_id=author_id).exists()
@@ -0,0 +1,17 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from ..cards import render_cards
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, page_obj):
+    """Карточки постов страницы, собранные из кэша фрагментов."""
+    cards, complete = render_cards(list(page_obj))
+    request = context.get('request')
+    if not complete and request is not None:
+        # Страница с оригиналами вместо миниатюр не кэшируется
+        request.page_incomplete = True
+    return [mark_safe(card) for card in cards]
@@ -0,0 +1,83 @@
+import io
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase
+from posts.benchmarks import percentile, regressions
+from posts.models import (Comment, FeedEntry, Follow, Group, Post,
+                          SearchEntry, User)
+from posts.seeding import seed
+
+
+class SeedTest(TestCase):
+    """Тесты генерации данных для замеров."""
+    def test_seed_creates_records_and_derived_data(self):
+        """Генерация создаёт записи, счётчики, ленты и индекс."""
+        created = seed(
+            users=5, groups=2, posts=30, comments=20, follows=6,
+            random_seed=1,
+        )
+        self.assertEqual(User.objects.count(), 5)
+        self.assertEqual(Group.objects.count(), 2)
+        self.assertEqual(Post.objects.count(), 30)
+        self.assertEqual(Comment.objects.count(), 20)
+        self.assertEqual(Follow.objects.count(), created['follows'])
+        author = User.objects.filter(posts__isnull=False).first()
+        self.assertEqual(author.counters.posts_count, author.posts.count())
+        follow = Follow.objects.first()
+        self.assertEqual(
+            FeedEntry.objects.filter(user=follow.user_id).count(),
+            Post.objects.filter(
+                author__following__user=follow.user_id
+            ).count(),
+        )
+        self.assertTrue(SearchEntry.objects.exists())
+
+    def test_seed_without_derived_data(self):
+        """С derived=False ленты и индекс не строятся."""
+        seed(users=3, posts=5, follows=2, derived=False)
+        self.assertEqual(Post.objects.count(), 5)
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertFalse(SearchEntry.objects.exists())
+
+
+class BenchmarkViewsTest(TestCase):
+    """Тесты замеров страниц."""
+    def test_percentile(self):
+        """Перцентиль считается по ближайшему рангу."""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_regressions(self):
+        """Замедлением считается рост p95 больше допустимого."""
+        baseline = {'views': {'a': {'p95_ms': 10}, 'b': {'p95_ms': 10}}}
+        result = {'views': {'a': {'p95_ms': 11}, 'b': {'p95_ms': 13}}}
+        self.assertEqual(
+            regressions(result, baseline, 1.2), [('b', 10, 13)]
+        )
+
+    def test_command_writes_json(self):
+        """Команда пишет перцентили и число запросов по страницам."""
+        seed(users=3, groups=1, posts=10, comments=5, follows=2)
+        Post.objects.update(group=Group.objects.first())
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'benchmark.json')
+            call_command(
+                'benchmark_views', requests=3, output=output,
+                stdout=io.StringIO(),
+            )
+            with open(output, encoding='utf-8') as result:
+                data = json.load(result)
+        self.assertEqual(data['meta']['dataset']['posts'], 10)
+        self.assertIn('posts:index', data['views'])
+        self.assertIn('posts:follow_index', data['views'])
+        for view in data['views'].values():
+            self.assertEqual(view['requests'], 3)
+            self.assertEqual(view['errors'], 0)
+            for key in ('p50_ms', 'p95_ms', 'p99_ms', 'queries'):
+                self.assertIn(key, view)
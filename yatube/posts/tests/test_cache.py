@@ -0,0 +1,288 @@
+import threading
+import time
+
+from core import metrics
+from core.testing import capture_on_commit_callbacks
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from posts.cache import (LOCK_KEY, VERSION_KEY, cache_feed, page_key,
+                         rewarm)
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class FeedCacheTest(TestCase):
+    """Тесты кэша лент с версионными ключами."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовый текст',
+            description='Тестовое описание',
+            slug='test-slug',
+        )
+        cls.post = Post.objects.create(
+            text='Тестовый пост',
+            author=cls.user,
+            group=cls.group,
+        )
+        cls.feeds = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_feed_pages_are_cached(self):
+        """Повторный запрос ленты отдаётся из кэша без запросов к БД."""
+        for url in self.feeds:
+            with self.subTest(url=url):
+                self.guest_client.get(url)
+                with self.assertNumQueries(0):
+                    response = self.guest_client.get(url)
+                # Рендерятся только фрагменты с данными пользователя
+                self.assertNotIn('page_obj', response.context or {})
+                self.assertContains(response, 'Тестовый пост')
+
+    def test_new_post_invalidates_feeds(self):
+        """Новый пост сразу виден во всех его лентах."""
+        for url in self.feeds:
+            self.guest_client.get(url)
+        with capture_on_commit_callbacks(execute=True):
+            Post.objects.create(
+                text='Свежий пост', author=self.user, group=self.group
+            )
+        for url in self.feeds:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), 'Свежий пост')
+
+    def test_comment_invalidates_feeds(self):
+        """Новый комментарий обновляет счётчик на карточках лент."""
+        for url in self.feeds:
+            self.guest_client.get(url)
+        with capture_on_commit_callbacks(execute=True):
+            Comment.objects.create(
+                text='Комментарий', author=self.user, post=self.post
+            )
+        for url in self.feeds:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertIn('page_obj', response.context)
+                self.assertContains(response, 'Комментариев: 1')
+
+    def test_group_change_invalidates_group_feed(self):
+        """Изменение группы сбрасывает кэш её ленты."""
+        url = reverse('posts:group_list', kwargs={'slug': 'test-slug'})
+        self.guest_client.get(url)
+        self.group.title = 'Новое название'
+        with capture_on_commit_callbacks(execute=True):
+            self.group.save()
+        self.assertContains(self.guest_client.get(url), 'Новое название')
+
+    def test_cyrillic_profile_is_invalidated(self):
+        """Новый пост виден в кэшированном профиле с кириллическим
+        именем."""
+        author = User.objects.create_user(username='иван')
+        url = reverse('posts:profile', kwargs={'username': 'иван'})
+        self.guest_client.get(url)
+        with capture_on_commit_callbacks(execute=True):
+            Post.objects.create(text='Пост Ивана', author=author)
+        self.assertContains(self.guest_client.get(url), 'Пост Ивана')
+
+    def test_username_change_invalidates_old_profile(self):
+        """Смена имени пользователя сбрасывает профиль под прежним
+        именем."""
+        url = reverse('posts:profile', kwargs={'username': 'auth'})
+        self.guest_client.get(url)
+        user = User.objects.get(pk=self.user.pk)
+        user.username = 'renamed'
+        with capture_on_commit_callbacks(execute=True):
+            user.save()
+        self.assertEqual(self.guest_client.get(url).status_code, 404)
+
+    def test_version_bumped_after_commit(self):
+        """Версия ленты меняется только после фиксации транзакции."""
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        key = VERSION_KEY.format(url)
+        version = cache.get(key)
+        with capture_on_commit_callbacks() as callbacks:
+            Post.objects.create(text='Свежий пост', author=self.user)
+        self.assertEqual(cache.get(key), version)
+        self.assertNotContains(self.guest_client.get(url), 'Свежий пост')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(cache.get(key), version + 1)
+        self.assertContains(self.guest_client.get(url), 'Свежий пост')
+
+    def test_rewarm_builds_first_page(self):
+        """Прогрев кладёт первую страницу ленты в кэш."""
+        url = reverse('posts:index')
+        rewarm([url])
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url)
+        self.assertContains(response, 'Тестовый пост')
+
+
+class StampedeTest(TestCase):
+    """Тесты перестройки страниц лент одним запросом."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        Post.objects.create(text='Тестовый пост', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.clear()
+        self.url = reverse('posts:index')
+        self.lock = LOCK_KEY.format(
+            page_key(RequestFactory().get(self.url), 'index_page')
+        )
+
+    def assertCounted(self, line):
+        self.assertIn(line, metrics.render(metrics.registry.snapshot()))
+
+    def test_stale_page_while_other_rebuilds(self):
+        """Пока страницу строит другой запрос, отдаётся прежняя."""
+        self.client.get(self.url)
+        with capture_on_commit_callbacks(execute=True):
+            Post.objects.create(text='Свежий пост', author=self.user)
+        cache.add(self.lock, 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertNotContains(response, 'Свежий пост')
+        self.assertCounted(
+            'yatube_cache_coalesced_total'
+            '{cache="index_page",outcome="stale"} 1'
+        )
+        cache.delete(self.lock)
+        self.assertContains(self.client.get(self.url), 'Свежий пост')
+        self.assertCounted(
+            'yatube_cache_rebuilds_total'
+            '{cache="index_page",reason="stale"} 1'
+        )
+
+    @override_settings(FEED_CACHE_LOCK_WAIT=0.1)
+    def test_builds_without_cache_when_wait_times_out(self):
+        """Без прежней страницы запрос ждёт и строит её сам."""
+        cache.add(self.lock, 1)
+        self.assertContains(self.client.get(self.url), 'Тестовый пост')
+        self.assertCounted(
+            'yatube_cache_coalesced_total'
+            '{cache="index_page",outcome="timeout"} 1'
+        )
+        cache.delete(self.lock)
+        self.assertIn('page_obj', self.client.get(self.url).context)
+
+    @override_settings(FEED_CACHE_EARLY_BETA=10 ** 9)
+    def test_early_refresh(self):
+        """Долго строящаяся страница перестраивается до срока."""
+        self.client.get(self.url)
+        self.assertIn('page_obj', self.client.get(self.url).context)
+        self.assertCounted(
+            'yatube_cache_rebuilds_total'
+            '{cache="index_page",reason="early"} 1'
+        )
+
+    def test_concurrent_requests_build_once(self):
+        """Одновременные запросы пустой страницы строят её один раз."""
+        calls = []
+
+        @cache_feed(key_prefix='slow_page')
+        def slow_view(request):
+            calls.append(1)
+            time.sleep(0.2)
+            return HttpResponse('страница')
+
+        responses = []
+
+        def fetch():
+            responses.append(slow_view(RequestFactory().get('/slow/')))
+
+        threads = [threading.Thread(target=fetch) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(
+            [response.content.decode() for response in responses],
+            ['страница'] * 5,
+        )
+        self.assertCounted(
+            'yatube_cache_coalesced_total'
+            '{cache="slow_page",outcome="waited"} 4'
+        )
+
+
+class HolePunchTest(TestCase):
+    """Тесты общей страницы ленты с фрагментами пользователя."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.reader = User.objects.create_user(username='reader')
+        Post.objects.create(text='Тестовый пост', author=cls.author)
+        Follow.objects.create(user=cls.follower, author=cls.author)
+        cls.profile = reverse('posts:profile', args=('author',))
+
+    def setUp(self):
+        cache.clear()
+        self.clients = {}
+        for user in (self.follower, self.reader):
+            self.clients[user.username] = Client()
+            self.clients[user.username].force_login(user)
+
+    def test_users_share_cached_page(self):
+        """Страница строится один раз, шапка у каждого своя."""
+        url = reverse('posts:index')
+        first = self.clients['follower'].get(url)
+        self.assertIn('page_obj', first.context)
+        self.assertContains(first, 'Пользователь: follower')
+        second = self.clients['reader'].get(url)
+        self.assertNotIn('page_obj', second.context)
+        self.assertContains(second, 'Пользователь: reader')
+        self.assertNotContains(second, 'follower')
+        guest = Client().get(url)
+        self.assertContains(guest, 'Регистрация')
+        self.assertNotContains(guest, 'Пользователь:')
+
+    def test_follow_button_per_user(self):
+        """Кнопка подписки на общей странице профиля своя у каждого."""
+        self.assertContains(
+            self.clients['follower'].get(self.profile), 'Отписаться'
+        )
+        # Сессия, пользователь и подписка
+        with self.assertNumQueries(3):
+            response = self.clients['reader'].get(self.profile)
+        self.assertContains(response, 'Подписаться')
+        self.assertNotContains(response, 'Отписаться')
+
+    def test_markers_stay_in_cache(self):
+        """В кэше страница с метками, в ответе их нет."""
+        response = self.clients['reader'].get(self.profile)
+        self.assertNotContains(response, '<!--hole:')
+        request = RequestFactory().get(self.profile)
+        entry = cache.get(page_key(request, 'profile_page'))
+        self.assertEqual(
+            [name for name, params in entry[1].holes],
+            [b'includes/header.html', b'posts/includes/follow_button.html'],
+        )
+
+    def test_error_page_has_no_markers(self):
+        """Страница 404 из кэшируемого view рендерится целиком."""
+        response = self.clients['reader'].get(
+            reverse('posts:profile', args=('nobody',))
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertNotContains(response, '<!--hole:', status_code=404)
@@ -0,0 +1,69 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from posts.cards import render_cards
+from posts.models import Group, Post
+
+User = get_user_model()
+
+
+class PostCardCacheTest(TestCase):
+    """Тесты кэша карточек постов."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='auth', first_name='Лев', last_name='Толстой'
+        )
+        cls.group = Group.objects.create(
+            title='Тестовый текст',
+            description='Тестовое описание',
+            slug='test-slug',
+        )
+        for i in range(3):
+            Post.objects.create(
+                text=f'Пост № {i}', author=cls.user, group=cls.group
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def cards(self):
+        cards, _ = render_cards(list(Post.objects.select_related()))
+        return cards
+
+    def test_cards_are_read_with_one_get_many(self):
+        """Страница карточек читается из кэша одним get_many."""
+        first = self.cards()
+        with mock.patch.object(
+            cache, 'get_many', wraps=cache.get_many
+        ) as get_many, mock.patch(
+            'posts.cards.render_to_string'
+        ) as render:
+            self.assertEqual(self.cards(), first)
+        get_many.assert_called_once()
+        render.assert_not_called()
+
+    def test_post_change_renders_new_card(self):
+        """Изменённый пост получает новую карточку."""
+        self.cards()
+        post = Post.objects.first()
+        post.text = 'Изменённый пост'
+        post.save()
+        self.assertIn('Изменённый пост', self.cards()[0])
+
+    def test_group_change_invalidates_cards(self):
+        """Смена slug группы меняет ссылки в карточках."""
+        self.cards()
+        self.group.slug = 'new-slug'
+        self.group.save()
+        self.assertTrue(all('/group/new-slug/' in c for c in self.cards()))
+
+    def test_author_change_invalidates_cards(self):
+        """Смена имени автора видна в карточках его постов."""
+        self.cards()
+        self.user.first_name = 'Алексей'
+        self.user.save()
+        self.assertTrue(all('Алексей Толстой' in c for c in self.cards()))
@@ -0,0 +1,124 @@
+import gzip
+import re
+from unittest import skipIf
+
+from core import compression, metrics
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase
+from django.urls import reverse
+from posts.models import Post
+
+User = get_user_model()
+
+
+class CompressedResponseTest(TestCase):
+    """Тесты склейки сжатых кусков страницы с фрагментами."""
+    def test_gzip_stitches_fragments(self):
+        """Склеенный поток gzip распаковывается в полную страницу."""
+        holes = re.compile(rb'<(\w+)>')
+        page = compression.CompressedResponse(
+            HttpResponse(b'head ' * 100 + b'<one> middle <two>' + b'tail'),
+            holes,
+        )
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        response = page.render(request, lambda name: name.upper() * 3)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            gzip.decompress(response.content),
+            b'head ' * 100 + b'ONEONEONE middle TWOTWOTWO' + b'tail',
+        )
+
+    def test_identity_without_accept_encoding(self):
+        """Клиенту без gzip уходит распакованная страница."""
+        page = compression.CompressedResponse(
+            HttpResponse(b'<a>text'), re.compile(rb'<(\w)>')
+        )
+        response = page.render(RequestFactory().get('/'), lambda name: b'A')
+        self.assertEqual(response.content, b'Atext')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_refused_encoding(self):
+        """gzip;q=0 означает отказ от gzip."""
+        request = RequestFactory().get(
+            '/', HTTP_ACCEPT_ENCODING='gzip;q=0, identity'
+        )
+        self.assertIsNone(compression.choose_encoding(request, ('gzip',)))
+
+    @skipIf(compression.brotli is None, 'пакет brotli не установлен')
+    def test_brotli_without_fragments(self):
+        """Страница без фрагментов хранится и в brotli."""
+        page = compression.CompressedResponse(HttpResponse(b'text ' * 100))
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='br, gzip')
+        response = page.render(request)
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(
+            compression.brotli.decompress(response.content), b'text ' * 100
+        )
+
+
+class CompressionTest(TestCase):
+    """Тесты сжатия ответов."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        Post.objects.create(text='Тестовый пост ' * 20, author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.clear()
+        self.client = Client(HTTP_ACCEPT_ENCODING='gzip')
+        self.client.force_login(self.user)
+
+    def test_cached_feed_page_is_gzipped(self):
+        """Страница ленты из кэша сжата и содержит фрагменты
+        пользователя."""
+        url = reverse('posts:index')
+        plain = Client()
+        plain.force_login(self.user)
+        expected = plain.get(url).content
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        content = gzip.decompress(response.content)
+        self.assertEqual(content, expected)
+        self.assertIn('Пользователь: reader'.encode(), content)
+        self.assertLess(len(response.content), len(content))
+
+    def test_uncached_page_is_compressed(self):
+        """Страницы вне кэша сжимает middleware."""
+        response = self.client.get(reverse('about:author'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'<html', gzip.decompress(response.content))
+
+    def test_page_with_csrf_token_is_not_compressed(self):
+        """Страница с токеном CSRF не сжимается."""
+        response = self.client.get(reverse('posts:post_create'))
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_savings_in_metrics(self):
+        """Байты до и после сжатия видны в метриках."""
+        self.client.get(reverse('posts:index'))
+        snapshot = metrics.registry.snapshot()
+        for stage in ('cache', 'response'):
+            with self.subTest(stage=stage):
+                counted = {
+                    name: value
+                    for name, labels, value in self.counters(snapshot)
+                    if labels == {'stage': stage, 'encoding': 'gzip'}
+                }
+                self.assertLess(
+                    counted['yatube_compression_output_bytes_total'],
+                    counted['yatube_compression_input_bytes_total'],
+                )
+
+    def counters(self, snapshot):
+        text = metrics.render(snapshot)
+        for line in text.splitlines():
+            match = re.match(r'(yatube_compression_\w+)\{(.*)\} (\S+)', line)
+            if match:
+                labels = dict(re.findall(r'(\w+)="([^"]*)"', match.group(2)))
+                yield match.group(1), labels, float(match.group(3))
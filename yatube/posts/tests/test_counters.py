@@ -0,0 +1,132 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+from posts.models import Comment, Follow, Post, UserCounter
+
+User = get_user_model()
+
+
+class CountersTest(TestCase):
+    """Тесты денормализованных счётчиков."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def counters(self, user):
+        return UserCounter.objects.get(user=user)
+
+    def test_post_and_comment_counters(self):
+        """Создание и удаление постов и комментариев меняют счётчики."""
+        post = Post.objects.create(text='Тестовый пост', author=self.user)
+        comment = Comment.objects.create(
+            text='Тестовый комментарий', author=self.reader, post=post
+        )
+        post.refresh_from_db()
+        self.assertEqual(self.counters(self.user).posts_count, 1)
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        post.delete()
+        self.assertEqual(self.counters(self.user).posts_count, 0)
+
+    def test_stale_save_keeps_comments_count(self):
+        """Сохранение поста, загруженного до комментария, не сбрасывает
+        счётчик."""
+        post = Post.objects.create(text='Тестовый пост', author=self.user)
+        stale = Post.objects.get(pk=post.pk)
+        Comment.objects.create(
+            text='Тестовый комментарий', author=self.reader, post=post
+        )
+        stale.text = 'Исправленный пост'
+        stale.save()
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Исправленный пост')
+        self.assertEqual(post.comments_count, 1)
+
+    def test_follow_counters(self):
+        """Подписка и отписка меняют счётчики обоих пользователей."""
+        follow = Follow.objects.create(user=self.reader, author=self.user)
+        self.assertEqual(self.counters(self.user).followers_count, 1)
+        self.assertEqual(self.counters(self.reader).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.counters(self.user).followers_count, 0)
+        self.assertEqual(self.counters(self.reader).following_count, 0)
+
+    def test_user_with_posts_and_follows_is_deleted(self):
+        """Удаление пользователя с постами, комментариями и подписками
+        не создаёт ему новую строку счётчиков."""
+        user = User.objects.create_user(username='leaving')
+        post = Post.objects.create(text='Пост', author=user)
+        other = Post.objects.create(text='Чужой пост', author=self.user)
+        Comment.objects.create(text='Свой', author=user, post=post)
+        Comment.objects.create(text='Чужой', author=user, post=other)
+        Comment.objects.create(text='Гость', author=self.reader, post=post)
+        Follow.objects.create(user=self.reader, author=user)
+        Follow.objects.create(user=user, author=self.user)
+        user.delete()
+        connection.check_constraints()
+        self.assertFalse(UserCounter.objects.filter(user_id=user.pk).exists())
+        other.refresh_from_db()
+        self.assertEqual(other.comments_count, 0)
+        self.assertEqual(self.counters(self.user).followers_count, 0)
+        self.assertEqual(self.counters(self.reader).following_count, 0)
+
+    def test_profile_shows_counters_without_count_queries(self):
+        """Профиль показывает число постов без COUNT(*) по постам."""
+        Post.objects.create(text='Тестовый пост', author=self.user)
+        response = self.guest_client.get(
+            reverse('posts:profile', kwargs={'username': 'auth'})
+        )
+        self.assertContains(response, 'Всего постов: 1')
+        self.assertEqual(
+            response.context['author'].counters.posts_count, 1
+        )
+
+    def test_reconcile_repairs_drift(self):
+        """Команда reconcile_counters исправляет разошедшиеся счётчики."""
+        post = Post.objects.create(text='Тестовый пост', author=self.user)
+        Comment.objects.create(
+            text='Тестовый комментарий', author=self.reader, post=post
+        )
+        UserCounter.objects.filter(user=self.user).update(posts_count=7)
+        UserCounter.objects.filter(user=self.reader).delete()
+        Post.objects.filter(pk=post.pk).update(comments_count=0)
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        post.refresh_from_db()
+        self.assertEqual(self.counters(self.user).posts_count, 1)
+        self.assertTrue(UserCounter.objects.filter(user=self.reader).exists())
+        self.assertEqual(post.comments_count, 1)
+        self.assertIn('Исправлено постов: 1', out.getvalue())
+
+    def test_reconcile_batches_fit_query_params(self):
+        """Пачки reconcile не превышают лимит переменных в запросе."""
+        for i in range(6):
+            User.objects.create_user(username=f'user{i}')
+            Post.objects.create(text='Тестовый пост', author=self.user)
+        UserCounter.objects.update(posts_count=7)
+        UserCounter.objects.exclude(user=self.user).delete()
+        Post.objects.update(comments_count=3)
+        params = []
+
+        def record(execute, sql, sql_params, many, context):
+            params.append(len(sql_params or ()))
+            return execute(sql, sql_params, many, context)
+
+        with mock.patch.object(connection.features, 'max_query_params', 12):
+            with connection.execute_wrapper(record):
+                call_command('reconcile_counters', stdout=StringIO())
+        self.assertLessEqual(max(params), 12)
+        self.assertEqual(self.counters(self.user).posts_count, 6)
+        self.assertFalse(Post.objects.exclude(comments_count=0).exists())
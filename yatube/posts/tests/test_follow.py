@@ -1,7 +1,13 @@
+from datetime import timedelta
+from unittest import mock
+
+from core.testing import capture_on_commit_callbacks
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
-from posts.models import Follow, Group, Post
+from django.utils import timezone
+from posts import feeds
+from posts.models import FeedEntry, Follow, Group, Post
 
 User = get_user_model()
 
@@ -76,3 +82,108 @@ class FollowTest(TestCase):
         response = self.authorized_client_2.get(reverse('posts:follow_index'))
         post_cnt = len(response.context.get('page_obj'))
         self.assertEqual(post_cnt, 0)
+
+
+class FeedEntryTest(TestCase):
+    """Тесты материализованной ленты подписок."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='follower')
+        cls.author = User.objects.create_user(username='author')
+        cls.star = User.objects.create_user(username='star')
+        cls.fan = User.objects.create_user(username='fan')
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def inbox(self, author):
+        return FeedEntry.objects.filter(user=self.user, post__author=author)
+
+    def feed_texts(self):
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        return [post.text for post in response.context['page_obj']]
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост попадает во входящие подписчиков автора."""
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.user, post=post).exists()
+        )
+        self.assertEqual(self.feed_texts(), ['Новый пост'])
+
+    def test_follow_fills_and_unfollow_clears_feed(self):
+        """Подписка дописывает старые посты, отписка их убирает."""
+        Post.objects.create(text='Старый пост', author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(self.feed_texts(), ['Старый пост'])
+        Follow.objects.get(user=self.user, author=self.author).delete()
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+        self.assertEqual(self.feed_texts(), [])
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_popular_author_is_pulled_on_read(self):
+        """Посты автора с большим числом подписчиков читаются напрямую."""
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.user, author=self.star)
+        Follow.objects.create(user=self.fan, author=self.star)
+        Post.objects.create(text='Пост автора', author=self.author)
+        Post.objects.create(text='Пост звезды', author=self.star)
+        self.assertFalse(
+            FeedEntry.objects.filter(post__author=self.star).exists()
+        )
+        self.assertEqual(self.feed_texts(), ['Пост звезды', 'Пост автора'])
+
+    @override_settings(
+        FEED_FANOUT_LIMIT=2, FEED_FANOUT_RESUME=1, FEED_BACKFILL_WORKERS=0
+    )
+    def test_author_below_resume_is_fanned_out(self):
+        """Посты автора, которого читали напрямую, раскладываются после
+        фиксации, когда подписчиков не больше FEED_FANOUT_RESUME."""
+        for user in (self.user, self.fan, self.author):
+            Follow.objects.create(user=user, author=self.star)
+        Post.objects.create(text='Пост звезды', author=self.star)
+        Follow.objects.get(user=self.fan, author=self.star).delete()
+        self.assertTrue(feeds.is_pull_author(self.star.pk))
+        with capture_on_commit_callbacks(execute=True):
+            Follow.objects.get(user=self.author, author=self.star).delete()
+            self.assertFalse(self.inbox(self.star).exists())
+        self.assertFalse(feeds.is_pull_author(self.star.pk))
+        self.assertTrue(self.inbox(self.star).exists())
+        self.assertEqual(self.feed_texts(), ['Пост звезды'])
+
+    @override_settings(
+        FEED_FANOUT_LIMIT=2, FEED_FANOUT_RESUME=1, FEED_BACKFILL_WORKERS=0
+    )
+    def test_author_between_thresholds_stays_pulled(self):
+        """Между FEED_FANOUT_RESUME и FEED_FANOUT_LIMIT автор не
+        переключается на каждой подписке и отписке."""
+        for user in (self.user, self.fan, self.author):
+            Follow.objects.create(user=user, author=self.star)
+        with mock.patch.object(feeds, 'backfill') as backfill:
+            with capture_on_commit_callbacks(execute=True):
+                for _ in range(2):
+                    Follow.objects.get(
+                        user=self.fan, author=self.star
+                    ).delete()
+                    Follow.objects.create(user=self.fan, author=self.star)
+        backfill.assert_not_called()
+        self.assertTrue(feeds.is_pull_author(self.star.pk))
+
+    @override_settings(FEED_FANOUT_LIMIT=1, FEED_FANOUT_RESUME=1)
+    def test_backfill_covers_posts_since_pull(self):
+        """Обратная раскладка не трогает посты, написанные до перехода
+        автора в режим pull."""
+        Follow.objects.create(user=self.user, author=self.star)
+        old = Post.objects.create(text='Старый пост', author=self.star)
+        Post.objects.filter(pk=old.pk).update(
+            pub_date=timezone.now() - timedelta(hours=1)
+        )
+        self.inbox(self.star).delete()
+        Follow.objects.create(user=self.fan, author=self.star)
+        Post.objects.create(text='Пост звезды', author=self.star)
+        Follow.objects.get(user=self.fan, author=self.star).delete()
+        self.assertEqual(feeds.backfill(self.star.pk), 1)
+        self.assertEqual(self.feed_texts(), ['Пост звезды'])
@@ -1,3 +1,4 @@
+import hashlib
 import shutil
 import tempfile
 
@@ -7,12 +8,20 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from posts.forms import PostForm
+from posts.images import normalize
 from posts.models import Comment, Group, Post
+from posts.storage import sharded_name
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
+def stored_name(name, content):
+    """Имя, под которым хранилище сохранит загруженную картинку."""
+    normalized = normalize(SimpleUploadedFile(name, content)).read()
+    return sharded_name(name, hashlib.sha256(normalized).hexdigest())
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostCreateFormTests(TestCase):
     @classmethod
@@ -80,10 +89,12 @@ class PostCreateFormTests(TestCase):
         )
         # Получаем последний пост из БД и проверяем его
         post = Post.objects.latest("pub_date")
+        # Картинка сохраняется обработанной, под хэшем содержимого
+        image_name = stored_name('posts/small.gif', small_gif)
         post_data = {
             post.text: form_data["text"],
             post.group.pk: form_data["group"],
-            post.image: 'posts/small.gif',
+            post.image: image_name,
         }
         for value, expectation in post_data.items():
             with self.subTest(value=value):
@@ -94,7 +105,7 @@ class PostCreateFormTests(TestCase):
         self.assertTrue(Post.objects.filter(
             text=form_data['text'],
             group=form_data['group'],
-            image='posts/small.gif',
+            image=image_name,
         ).exists())
 
     def test_post_edit(self):
@@ -136,7 +147,7 @@ class PostCreateFormTests(TestCase):
         self.assertTrue(Post.objects.filter(
             text=form_data['text'],
             group=form_data['group'],
-            image='posts/small_2.gif',
+            image=stored_name('posts/small_2.gif', small_gif_2),
         ).exists())
 
     def test_add_comment(self):
@@ -0,0 +1,184 @@
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from core.testing import capture_on_commit_callbacks
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from posts.cache import feed_version
+from posts.images import normalize, thumbnail_size, webp_name
+from posts.models import Post
+from posts.thumbnails import build_thumbnails
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+# Тег EXIF с ориентацией снимка; значение 6 — повёрнут на 90°
+ORIENTATION = 0x0112
+
+
+def jpeg(size, orientation=None):
+    image = Image.new('RGB', size, 'red')
+    exif = Image.Exif()
+    exif[0x010F] = 'Камера'
+    if orientation:
+        exif[ORIENTATION] = orientation
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', exif=exif.tobytes())
+    return SimpleUploadedFile('photo.jpg', buffer.getvalue(), 'image/jpeg')
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_IMAGE_MAX_SIZE=(100, 100)
+)
+class ImageIngestTest(TestCase):
+    """Тесты обработки загруженных картинок."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_normalize(self):
+        """Картинка уменьшается, поворачивается по EXIF и теряет EXIF."""
+        image = Image.open(normalize(jpeg((400, 200), orientation=6)))
+        self.assertEqual(image.format, 'JPEG')
+        self.assertEqual(image.size, (50, 100))
+        self.assertFalse(image.getexif())
+
+    def test_upload_stores_webp_variant(self):
+        """Рядом с загруженной картинкой лежит её вариант в WebP."""
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Тестовый пост', 'image': jpeg((400, 200))},
+        )
+        post = Post.objects.get()
+        storage = post.image.storage
+        self.assertEqual(Image.open(post.image).size, (100, 50))
+        with storage.open(webp_name(post.image.name)) as variant:
+            self.assertEqual(Image.open(variant).format, 'WEBP')
+
+    def test_card_offers_webp(self):
+        """Карточка предлагает браузеру миниатюру в WebP."""
+        post = Post.objects.create(
+            text='Тестовый пост', author=self.user, image=jpeg((400, 200))
+        )
+        build_thumbnails(post.image.name)
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '.webp"')
+
+    def test_card_without_thumbnail_is_not_cached(self):
+        """Без миниатюры карточка показывает оригинал, миниатюра ставится
+        в очередь, а страница ленты не кэшируется."""
+        post = Post.objects.create(
+            text='Тестовый пост', author=self.user, image=jpeg((400, 200))
+        )
+        url = reverse('posts:index')
+        with capture_on_commit_callbacks() as callbacks:
+            response = self.authorized_client.get(url)
+        self.assertContains(response, f'src="{post.image.url}"')
+        self.assertEqual(len(callbacks), 1)
+        build_thumbnails(post.image.name)
+        response = self.authorized_client.get(url)
+        self.assertContains(response, 'type="image/webp"')
+        self.assertNotContains(response, f'src="{post.image.url}"')
+
+    def test_upload_stores_dimensions_and_placeholder(self):
+        """Размеры и заглушка картинки сохраняются при загрузке."""
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Тестовый пост', 'image': jpeg((400, 200))},
+        )
+        post = Post.objects.get()
+        self.assertEqual((post.image_width, post.image_height), (100, 50))
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/jpeg;base64,')
+        )
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, post.image_placeholder)
+
+    def test_fill_image_metadata_command(self):
+        """Команда fill_image_metadata заполняет старые посты."""
+        post = Post.objects.create(
+            text='Тестовый пост', author=self.user, image=jpeg((400, 200))
+        )
+        Post.objects.filter(pk=post.pk).update(
+            image_width=None, image_height=None, image_placeholder=''
+        )
+        profile = reverse('posts:profile', args=[self.user.username])
+        version = feed_version(profile)
+        out = StringIO()
+        with capture_on_commit_callbacks(execute=True):
+            call_command('fill_image_metadata', stdout=out)
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (400, 200))
+        self.assertTrue(post.image_placeholder)
+        self.assertIn('Заполнено постов: 1', out.getvalue())
+        self.assertNotEqual(feed_version(profile), version)
+
+    def test_thumbnail_size_from_stored_dimensions(self):
+        """Размер миниатюры считается по размерам оригинала, как в sorl."""
+        cases = {
+            ('960x339', 'center', True, 100, 50): (960, 339),
+            ('960x339', 'center', False, 100, 50): (100, 50),
+            ('960x339', None, False, 1920, 960): (678, 339),
+            ('960x339', None, False, 100, 50): (100, 50),
+        }
+        for (geometry, crop, upscale, width, height), size in cases.items():
+            with self.subTest(geometry=geometry, crop=crop, upscale=upscale):
+                self.assertEqual(
+                    thumbnail_size(
+                        width, height, geometry, crop=crop, upscale=upscale
+                    ),
+                    size,
+                )
+        self.assertIsNone(thumbnail_size(None, None, '960x339'))
+
+    def test_pages_use_stored_dimensions(self):
+        """Карточка и страница поста берут размеры из поста, а страница
+        поста без готовой миниатюры не открывает файл."""
+        Post.objects.create(
+            text='Тестовый пост', author=self.user, image=jpeg((400, 200))
+        )
+        self.assertContains(
+            self.authorized_client.get(reverse('posts:index')),
+            'width="960" height="339"',
+        )
+        # Миниатюры этой картинки нет, а файл удалён
+        post = Post.objects.create(
+            text='Тестовый пост', author=self.user, image=jpeg((200, 200))
+        )
+        post.image.storage.delete(post.image.name)
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', args=(post.pk,))
+        )
+        self.assertContains(response, f'src="{post.image.url}"')
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertContains(response, 'aspect-ratio: 960 / 339')
+        self.assertIsNone(response.context['thumbnail'])
+        Post.objects.filter(pk=post.pk).update(
+            image_width=None, image_height=None
+        )
+        post.refresh_from_db()
+        self.assertNotContains(
+            self.authorized_client.get(
+                reverse('posts:post_detail', args=(post.pk,))
+            ),
+            'height="339"',
+        )
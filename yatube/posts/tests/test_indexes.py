@@ -0,0 +1,30 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from posts.models import Post
+
+
+class FeedIndexesTest(TestCase):
+    """Тесты составных индексов лент."""
+
+    def test_feed_queries_use_indexes(self):
+        """Ленты читаются по индексу без сортировки во временном дереве."""
+        for queryset in (
+            Post.objects.order_by('-pub_date', '-id'),
+            Post.objects.filter(author_id=1).order_by('-pub_date', '-id'),
+            Post.objects.filter(group_id=1).order_by('-pub_date', '-id'),
+        ):
+            with self.subTest(query=str(queryset.query)):
+                plan = queryset[:11].explain()
+                self.assertIn('pub_date_idx', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_benchmark_command(self):
+        """Команда benchmark_indexes сравнивает планы и откатывает данные."""
+        out = StringIO()
+        call_command('benchmark_indexes', posts=200, repeat=1, stdout=out)
+        self.assertIn('index:', out.getvalue())
+        self.assertIn('post_pub_date_idx', out.getvalue())
+        self.assertFalse(Post.objects.exists())
+        self.assertIn('pub_date_idx', Post.objects.all()[:1].explain())
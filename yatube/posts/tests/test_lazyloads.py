@@ -0,0 +1,143 @@
+import threading
+import time
+from unittest import mock
+
+from core import lazyloads
+from core.lazyloads import LazyLoadError, detect_lazy_loads
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.template.loader import get_template, render_to_string
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from posts.forms import CommentForm
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+@override_settings(LAZY_LOAD_CHECK='raise')
+class LazyLoadTest(TestCase):
+    """Тесты поиска N+1 в view и шаблонах."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой'
+        )
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        for i in range(4):
+            cls.post = Post.objects.create(
+                text=f'Пост {i}', author=cls.author, group=cls.group
+            )
+        for i in range(3):
+            Comment.objects.create(
+                post=cls.post,
+                author=cls.reader if i % 2 else cls.author,
+                text=f'Комментарий {i}',
+            )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_pages_have_no_lazy_loads(self):
+        """Ленты и страница поста загружают связанные объекты заранее."""
+        for url in (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:post_detail', args=[self.post.pk]),
+            reverse('posts:follow_index'),
+            reverse('posts:search') + '?q=пост',
+        ):
+            with self.subTest(url=url):
+                cache.clear()
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_template_lazy_load_reports_template_line(self):
+        """N+1 в шаблоне сообщает имя шаблона и строку."""
+        context = {
+            'post_number': Post.objects.select_related(
+                'author__counters', 'group'
+            ).get(pk=self.post.pk),
+            'form': CommentForm(),
+            'comments': Comment.objects.filter(post=self.post),
+        }
+        source = get_template('posts/post_detail.html').template.source
+        line = next(
+            number
+            for number, text in enumerate(source.splitlines(), 1)
+            if 'comment.author.username' in text
+        )
+        with self.assertRaisesMessage(
+            LazyLoadError, f'шаблон posts/post_detail.html, строка {line}'
+        ):
+            with detect_lazy_loads():
+                render_to_string('posts/post_detail.html', context)
+
+    def test_code_lazy_load_reports_line(self):
+        """N+1 в коде сообщает файл и строку, а в режиме log — пишет в
+        лог."""
+        with self.assertLogs('core.lazyloads', 'WARNING') as logs:
+            with detect_lazy_loads('log') as tracker:
+                names = [post.author.username for post in Post.objects.all()]
+        self.assertEqual(names, ['author'] * 4)
+        self.assertEqual(len(tracker.reported), 1)
+        self.assertIn('Post.author', logs.output[0])
+        self.assertIn('test_lazyloads.py', logs.output[0])
+
+    def test_single_object_is_not_reported(self):
+        """Загрузка связи у одного объекта — не N+1."""
+        with detect_lazy_loads() as tracker:
+            Post.objects.get(pk=self.post.pk).author.counters
+            self.post.comments.count()
+        self.assertEqual(tracker.reported, [])
+
+    def test_reverse_relations_in_loop(self):
+        """Обратные связи в цикле тоже считаются N+1."""
+        with self.assertRaisesMessage(LazyLoadError, 'User.posts'):
+            with detect_lazy_loads():
+                for user in User.objects.all():
+                    user.posts.count()
+        with self.assertRaisesMessage(LazyLoadError, 'User.counters'):
+            with detect_lazy_loads():
+                for user in User.objects.all():
+                    user.counters
+
+    def test_concurrent_install_patches_once(self):
+        """Потоки, одновременно включившие поиск, подменяют дескрипторы
+        один раз и продолжают только после подмены."""
+        barrier = threading.Barrier(4)
+        patched = threading.Event()
+        seen = []
+
+        def slow_patch():
+            time.sleep(0.05)
+            patched.set()
+
+        def start():
+            barrier.wait()
+            lazyloads.install()
+            seen.append(patched.is_set())
+
+        patch = mock.Mock(side_effect=slow_patch)
+        with mock.patch.multiple(
+            lazyloads,
+            _installed=False,
+            _patch_fetch_all=mock.DEFAULT,
+            _patch_forward=mock.DEFAULT,
+            _patch_reverse_one=mock.DEFAULT,
+            _patch_reverse_many=patch,
+        ):
+            threads = [threading.Thread(target=start) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        patch.assert_called_once()
+        self.assertEqual(seen, [True] * 4)
@@ -0,0 +1,72 @@
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase, override_settings
+from posts.loadtest import parse_mix, run
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+# При THUMBNAIL_WORKERS=0 миниатюры строятся в самом запросе, поэтому
+# бюджеты здесь не проверяются; их проверяет test_queries
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    QUERY_BUDGET_STRICT=False,
+    THUMBNAIL_WORKERS=0,
+)
+class LoadTest(TransactionTestCase):
+    """Тесты нагрузочного прогона."""
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader')
+        self.author = User.objects.create_user(username='author')
+        group = Group.objects.create(title='Группа', slug='group')
+        Follow.objects.create(user=self.user, author=self.author)
+        for i in range(3):
+            Post.objects.create(
+                text=f'Пост {i}', author=self.author, group=group
+            )
+
+    def test_parse_mix(self):
+        """Смесь сценариев задаётся весами по именам."""
+        self.assertEqual(
+            parse_mix('comment=3, upload=1'), {'comment': 3, 'upload': 1}
+        )
+        for value in ('unknown=1', 'comment=x', 'comment=0'):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    parse_mix(value)
+
+    def test_run_reports_every_url(self):
+        """Прогон проходит все сценарии и считает ответы по URL."""
+        report = run(
+            clients=1,
+            duration=60,
+            iterations=8,
+            mix={'anonymous_index': 1, 'follow_feed': 1, 'comment': 1,
+                 'upload': 1},
+            random_seed=3,
+        )
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(set(report['views']), {
+            'posts:index', 'posts:follow_index', 'posts:post_detail',
+            'posts:add_comment', 'posts:post_create',
+        })
+        view = report['views']['posts:follow_index']
+        self.assertEqual(view['statuses'], {'200': view['requests']})
+        self.assertEqual(
+            sum(view['histogram_ms'].values()), view['requests']
+        )
+        for key in ('rps', 'error_rate', 'p50_ms', 'p95_ms', 'p99_ms'):
+            self.assertIn(key, view)
+        self.assertTrue(Comment.objects.filter(author=self.user).exists())
+        self.assertTrue(Post.objects.filter(author=self.user).exists())
@@ -0,0 +1,107 @@
+import shutil
+import tempfile
+
+from core import metrics
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from posts.models import Post
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_METRICS_DIR = tempfile.mkdtemp()
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    METRICS_DIR=TEMP_METRICS_DIR,
+    THUMBNAIL_WORKERS=0,
+)
+class MetricsTest(TestCase):
+    """Тесты метрик Prometheus."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        Post.objects.create(text='Тестовый пост', author=cls.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(TEMP_METRICS_DIR, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.clear()
+        shutil.rmtree(TEMP_METRICS_DIR, ignore_errors=True)
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_requests_and_cache_are_counted(self):
+        """Запросы, статусы, число запросов к базе и кэш лент видны в
+        метриках."""
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        self.client.get('/missing-page/')
+        text = self.scrape()
+        for line in (
+            'yatube_responses_total{status="200",view="posts:index"} 2',
+            'yatube_responses_total{status="404",view="unmatched"} 1',
+            'yatube_request_duration_seconds_count{view="posts:index"} 2',
+            'yatube_request_duration_seconds_bucket'
+            '{view="posts:index",le="+Inf"} 2',
+            'yatube_cache_requests_total'
+            '{cache="index_page",result="hit"} 1',
+            'yatube_cache_requests_total'
+            '{cache="index_page",result="miss"} 1',
+            'yatube_cache_requests_total{cache="post_card",result="miss"} 1',
+            '# TYPE yatube_db_queries_per_request histogram',
+        ):
+            with self.subTest(line=line):
+                self.assertIn(line, text)
+
+    def test_upload_size_is_observed(self):
+        """Размер загруженной картинки попадает в гистограмму."""
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        self.authorized_client.post(reverse('posts:post_create'), {
+            'text': 'Пост с картинкой',
+            'image': SimpleUploadedFile('small.gif', small_gif, 'image/gif'),
+        })
+        text = self.scrape()
+        self.assertIn('yatube_image_upload_bytes_count 1', text)
+        self.assertIn(f'yatube_image_upload_bytes_sum {len(small_gif)}', text)
+
+    def test_processes_are_summed(self):
+        """Значения из файлов других процессов складываются."""
+        other = metrics.Registry()
+        other.inc('yatube_responses_total', 5, view='posts:index',
+                  status='200')
+        other.flush(TEMP_METRICS_DIR, 'other.json')
+        metrics.inc('yatube_responses_total', 2, view='posts:index',
+                    status='200')
+        self.assertIn(
+            'yatube_responses_total{status="200",view="posts:index"} 7',
+            self.scrape(),
+        )
+
+    @override_settings(METRICS_ALLOWED_IPS=())
+    def test_only_allowed_addresses(self):
+        """Метрики видны только с разрешённых адресов."""
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,110 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+from posts.models import Group, Post
+from posts.paginator import CursorPaginator, decode_cursor
+
+User = get_user_model()
+
+
+class CursorPaginatorTests(TestCase):
+    """Класс с тестами курсорного пагинатора"""
+    POSTS_ALL = 23
+    POSTS_PAGE = 10
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовый текст',
+            description='Тестовое описание',
+            slug='test-slug',
+        )
+        Post.objects.bulk_create([
+            Post(
+                text=f'Пост № {i}',
+                author=cls.user,
+                group=cls.group,
+            )
+            for i in range(cls.POSTS_ALL)
+        ])
+        cls.expected = list(
+            Post.objects.order_by('-pub_date', '-id').values_list(
+                'id', flat=True
+            )
+        )
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def walk_forward(self):
+        paginator = CursorPaginator(Post.objects.all(), self.POSTS_PAGE)
+        pages = [paginator.get_cursor_page()]
+        while pages[-1].has_next():
+            paginator = CursorPaginator(Post.objects.all(), self.POSTS_PAGE)
+            pages.append(paginator.get_cursor_page(pages[-1].next_cursor))
+        return pages
+
+    def test_forward_walk_returns_every_post_once(self):
+        """Переход по next_cursor проходит всю ленту без пропусков."""
+        pages = self.walk_forward()
+        ids = [post.id for page in pages for post in page]
+        self.assertEqual(ids, self.expected)
+        self.assertEqual([page.number for page in pages], [1, 2, 3])
+
+    def test_backward_walk_returns_same_pages(self):
+        """Переход по previous_cursor возвращает те же страницы."""
+        pages = self.walk_forward()
+        page = pages[-1]
+        while page.has_previous():
+            paginator = CursorPaginator(Post.objects.all(), self.POSTS_PAGE)
+            page = paginator.get_cursor_page(page.previous_cursor)
+            self.assertEqual(
+                [post.id for post in page],
+                [post.id for post in pages[page.number - 1]],
+            )
+        self.assertEqual(page.number, 1)
+
+    def test_page_does_not_count_rows(self):
+        """Страница по курсору строится одним запросом без COUNT(*)."""
+        first = CursorPaginator(Post.objects.all(), self.POSTS_PAGE)
+        cursor = first.get_cursor_page().next_cursor
+        paginator = CursorPaginator(Post.objects.all(), self.POSTS_PAGE)
+        with self.assertNumQueries(1):
+            page = paginator.get_cursor_page(cursor)
+            self.assertTrue(page.has_next())
+            self.assertTrue(page.has_previous())
+
+    def test_tampered_cursor_falls_back_to_first_page(self):
+        """Испорченный курсор не принимается и даёт первую страницу."""
+        cursor = self.walk_forward()[0].next_cursor
+        self.assertIsNotNone(decode_cursor(cursor))
+        self.assertIsNone(decode_cursor(cursor[:-1] + 'x'))
+        paginator = CursorPaginator(Post.objects.all(), self.POSTS_PAGE)
+        page = paginator.get_cursor_page(cursor[:-1] + 'x')
+        self.assertEqual(page.number, 1)
+
+    def test_feed_pages_follow_cursor_links(self):
+        """Ленты отдают ссылку на следующую страницу по курсору."""
+        cache.clear()
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                next_cursor = response.context['page_obj'].next_cursor
+                self.assertContains(response, 'cursor=')
+                response = self.guest_client.get(
+                    url, {'cursor': next_cursor}
+                )
+                page_obj = response.context['page_obj']
+                self.assertEqual(page_obj.number, 2)
+                self.assertEqual(
+                    [post.id for post in page_obj],
+                    self.expected[self.POSTS_PAGE:self.POSTS_PAGE * 2],
+                )
@@ -0,0 +1,66 @@
+import io
+import shutil
+import tempfile
+
+from core import profiling
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+PROFILE_DIR = tempfile.mkdtemp()
+
+
+@override_settings(PROFILE_DIR=PROFILE_DIR, PROFILE_KEEP=2)
+class ProfilingTest(TestCase):
+    """Тесты профилирования запросов по требованию."""
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(PROFILE_DIR, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(PROFILE_DIR, ignore_errors=True)
+        self.client = Client(HTTP_X_PROFILE=profiling.make_token())
+
+    def test_signed_header_profiles_request(self):
+        """Подписанный заголовок сохраняет граф вызовов и память."""
+        response = self.client.get(reverse('posts:index'))
+        name = response['X-Profile-Id']
+        summary, = profiling.list_profiles()
+        self.assertEqual(summary['name'], name)
+        self.assertEqual(summary['path'], reverse('posts:index'))
+        self.assertEqual(summary['status'], 200)
+        self.assertIsNotNone(summary['queries'])
+        out = io.StringIO()
+        call_command('profiles', 'latest', '--limit', '5', stdout=out)
+        self.assertIn(f'Граф вызовов {name}', out.getvalue())
+        self.assertIn(f'Выделения памяти {name}', out.getvalue())
+
+    def test_no_profile_without_trigger(self):
+        """Без токена или с неверной подписью профиля нет."""
+        for client in (Client(), Client(HTTP_X_PROFILE='bad')):
+            with self.subTest(client=client):
+                response = client.get(reverse('posts:index'))
+                self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(profiling.list_profiles(), [])
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_sampling(self):
+        """Запросы из выборки профилируются без токена."""
+        response = Client().get(reverse('posts:index'))
+        self.assertIn('X-Profile-Id', response)
+
+    def test_ring_is_bounded(self):
+        """Хранятся только последние PROFILE_KEEP профилей."""
+        names = [
+            self.client.get(reverse('posts:index'))['X-Profile-Id']
+            for _ in range(3)
+        ]
+        summaries = profiling.list_profiles()
+        self.assertEqual(
+            [summary['name'] for summary in summaries], names[:0:-1]
+        )
+        out = io.StringIO()
+        call_command('profiles', stdout=out)
+        self.assertNotIn(names[0], out.getvalue())
+        self.assertIn(names[2], out.getvalue())
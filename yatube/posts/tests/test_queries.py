@@ -0,0 +1,204 @@
+import shutil
+import tempfile
+
+from core.queries import QueryBudgetExceeded, query_budget
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.test import Client, TestCase, override_settings
+from django.urls import path, reverse
+from posts.models import Comment, Follow, Group, Post
+from posts.thumbnails import build_all
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def small_gif(name='small.gif'):
+    return SimpleUploadedFile(
+        name=name,
+        content=(
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        ),
+        content_type='image/gif',
+    )
+
+
+@query_budget(1)
+def greedy_view(request):
+    return HttpResponse(
+        ''.join(user.username for user in User.objects.all())
+        + ''.join(user.username for user in User.objects.all())
+    )
+
+
+def user_view(request):
+    return HttpResponse(request.user.username)
+
+
+urlpatterns = [path('greedy/', greedy_view), path('user/', user_view)]
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    QUERY_BUDGET_STRICT=True,
+    THUMBNAIL_WORKERS=0,
+)
+class QueryBudgetTest(TestCase):
+    """Страницы укладываются в бюджеты запросов при пустом кэше."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        groups = [cls.group, None]
+        for i in range(15):
+            post = Post.objects.create(
+                text=f'Пост номер {i}',
+                author=cls.author if i % 2 else cls.reader,
+                group=groups[i % 2],
+                image=small_gif(f'small_{i}.gif') if i % 3 == 0 else None,
+            )
+            for j in range(3):
+                Comment.objects.create(
+                    post=post,
+                    author=cls.reader if j % 2 else cls.author,
+                    text=f'Комментарий {j}',
+                )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        # В TestCase on_commit не срабатывает: миниатюры строятся здесь,
+        # как их построил бы фоновый пул после загрузки
+        build_all(
+            Post.objects.exclude(image='').values_list('image', flat=True),
+            workers=0,
+        )
+        cls.post = Post.objects.filter(author=cls.author).first()
+        cls.image_post = Post.objects.exclude(image='').first()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def test_pages_within_budget(self):
+        """Страницы для гостя и пользователя не превышают бюджет."""
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:index') + '?page=2',
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:post_detail', args=[self.post.pk]),
+            reverse('posts:post_detail', args=[self.image_post.pk]),
+            reverse('posts:search') + '?q=пост',
+        )
+        for client in (self.guest_client, self.authorized_client):
+            for url in pages:
+                with self.subTest(url=url):
+                    cache.clear()
+                    response = client.get(url)
+                    self.assertEqual(response.status_code, 200)
+
+    def test_user_pages_within_budget(self):
+        """Страницы пользователя и формы не превышают бюджет."""
+        for url in (
+            reverse('posts:follow_index'),
+            reverse('posts:post_create'),
+            reverse('posts:post_edit', args=[self.post.pk]),
+        ):
+            with self.subTest(url=url):
+                response = self.author_client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_actions_within_budget(self):
+        """Создание поста, комментарий и подписка не превышают бюджет."""
+        self.author_client.post(
+            reverse('posts:post_create'),
+            {'text': 'Новый пост', 'group': self.group.pk,
+             'image': small_gif('new.gif')},
+        )
+        self.author_client.post(
+            reverse('posts:post_edit', args=[self.post.pk]),
+            {'text': 'Изменённый пост', 'group': self.group.pk},
+        )
+        self.authorized_client.post(
+            reverse('posts:add_comment', args=[self.post.pk]),
+            {'text': 'Новый комментарий'},
+        )
+        self.author_client.get(
+            reverse('posts:profile_follow', args=[self.reader.username])
+        )
+        self.author_client.get(
+            reverse('posts:profile_unfollow', args=[self.reader.username])
+        )
+        self.assertTrue(Post.objects.filter(text='Новый пост').exists())
+
+    def test_pages_without_thumbnails_within_budget(self):
+        """Ленты и смена картинки укладываются в бюджет, пока миниатюры
+        не построены."""
+        post = Post.objects.filter(author=self.author).exclude(
+            image=''
+        ).first()
+        self.author_client.post(
+            reverse('posts:post_edit', args=[post.pk]),
+            {'text': 'Новая картинка', 'group': self.group.pk,
+             'image': small_gif('other.gif')},
+        )
+        for url in (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:post_detail', args=[post.pk]),
+        ):
+            with self.subTest(url=url):
+                cache.clear()
+                response = self.guest_client.get(url)
+                self.assertContains(response, 'Новая картинка')
+
+
+@override_settings(ROOT_URLCONF=__name__, QUERY_COUNT_HEADERS=True)
+class QueryCountMiddlewareTest(TestCase):
+    """Тесты учёта запросов."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        User.objects.create_user(username='auth')
+
+    @override_settings(QUERY_BUDGET_STRICT=False)
+    def test_headers(self):
+        """Число запросов, время и повторы попадают в заголовки."""
+        with self.assertLogs('core.queries', 'WARNING') as logs:
+            response = self.client.get('/greedy/')
+        self.assertEqual(response['X-Query-Count'], '2')
+        self.assertEqual(response['X-Query-Duplicates'], '1')
+        self.assertIn('X-Query-Time', response)
+        self.assertIn('2 запросов при бюджете 1', logs.output[0])
+
+    def test_session_and_user_queries_counted(self):
+        """Учитываются и запросы сессии и пользователя."""
+        self.client.force_login(User.objects.get(username='auth'))
+        response = self.client.get('/user/')
+        self.assertEqual(response['X-Query-Count'], '2')
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_strict_budget_raises(self):
+        """В строгом режиме превышение бюджета — исключение."""
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/greedy/')
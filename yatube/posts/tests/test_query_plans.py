@@ -0,0 +1,187 @@
+import json
+import os
+import re
+
+from core.slowqueries import SCAN_TABLES, explain, normalize
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+from posts import urls
+from posts.models import Follow, Group, User
+from posts.seeding import seed
+
+SNAPSHOT = os.path.join(
+    os.path.dirname(__file__), 'snapshots', 'query_plans.json'
+)
+# UPDATE_QUERY_PLANS=1 перезаписывает снимки вместо сравнения
+UPDATE = bool(os.environ.get('UPDATE_QUERY_PLANS'))
+SCAN = re.compile(r'^SCAN (\w+)(?: USING (?:COVERING )?INDEX \w+)?')
+TEMP_SORT = re.compile(r'TEMP B-TREE FOR .*ORDER BY')
+# Допущенные нарушения: (view, часть SQL, начало строки плана) → причина
+ALLOWED = {
+    (
+        'search',
+        'SELECT COUNT(*) AS "__count" FROM "posts_post"',
+        'SCAN posts_post',
+    ): 'число постов для IDF, кэшируется на DOCUMENTS_TIMEOUT',
+    (
+        'search',
+        'ORDER BY "score" DESC',
+        'USE TEMP B-TREE FOR ORDER BY',
+    ): 'ранг известен только после подсчёта, индексом его не упорядочить',
+}
+
+
+def plan_lines(rows):
+    # SQLite до 3.36 пишет «SCAN TABLE x», новые версии — «SCAN x»
+    return [re.sub(r'^(SCAN|SEARCH) TABLE ', r'\1 ', row) for row in rows]
+
+
+def violations(sql, plan):
+    """Полные просмотры больших таблиц и сортировки во временном B-дереве.
+
+    Проход по индексу с LIMIT без последующей сортировки — это чтение
+    первых строк в нужном порядке, а не полный просмотр.
+    """
+    sorted_later = any(TEMP_SORT.search(line) for line in plan)
+    found = []
+    for line in plan:
+        match = SCAN.match(line)
+        if match and match.group(1) in SCAN_TABLES:
+            ordered = (
+                line != f'SCAN {match.group(1)}' and ' LIMIT ' in sql
+                and not sorted_later
+            )
+            if not ordered:
+                found.append(line)
+        if TEMP_SORT.search(line):
+            found.append(line)
+    return found
+
+
+class QueryPlanTest(TestCase):
+    """Планы запросов страниц на заполненной базе."""
+    @classmethod
+    def setUpTestData(cls):
+        seed(
+            users=20, groups=3, posts=200, comments=200, follows=40,
+            random_seed=1,
+        )
+        follow = Follow.objects.filter(
+            user__posts__isnull=False
+        ).order_by('pk').first()
+        user = follow.user
+        post = user.posts.order_by('pk').first()
+        stranger = User.objects.exclude(
+            following__user=user
+        ).exclude(pk=user.pk).order_by('pk').first()
+        group = Group.objects.order_by('pk').first()
+        client = Client()
+        client.force_login(user)
+        requests = {
+            'index': ('get', reverse('posts:index'), None),
+            'group_posts': (
+                'get',
+                reverse('posts:group_list', args=(group.slug,)),
+                None,
+            ),
+            'profile': (
+                'get',
+                reverse('posts:profile', args=(follow.author.username,)),
+                None,
+            ),
+            'search': (
+                'get',
+                reverse('posts:search'),
+                {'q': ' '.join(post.text.split()[:2])},
+            ),
+            'post_detail': (
+                'get', reverse('posts:post_detail', args=(post.pk,)), None,
+            ),
+            'post_create': ('get', reverse('posts:post_create'), None),
+            'post_edit': (
+                'get', reverse('posts:post_edit', args=(post.pk,)), None,
+            ),
+            'add_comment': (
+                'post',
+                reverse('posts:add_comment', args=(post.pk,)),
+                {'text': 'Комментарий'},
+            ),
+            'follow_index': ('get', reverse('posts:follow_index'), None),
+            'profile_follow': (
+                'get',
+                reverse('posts:profile_follow', args=(stranger.username,)),
+                None,
+            ),
+            'profile_unfollow': (
+                'get',
+                reverse('posts:profile_unfollow', args=(stranger.username,)),
+                None,
+            ),
+        }
+        cls.plans = {}
+        for name, (method, url, data) in requests.items():
+            cache.clear()
+            cls.plans[name] = cls.capture(client, method, url, data)
+
+    @classmethod
+    def capture(cls, client, method, url, data):
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            statements.append((sql, params, many))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            getattr(client, method)(url, data)
+        plans = []
+        for sql, params, many in statements:
+            plan = [] if many else explain(connection, sql, params)
+            if plan:
+                plans.append({'sql': normalize(sql), 'plan': plan_lines(plan)})
+        return plans
+
+    def test_every_view_covered(self):
+        """План снимается для каждого view постов."""
+        views = {pattern.callback.__name__ for pattern in urls.urlpatterns}
+        self.assertEqual(set(self.plans), views)
+
+    def test_no_scans_or_temp_sorts(self):
+        """Большие таблицы читаются по индексу и без лишней сортировки."""
+        for name, plans in self.plans.items():
+            for statement in plans:
+                found = [
+                    line for line in violations(
+                        statement['sql'], statement['plan']
+                    )
+                    if not any(
+                        view == name and fragment in statement['sql']
+                        and line.startswith(prefix)
+                        for view, fragment, prefix in ALLOWED
+                    )
+                ]
+                with self.subTest(view=name, sql=statement['sql']):
+                    self.assertEqual(found, [])
+
+    def test_plans_match_snapshot(self):
+        """Планы совпадают с одобренными снимками."""
+        if UPDATE:
+            os.makedirs(os.path.dirname(SNAPSHOT), exist_ok=True)
+            with open(SNAPSHOT, 'w', encoding='utf-8') as output:
+                json.dump(
+                    self.plans, output, ensure_ascii=False, indent=2,
+                    sort_keys=True,
+                )
+                output.write('\n')
+            return
+        with open(SNAPSHOT, encoding='utf-8') as source:
+            approved = json.load(source)
+        for name, plans in self.plans.items():
+            with self.subTest(view=name):
+                self.assertEqual(
+                    plans, approved.get(name),
+                    f'План {name} изменился. Если изменение намеренное, '
+                    f'обновите снимки: UPDATE_QUERY_PLANS=1 python '
+                    f'manage.py test posts.tests.test_query_plans',
+                )
@@ -0,0 +1,84 @@
+from io import StringIO
+from urllib.parse import quote
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+from posts.models import Comment, Post, SearchEntry
+from posts.search import search_posts, stem
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+    """Тесты полнотекстового поиска."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(
+            text='Кошки спят на тёплых подоконниках', author=cls.user
+        )
+        cls.other = Post.objects.create(
+            text='Собака гуляет во дворе', author=cls.user
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_stem(self):
+        """Формы слова приводятся к одной основе."""
+        self.assertEqual(stem('кошки'), stem('кошками'))
+        self.assertEqual(stem('подоконниках'), stem('подоконник'))
+
+    def test_search_by_word_forms(self):
+        """Поиск находит пост по другой форме слова."""
+        self.assertEqual(list(search_posts('кошка подоконник')), [self.post])
+        self.assertFalse(search_posts('кошка собака').exists())
+        self.assertFalse(search_posts('и на').exists())
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при правке поста и комментарии к нему."""
+        self.other.text = 'Собака спит'
+        self.other.save()
+        self.assertFalse(search_posts('двор').exists())
+        comment = Comment.objects.create(
+            text='Рыжий кот', author=self.user, post=self.other
+        )
+        self.assertEqual(list(search_posts('рыжий')), [self.other])
+        comment.delete()
+        self.assertFalse(search_posts('рыжий').exists())
+
+    def test_ranking(self):
+        """Пост со словом в тексте выше поста со словом в комментарии."""
+        Comment.objects.create(
+            text='Здесь тоже кошки', author=self.user, post=self.other
+        )
+        self.assertEqual(list(search_posts('кошки')), [self.post, self.other])
+
+    def test_search_page_paginates(self):
+        """Страница поиска листается курсором и сохраняет запрос."""
+        Post.objects.bulk_create(
+            Post(text=f'Котята № {i}', author=self.user) for i in range(12)
+        )
+        call_command('rebuild_search_index', stdout=StringIO())
+        url = reverse('posts:search')
+        response = self.guest_client.get(url, {'q': 'котята'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), 10)
+        self.assertContains(response, f'q={quote("котята")}&cursor=')
+        response = self.guest_client.get(
+            url, {'q': 'котята', 'cursor': page_obj.next_cursor}
+        )
+        self.assertEqual(len(response.context['page_obj']), 2)
+
+    def test_rebuild_command(self):
+        """Команда rebuild_search_index строит индекс заново."""
+        SearchEntry.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Проиндексировано текстов: 2', out.getvalue())
+        self.assertEqual(list(search_posts('гулять')), [self.other])
@@ -0,0 +1,107 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from core.queries import record_queries
+from core.slowqueries import full_scans, log_slow_queries, normalize
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from posts.models import Comment, Post
+
+User = get_user_model()
+
+
+class SlowQueryLogTest(TestCase):
+    """Тесты журнала медленных запросов."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        post = Post.objects.create(text='Тестовый пост', author=cls.user)
+        Comment.objects.create(post=post, author=cls.user, text='Комментарий')
+        cls.log_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.log_dir, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def records(self, logs):
+        return [json.loads(line.split(':', 2)[2]) for line in logs.output]
+
+    def test_normalize(self):
+        """Литералы и списки IN сводятся к одному виду."""
+        self.assertEqual(
+            normalize(
+                'SELECT * FROM "t1" WHERE "a" IN (%s, %s,  %s)\n'
+                "AND \"b\" = 'it''s' LIMIT 21"
+            ),
+            'SELECT * FROM "t1" WHERE "a" IN (...) AND "b" = ? LIMIT ?',
+        )
+
+    def test_full_scans(self):
+        """Полным просмотром считается SCAN без индекса."""
+        plan = [
+            'SCAN posts_comment',
+            'SCAN TABLE posts_follow',
+            'SCAN posts_post USING INDEX post_pub_date_idx',
+            'SCAN auth_user',
+            'SEARCH posts_post USING INTEGER PRIMARY KEY (rowid=?)',
+        ]
+        self.assertEqual(full_scans(plan), ['posts_comment', 'posts_follow'])
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_request_queries_logged_with_view_and_plan(self):
+        """Запросы страницы пишутся с view, стеком и планом."""
+        with self.assertLogs('core.slowqueries') as logs:
+            self.client.get(reverse('posts:index'))
+        posts = [
+            record for record in self.records(logs)
+            if 'FROM "posts_post"' in record['sql']
+        ]
+        self.assertTrue(posts)
+        self.assertEqual(posts[0]['view'], 'posts.views.index')
+        self.assertTrue(posts[0]['plan'])
+        self.assertTrue(posts[0]['stack'])
+
+    def test_fast_queries_not_logged(self):
+        """Запросы быстрее порога в журнал не попадают."""
+        with self.assertRaises(AssertionError):
+            with self.assertLogs('core.slowqueries'):
+                self.client.get(reverse('posts:index'))
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_explain_not_counted(self):
+        """EXPLAIN не попадает в счётчик запросов."""
+        with record_queries() as recorder, log_slow_queries():
+            with self.assertLogs('core.slowqueries'):
+                list(Post.objects.all())
+        self.assertEqual(recorder.count, 1)
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_command_highlights_full_scans(self):
+        """Команда складывает повторы и отмечает полный просмотр."""
+        with log_slow_queries('shell'):
+            with self.assertLogs('core.slowqueries') as logs:
+                for text in ('a', 'b', 'c'):
+                    Comment.objects.filter(text__contains=text).count()
+        path = os.path.join(self.log_dir, 'slow.log')
+        # Первая запись уже ушла в ротированную копию
+        lines = [line.split(':', 2)[2] + '\n' for line in logs.output]
+        with open(path + '.1', 'w', encoding='utf-8') as rotated:
+            rotated.writelines(lines[:1])
+        with open(path, 'w', encoding='utf-8') as current:
+            current.writelines(lines[1:])
+        out = io.StringIO()
+        call_command('slow_queries', '--log', path, stdout=out)
+        self.assertIn('3 раз', out.getvalue())
+        self.assertIn('ПОЛНЫЙ ПРОСМОТР posts_comment', out.getvalue())
+        self.assertIn('view: shell', out.getvalue())
@@ -0,0 +1,147 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from posts.cache import feed_version
+from posts.models import ImageBlob, Post
+from posts.storage import is_sharded, remove_unused
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTest(TransactionTestCase):
+    """Тесты хранилища картинок по хэшу содержимого.
+
+    Файлы удаляются после фиксации транзакции, поэтому тесты идут
+    без общей транзакции.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.storage = Post._meta.get_field('image').storage
+
+    def create_post(self, name='small.gif'):
+        return Post.objects.create(
+            text='Тестовый пост',
+            author=self.user,
+            image=SimpleUploadedFile(name, SMALL_GIF, 'image/gif'),
+        )
+
+    def test_identical_uploads_share_one_file(self):
+        """Одинаковые картинки хранятся одним файлом в подкаталогах."""
+        first = self.create_post('first.gif')
+        second = self.create_post('second.gif')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(is_sharded(first.image.name))
+        self.assertRegex(first.image.name, r'^posts/\w\w/\w\w/\w{64}\.gif$')
+        self.assertEqual(
+            ImageBlob.objects.get(name=first.image.name).refcount, 2
+        )
+
+    def test_file_removed_with_last_reference(self):
+        """Файл удаляется вместе с последним ссылающимся постом."""
+        first = self.create_post()
+        second = self.create_post()
+        name = first.image.name
+        first.delete()
+        self.assertTrue(self.storage.exists(name))
+        second.delete()
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+
+    def test_file_kept_when_referenced_before_commit(self):
+        """Файл остаётся, если до фиксации на него снова сослался пост."""
+        name = self.create_post().image.name
+        with transaction.atomic():
+            Post.objects.get().delete()
+            self.create_post('again.gif')
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(ImageBlob.objects.get(name=name).refcount, 1)
+
+    def test_file_kept_when_uploaded_before_removal(self):
+        """Загрузка, отдавшая имя файла без ссылок, спасает его от
+        отложенного удаления."""
+        name = self.create_post().image.name
+        with mock.patch('posts.storage.remove_unused'):
+            Post.objects.get().delete()
+        self.assertEqual(ImageBlob.objects.get(name=name).refcount, 0)
+        self.create_post('again.gif')
+        remove_unused(name)
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(ImageBlob.objects.get(name=name).refcount, 1)
+
+    def test_file_rewritten_after_removal(self):
+        """Загрузка после удаления файла записывает его заново."""
+        name = self.create_post().image.name
+        with mock.patch('posts.storage.remove_unused'):
+            Post.objects.get().delete()
+        remove_unused(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertEqual(self.create_post('again.gif').image.name, name)
+        self.assertTrue(self.storage.exists(name))
+
+    def test_concurrent_save_keeps_content_name(self):
+        """Повторная запись того же содержимого не получает суффикс."""
+        name = self.storage.save('posts/first.gif', ContentFile(SMALL_GIF))
+        # Второе сохранение, тоже не заставшее файл на диске
+        again = FileSystemStorage.save(
+            self.storage, name, ContentFile(SMALL_GIF)
+        )
+        self.assertEqual(again, name)
+        directory = self.storage.path(os.path.dirname(name))
+        self.assertEqual(
+            [
+                entry for entry in os.listdir(directory)
+                if not entry.endswith('.webp')
+            ],
+            [os.path.basename(name)],
+        )
+
+    def test_reshard_command(self):
+        """Команда переносит старые файлы в подкаталоги по хэшу."""
+        # Файл в старом плоском каталоге posts/
+        old_name = FileSystemStorage().save(
+            'posts/old.gif', ContentFile(SMALL_GIF)
+        )
+        post = Post.objects.create(
+            text='Старый пост', author=self.user, image=old_name
+        )
+        profile = reverse('posts:profile', args=[self.user.username])
+        version = feed_version(profile)
+        out = StringIO()
+        call_command('reshard_post_images', batch_size=1, stdout=out)
+        post.refresh_from_db()
+        self.assertTrue(is_sharded(post.image.name))
+        self.assertTrue(self.storage.exists(post.image.name))
+        self.assertFalse(self.storage.exists(old_name))
+        self.assertEqual(
+            ImageBlob.objects.get(name=post.image.name).refcount, 1
+        )
+        self.assertIn('Перенесено файлов: 1', out.getvalue())
+        self.assertNotEqual(feed_version(profile), version)
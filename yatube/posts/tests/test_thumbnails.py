@@ -0,0 +1,118 @@
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from posts.models import Post
+from posts.thumbnails import (build_thumbnails, get_thumbnails,
+                              thumbnail_specs)
+from sorl.thumbnail import default, get_thumbnail
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailsTest(TestCase):
+    """Тесты построения миниатюр заранее."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Одинаковые картинки разных тестов — один файл, а записи sorl
+        # в кэше переживают откат транзакции теста
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def create_post(self):
+        return Post.objects.create(
+            text='Тестовый пост',
+            author=self.user,
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'),
+        )
+
+    def test_template_reads_prebuilt_thumbnail(self):
+        """После построения заранее шаблон не строит миниатюру сам."""
+        post = self.create_post()
+        self.assertEqual(
+            build_thumbnails(post.image.name), len(thumbnail_specs())
+        )
+        with mock.patch.object(default.engine, 'create') as create:
+            for geometry, options in thumbnail_specs():
+                get_thumbnail(post.image.name, geometry, **options)
+        create.assert_not_called()
+
+    def test_page_thumbnails_are_read_in_one_query(self):
+        """Готовые миниатюры страницы читаются одним запросом к базе."""
+        names = [self.create_post().image.name for _ in range(3)]
+        for name in names:
+            build_thumbnails(name)
+        geometry, options = settings.POST_THUMBNAILS[0]
+        expected = {
+            name: get_thumbnail(name, geometry, **options).url
+            for name in names
+        }
+        cache.clear()
+        with mock.patch.object(default.engine, 'create') as create, \
+                self.assertNumQueries(1):
+            thumbnails = get_thumbnails(names, geometry, **options)
+        create.assert_not_called()
+        self.assertEqual(
+            {name: thumb.url for name, thumb in thumbnails.items()}, expected
+        )
+        with self.assertNumQueries(0):
+            get_thumbnails(names, geometry, **options)
+
+    def test_missing_thumbnail_is_built(self):
+        """Отсутствующая миниатюра строится на месте."""
+        name = self.create_post().image.name
+        geometry, options = settings.POST_THUMBNAILS[0]
+        thumbnail = get_thumbnails([name], geometry, **options)[name]
+        self.assertTrue(thumbnail.exists())
+
+    def test_upload_schedules_thumbnails(self):
+        """Создание поста с картинкой ставит миниатюры в очередь."""
+        with mock.patch('posts.views.schedule_thumbnails') as schedule:
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={
+                    'text': 'Тестовый пост',
+                    'image': SimpleUploadedFile(
+                        'small.gif', SMALL_GIF, 'image/gif'
+                    ),
+                },
+            )
+        post = Post.objects.get()
+        schedule.assert_called_once_with([post.image.name])
+
+    def test_backfill_command(self):
+        """Команда build_thumbnails строит миниатюры старых картинок."""
+        self.create_post()
+        out = StringIO()
+        call_command('build_thumbnails', workers=0, stdout=out)
+        self.assertIn(
+            f'Построено миниатюр: {len(thumbnail_specs())}', out.getvalue()
+        )
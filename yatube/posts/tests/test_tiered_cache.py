@@ -0,0 +1,131 @@
+import multiprocessing
+import os
+
+from core.cache import SQLiteCache, TieredCache
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.test import Client, TestCase
+from django.urls import reverse
+from posts.cache import bump_versions
+from posts.models import Post
+
+User = get_user_model()
+
+
+def in_other_process(function, *args):
+    """Выполняет function в дочернем процессе, как в другом воркере."""
+    process = multiprocessing.get_context('fork').Process(
+        target=function, args=args
+    )
+    process.start()
+    process.join()
+
+
+def set_value(key, value):
+    cache.set(key, value)
+
+
+def incr_value(key):
+    cache.incr(key)
+
+
+class SQLiteCacheTest(TestCase):
+    """Тесты общего кэша в SQLite."""
+    def setUp(self):
+        self.shared = caches['shared']
+        self.shared.clear()
+
+    def test_operations(self):
+        """Чтение, запись, add, incr и удаление."""
+        self.shared.set('a', {'x': 1})
+        self.assertEqual(self.shared.get('a'), {'x': 1})
+        self.assertFalse(self.shared.add('a', 2))
+        self.assertTrue(self.shared.add('b', 2))
+        self.assertEqual(self.shared.incr('b', 3), 5)
+        self.assertEqual(self.shared.get_many(['a', 'b', 'c']), {
+            'a': {'x': 1}, 'b': 5,
+        })
+        self.shared.delete_many(['a', 'b'])
+        self.assertIsNone(self.shared.get('a'))
+        with self.assertRaises(ValueError):
+            self.shared.incr('missing')
+
+    def test_expired_values_are_missing(self):
+        """Устаревшее значение не возвращается и уступает место add."""
+        self.shared.set('a', 1, timeout=0)
+        self.assertIsNone(self.shared.get('a'))
+        self.assertTrue(self.shared.add('a', 2))
+
+    def test_cull_keeps_max_entries(self):
+        """Сверх MAX_ENTRIES удаляются значения, которые устареют раньше."""
+        shared = SQLiteCache(
+            settings.CACHES['shared']['LOCATION'],
+            {'OPTIONS': {'MAX_ENTRIES': 2}},
+        )
+        for timeout, key in ((10, 'soon'), (100, 'later'), (None, 'never')):
+            shared.set(key, 1, timeout)
+        shared.cull()
+        self.assertEqual(set(shared.get_many(['soon', 'later', 'never'])), {
+            'later', 'never',
+        })
+
+
+class TieredCacheTest(TestCase):
+    """Тесты двухуровневого кэша и шины сброса."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_values_are_kept_locally(self):
+        """Прочитанное значение берётся из L1 без обращения к L2."""
+        cache.set('key', 'value')
+        caches['shared'].delete('key')
+        self.assertEqual(cache.get('key'), 'value')
+
+    def test_local_size_is_bounded(self):
+        """L1 вытесняет давно не читанные значения по размеру."""
+        location = os.path.join(
+            os.path.dirname(settings.CACHES['default']['LOCATION']), 'size'
+        )
+        tiered = TieredCache(location, {'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_BYTES': 3000,
+            'LOCAL_MAX_ENTRY_BYTES': 1500,
+        }})
+        tiered.set('big', 'x' * 2000)
+        self.assertNotIn(tiered.make_key('big'), tiered.state.entries)
+        for key in ('a', 'b', 'c'):
+            tiered.set(key, 'x' * 1000)
+        tiered.get('a')
+        tiered.set('d', 'x' * 1000)
+        self.assertEqual(
+            list(tiered.state.entries),
+            [tiered.make_key(key) for key in ('a', 'd')],
+        )
+        self.assertLessEqual(tiered.state.size, 3000)
+        self.assertEqual(tiered.get('b'), 'x' * 1000)
+
+    def test_other_process_changes_are_seen(self):
+        """Запись в другом процессе сбрасывает значение в L1."""
+        cache.set('key', 1)
+        self.assertEqual(cache.get('key'), 1)
+        in_other_process(incr_value, 'key')
+        self.assertEqual(cache.get('key'), 2)
+        in_other_process(set_value, 'key', 'new')
+        self.assertEqual(cache.get('key'), 'new')
+
+    def test_post_save_in_other_worker_purges_feed(self):
+        """Сброс ленты в другом воркере виден в этом процессе."""
+        client = Client()
+        client.get(reverse('posts:index'))
+        Post.objects.bulk_create([Post(text='Свежий пост', author=self.user)])
+        # bulk_create не шлёт сигналов: страница осталась в кэше
+        self.assertNotContains(client.get(reverse('posts:index')), 'Свежий')
+        # Сброс после фиксации транзакции, как в воркере с сигналом
+        in_other_process(bump_versions, [reverse('posts:index')])
+        self.assertContains(client.get(reverse('posts:index')), 'Свежий')
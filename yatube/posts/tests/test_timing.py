@@ -0,0 +1,115 @@
+import io
+import threading
+import time
+from unittest import mock
+
+from core import timing
+from core.timing import make_token
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from posts.models import Post
+
+User = get_user_model()
+
+
+class ServerTimingTest(TestCase):
+    """Тесты заголовка Server-Timing."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        Post.objects.create(text='Тестовый пост', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def phases(self, response):
+        return {
+            part.split(';')[0]: part
+            for part in response['Server-Timing'].split(', ')
+        }
+
+    def test_no_header_by_default(self):
+        """Без токена и для обычного пользователя заголовка нет."""
+        client = Client()
+        client.force_login(self.user)
+        for current in (self.client, client):
+            with self.subTest(client=current):
+                response = current.get(reverse('posts:index'))
+                self.assertNotIn('Server-Timing', response)
+                self.assertNotIn(
+                    settings.SERVER_TIMING_COOKIE_NAME, response.cookies
+                )
+
+    def test_signed_header_enables_phases(self):
+        """Подписанный заголовок включает разбивку по фазам."""
+        client = Client(HTTP_X_SERVER_TIMING=make_token())
+        response = client.get(reverse('posts:index'))
+        phases = self.phases(response)
+        for name in ('db', 'template', 'cache', 'total'):
+            self.assertIn(name, phases)
+        self.assertIn('desc="1"', phases['db'])
+        cached = self.phases(client.get(reverse('posts:index')))
+        # Из кэша без запросов к базе, рендерятся только фрагменты
+        self.assertNotIn('desc', cached['db'])
+
+    def test_bad_token_is_ignored(self):
+        """Неверная подпись не включает замер."""
+        client = Client(HTTP_X_SERVER_TIMING=make_token() + 'x')
+        response = client.get(reverse('posts:index'))
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(SERVER_TIMING_TOKEN_MAX_AGE=-1)
+    def test_expired_token_is_ignored(self):
+        """Просроченный токен не включает замер."""
+        client = Client(HTTP_X_SERVER_TIMING=make_token())
+        response = client.get(reverse('posts:index'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_staff_gets_cookie(self):
+        """Сотрудник получает cookie, и следующие ответы с замером."""
+        client = Client()
+        client.force_login(self.staff)
+        response = client.get(reverse('posts:index'))
+        self.assertIn(settings.SERVER_TIMING_COOKIE_NAME, response.cookies)
+        response = client.get(reverse('posts:index'))
+        self.assertIn('total', self.phases(response))
+
+    def test_token_command(self):
+        """Команда выдаёт рабочий токен."""
+        out = io.StringIO()
+        call_command('server_timing_token', stdout=out, stderr=io.StringIO())
+        client = Client(HTTP_X_SERVER_TIMING=out.getvalue().strip())
+        response = client.get(reverse('posts:index'))
+        self.assertIn('Server-Timing', response)
+
+    def test_concurrent_install_patches_once(self):
+        """Потоки, одновременно включившие замер, подменяют всё один
+        раз и продолжают только после подмены."""
+        barrier = threading.Barrier(4)
+        patched = threading.Event()
+        seen = []
+
+        def slow_install():
+            time.sleep(0.05)
+            patched.set()
+
+        def start():
+            barrier.wait()
+            timing.install()
+            seen.append(patched.is_set())
+
+        install = mock.Mock(side_effect=slow_install)
+        with mock.patch.multiple(timing, _installed=False, _install=install):
+            threads = [threading.Thread(target=start) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        install.assert_called_once()
+        self.assertEqual(seen, [True] * 4)
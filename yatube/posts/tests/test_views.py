@@ -71,6 +71,9 @@ class PostPagesTests(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        # Страницы лент общие для всех сессий, контекст есть только у
+        # построенной заново
+        cache.clear()
         # Создаём неавторизованный клиент
         self.guest_client = Client()
         # Создаём авторизованный клиент
@@ -0,0 +1,257 @@
+"""Построение миниатюр картинок постов заранее, вне запроса.
+
+После загрузки картинки все геометрии из ``POST_THUMBNAILS`` строятся
+во всех форматах из ``POST_THUMBNAIL_FORMATS`` в пуле процессов, и при
+отрисовке шаблона sorl находит готовую миниатюру в своём хранилище
+ключей вместо декодирования оригинала.
+Процессы запускаются методом spawn и сами настраивают Django, чтобы не
+наследовать открытые соединения с базой. Модуль импортируется в них до
+настройки Django, поэтому sorl импортируется внутри функций.
+
+Для страницы ленты миниатюры всех постов читаются из хранилища sorl
+пакетом, а не отдельным обращением на каждый тег ``thumbnail``.
+"""
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from core.metrics import count_lookups
+from core.timing import phase
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _setup_worker():
+    import django
+    django.setup()
+
+
+def thumbnail_specs():
+    """Геометрии и параметры всех строящихся заранее миниатюр."""
+    return [
+        (geometry, dict(options, format=format))
+        for geometry, options in settings.POST_THUMBNAILS
+        for format in settings.POST_THUMBNAIL_FORMATS
+    ]
+
+
+def build_thumbnails(name):
+    """Строит все миниатюры картинки name; возвращает их число."""
+    from sorl.thumbnail import get_thumbnail
+
+    built = 0
+    for geometry, options in thumbnail_specs():
+        try:
+            get_thumbnail(name, geometry, **options)
+        except Exception:
+            logger.exception('Не удалось построить миниатюру %s', name)
+        else:
+            built += 1
+    return built
+
+
+def get_executor(workers=None):
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=workers or settings.THUMBNAIL_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_setup_worker,
+        )
+    return _executor
+
+
+def schedule_thumbnails(names):
+    """Строит миниатюры картинок names в фоне после фиксации транзакции."""
+    names = [name for name in names if name]
+    if not names:
+        return
+    if not settings.THUMBNAIL_WORKERS:
+        transaction.on_commit(lambda: build_all(names, workers=0))
+        return
+
+    def submit():
+        executor = get_executor()
+        for name in names:
+            executor.submit(build_thumbnails, name)
+
+    transaction.on_commit(submit)
+
+
+def build_all(names, workers=None):
+    """Строит миниатюры картинок names и ждёт окончания.
+
+    При workers=0 всё строится в текущем процессе. Возвращает число
+    построенных миниатюр.
+    """
+    if workers == 0:
+        return sum(build_thumbnails(name) for name in names)
+    with ProcessPoolExecutor(
+        max_workers=workers or settings.THUMBNAIL_WORKERS,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_setup_worker,
+    ) as executor:
+        return sum(executor.map(build_thumbnails, names, chunksize=16))
+
+
+def _thumbnail_file(name, geometry, options):
+    """Файл миниатюры с тем же именем, что даёт sorl в get_thumbnail."""
+    from sorl.thumbnail import default
+    from sorl.thumbnail.conf import defaults as default_settings
+    from sorl.thumbnail.conf import settings as thumbnail_settings
+    from sorl.thumbnail.images import ImageFile
+
+    backend = default.backend
+    source = ImageFile(name)
+    options = dict(options)
+    if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(default_settings, attr):
+            options.setdefault(key, value)
+    return ImageFile(
+        backend._get_thumbnail_filename(source, geometry, options),
+        default.storage,
+    )
+
+
+def _read_kvstore(raw_keys):
+    """Значения хранилища sorl по ключам: кэш одним get_many, затем
+    недостающие одним запросом к базе."""
+    from sorl.thumbnail import default
+    from sorl.thumbnail.conf import settings as thumbnail_settings
+    from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+    from sorl.thumbnail.kvstores.cached_db_kvstore import \
+        KVStore as CachedDBKVStore
+    from sorl.thumbnail.models import KVStore
+
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBKVStore):
+        return {key: kvstore._get_raw(key) for key in raw_keys}
+    values = kvstore.cache.get_many(raw_keys)
+    missing = [key for key in raw_keys if key not in values]
+    count_lookups('thumbnail', len(raw_keys) - len(missing), len(missing))
+    if missing:
+        found = dict(
+            KVStore.objects.filter(key__in=missing).values_list(
+                'key', 'value'
+            )
+        )
+        kvstore.cache.set_many(
+            {key: found.get(key, EMPTY_VALUE) for key in missing},
+            thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT,
+        )
+        values.update(found)
+    return {
+        key: value for key, value in values.items()
+        if value and value != EMPTY_VALUE
+    }
+
+
+def _lookup(requests, build=True):
+    """Миниатюры по списку (имя, геометрия, параметры) в том же порядке.
+
+    Готовые миниатюры читаются из хранилища sorl одним обращением к
+    кэшу и не больше чем одним запросом к базе; строятся на месте
+    только те, которых ещё нет. Если миниатюру построить не удалось
+    (например, файла нет) или build=False, на её месте None.
+    """
+    from sorl.thumbnail import get_thumbnail
+    from sorl.thumbnail.images import deserialize_image_file
+    from sorl.thumbnail.kvstores.base import add_prefix
+
+    with phase('thumbnail'):
+        keys = [
+            add_prefix(_thumbnail_file(name, geometry, options).key)
+            for name, geometry, options in requests
+        ]
+        values = _read_kvstore(list(set(keys))) if keys else {}
+        thumbnails = []
+        for (name, geometry, options), key in zip(requests, keys):
+            if key in values:
+                thumbnails.append(deserialize_image_file(values[key]))
+                continue
+            if not build:
+                thumbnails.append(None)
+                continue
+            try:
+                thumbnail = get_thumbnail(name, geometry, **options)
+            except Exception:
+                logger.exception('Не удалось построить миниатюру %s', name)
+                thumbnail = None
+            # Без размеров sorl возвращает миниатюру, которой нет в хранилище
+            if thumbnail is not None and thumbnail.size is None:
+                thumbnail = None
+            thumbnails.append(thumbnail)
+        return thumbnails
+
+
+def get_thumbnails(names, geometry, **options):
+    """Миниатюры картинок names одной геометрии: {имя: ImageFile}.
+
+    Картинки без миниатюры в результат не входят.
+    """
+    names = sorted({name for name in names if name})
+    thumbnails = _lookup([(name, geometry, options) for name in names])
+    return {
+        name: thumbnail
+        for name, thumbnail in zip(names, thumbnails)
+        if thumbnail is not None
+    }
+
+
+def get_thumbnail_formats(names, geometry, build=True, **options):
+    """Миниатюры картинок names во всех POST_THUMBNAIL_FORMATS.
+
+    Возвращает {имя: {формат: ImageFile}}; все форматы читаются одним
+    пакетом. При build=False отсутствующие миниатюры не строятся.
+    """
+    names = sorted({name for name in names if name})
+    formats = settings.POST_THUMBNAIL_FORMATS
+    requests = [
+        (name, geometry, dict(options, format=format))
+        for name in names
+        for format in formats
+    ]
+    thumbnails = iter(_lookup(requests, build))
+    result = {}
+    for name in names:
+        variants = {format: next(thumbnails) for format in formats}
+        result[name] = {
+            format: thumbnail
+            for format, thumbnail in variants.items()
+            if thumbnail is not None
+        }
+    return result
+
+
+def picture(post, formats, geometry, options):
+    """Контекст шаблона posts/includes/picture.html.
+
+    Ширина и высота берутся из размеров, записанных при загрузке, а не
+    из файла миниатюры. Без миниатюры в image_url ссылка на оригинал.
+    """
+    from .images import thumbnail_size
+
+    thumbnail = formats.get('JPEG')
+    size = thumbnail_size(
+        post.image_width, post.image_height, geometry, **options
+    )
+    if size is None and thumbnail is not None:
+        # У старых постов размеров нет, их знает хранилище sorl
+        size = (thumbnail.width, thumbnail.height)
+    return {
+        'thumbnail': thumbnail,
+        'thumbnail_webp': formats.get('WEBP'),
+        'thumbnail_size': size,
+        'image_url': (
+            post.image.url if post.image and thumbnail is None else None
+        ),
+    }
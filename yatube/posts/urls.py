@@ -23,6 +23,8 @@ urlpatterns = [
         views.add_comment,
         name='add_comment'
     ),
+    # Поиск по постам и комментариям
+    path('search/', views.search, name='search'),
     # Просмотр постов авторов, на которых подписан пользователь
     path('follow/', views.follow_index, name='follow_index'),
     # Подписаться
@@ -1,27 +1,36 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 
+from core.queries import query_budget
+
+from .cache import cache_feed
+from .feeds import FEED_KEYS, follow_feed
 from .forms import CommentForm, PostForm
 from .models import Follow, Group, Post, User
+from .paginator import CursorPaginator
+from .search import SEARCH_KEYS, search_posts
+from .thumbnails import get_thumbnail_formats, picture, schedule_thumbnails
 
 CNT_POSTS = 10
 
 
-def create_pages(request, posts, cnt):
-    paginator = Paginator(posts, cnt)
-    # Из URL извлекаем номер запрошенной страницы - это значение page
-    page_number = request.GET.get('page')
-    # Получаем набор записей для страницы с запрошенным номером
-    page_obj = paginator.get_page(page_number)
+def create_pages(request, posts, cnt, keys=('pub_date', 'id')):
+    paginator = CursorPaginator(posts, cnt, keys)
+    # Страница выбирается по курсору из URL; номер страницы page
+    # поддерживается для старых ссылок
+    page_obj = paginator.get_cursor_page(
+        request.GET.get('cursor'),
+        request.GET.get('page'),
+    )
     return page_obj
 
 
-@cache_page(20, key_prefix='index_page')
+@query_budget(6)
+@cache_feed(key_prefix='index_page')
 def index(request):
     template = 'posts/index.html'
-    post_list = Post.objects.select_related()
+    post_list = Post.objects.select_related('author', 'group')
     page_obj = create_pages(request, post_list, CNT_POSTS)
     context = {
         'page_obj': page_obj,
@@ -29,12 +38,14 @@ def index(request):
     return render(request, template, context)
 
 
+@query_budget(7)
+@cache_feed(key_prefix='group_page')
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     title = 'Записи сообщества'
     group = get_object_or_404(Group, slug=slug)
     # post_list = Post.objects.filter(group=group).order_by('-pub_date')
-    post_list = group.posts.select_related()
+    post_list = group.posts.select_related('author', 'group')
     page_obj = create_pages(request, post_list, CNT_POSTS)
     context = {
         'group': group,
@@ -44,38 +55,66 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@query_budget(8)
+@cache_feed(key_prefix='profile_page')
 def profile(request, username):
     # Здесь код запроса к модели и создание словаря контекста
     template = 'posts/profile.html'
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.select_related()
+    author = get_object_or_404(
+        User.objects.select_related('counters'), username=username
+    )
+    post_list = author.posts.select_related('author', 'group')
     page_obj = create_pages(request, post_list, CNT_POSTS)
-    following = False
-    if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            author__following__user=request.user, author=author).exists()
+    # Кнопка подписки — фрагмент, который заполняется для каждого запроса
     context = {
         'page_obj': page_obj,
         'author': author,
-        'following': following,
     }
     return render(request, template, context)
 
 
+@query_budget(8)
+def search(request):
+    template = 'posts/search.html'
+    q = request.GET.get('q', '').strip()
+    post_list = search_posts(q).select_related('author', 'group')
+    page_obj = create_pages(request, post_list, CNT_POSTS, SEARCH_KEYS)
+    context = {
+        'page_obj': page_obj,
+        'q': q,
+    }
+    return render(request, template, context)
+
+
+@query_budget(8)
 def post_detail(request, post_id):
     # Здесь код запроса к модели и создание словаря контекста
     template = 'posts/post_detail.html'
-    post_number = get_object_or_404(Post, pk=post_id)
+    post_number = get_object_or_404(
+        Post.objects.select_related('author__counters', 'group'), pk=post_id
+    )
     form = CommentForm()
-    comments = post_number.comments.select_related()
+    comments = post_number.comments.select_related('author')
     context = {
         'post_number': post_number,
         'form': form,
         'comments': comments,
     }
+    name = post_number.image.name
+    if name:
+        # Файл картинки не открывается: без готовой миниатюры показывается
+        # оригинал, а миниатюра строится в фоне
+        geometry, options = settings.POST_THUMBNAILS[0]
+        formats = get_thumbnail_formats(
+            [name], geometry, build=False, **options
+        ).get(name, {})
+        context.update(picture(post_number, formats, geometry, options))
+        if not formats:
+            schedule_thumbnails([name])
     return render(request, template, context)
 
 
+@query_budget(22)
 @login_required
 def post_create(request):
     template = 'posts/create_post.html'
@@ -89,6 +128,7 @@ def post_create(request):
         new_post = form.save(commit=False)
         new_post.author = request.user
         new_post.save()
+        schedule_thumbnails([new_post.image.name])
         return redirect('posts:profile', request.user)
     context = {
         'form': form,
@@ -98,14 +138,17 @@ def post_create(request):
     return render(request, template, context)
 
 
+@query_budget(20)
 @login_required
 def post_edit(request, post_id):
     template = 'posts/create_post.html'
     title = 'Редактировать пост'
     is_edit = True
     post = get_object_or_404(Post, pk=post_id)
-    if post.author != request.user:
+    if post.author_id != request.user.pk:
         return redirect('posts:post_detail', post_id)
+    # Автор — текущий пользователь, сигналам не нужен запрос за ним
+    post.author = request.user
     form = PostForm(
         data=request.POST or None,
         files=request.FILES or None,
@@ -113,6 +156,8 @@ def post_edit(request, post_id):
     )
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            schedule_thumbnails([post.image.name])
         return redirect('posts:post_detail', post_id=post_id)
     context = {
         # 'post': post,
@@ -123,6 +168,7 @@ def post_edit(request, post_id):
     return render(request, template, context)
 
 
+@query_budget(14)
 @login_required
 def add_comment(request, post_id):
     # Получите пост
@@ -136,17 +182,20 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@query_budget(6)
 @login_required
 def follow_index(request):
     template = 'posts/follow.html'
-    post_list = Post.objects.filter(author__following__user=request.user)
-    page_obj = create_pages(request, post_list, CNT_POSTS)
+    # Лента читается из материализованных входящих пользователя
+    post_list = follow_feed(request.user).select_related('author', 'group')
+    page_obj = create_pages(request, post_list, CNT_POSTS, FEED_KEYS)
     context = {
         'page_obj': page_obj,
     }
     return render(request, template, context)
 
 
+@query_budget(18)
 @login_required
 def profile_follow(request, username):
     """View функция для подписки на автора."""
@@ -160,6 +209,7 @@ def profile_follow(request, username):
     return redirect('posts:profile', username=username)
 
 
+@query_budget(14)
 @login_required
 def profile_unfollow(request, username):
     """View функция для отписки от автора."""
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -59,11 +60,18 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.CompressionMiddleware',
+    'core.middleware.QueryCountMiddleware',
+    'core.middleware.SlowQueryMiddleware',
+    'core.middleware.LazyLoadMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ServerTimingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -148,8 +156,136 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Посты авторов, у которых подписчиков больше этого числа, не
+# раскладываются по лентам подписчиков, а дочитываются при чтении ленты
+FEED_FANOUT_LIMIT = 10000
+# На раскладку автор возвращается, когда подписчиков не больше этого
+# числа; зазор до FEED_FANOUT_LIMIT не даёт переключаться туда и обратно
+FEED_FANOUT_RESUME = 9000
+# Потоки, раскладывающие посты автора после возврата на раскладку;
+# 0 — в текущем потоке сразу после фиксации транзакции
+FEED_BACKFILL_WORKERS = 1
+
+# Страницы лент хранятся в кэше до изменения их версии сигналами,
+# поэтому время жизни может быть большим
+FEED_CACHE_TIMEOUT = 60 * 60
+# Перестраивать первую страницу ленты в фоне сразу после изменений
+FEED_CACHE_REWARM = False
+# Пока один запрос перестраивает страницу ленты, остальные получают
+# прежнюю; она хранится ещё FEED_CACHE_STALE_TIMEOUT секунд после срока.
+# Без прежней страницы запрос ждёт новую не дольше FEED_CACHE_LOCK_WAIT
+# секунд. Блокировка перестройки снимается через FEED_CACHE_LOCK_TIMEOUT
+FEED_CACHE_STALE_TIMEOUT = 60 * 5
+FEED_CACHE_LOCK_TIMEOUT = 30
+FEED_CACHE_LOCK_WAIT = 2
+# Насколько рано перестраивать страницу до истечения срока (XFetch)
+FEED_CACHE_EARLY_BETA = 1
+
+# Ответы короче COMPRESSION_MIN_LENGTH байт не сжимаются. Уровни для
+# ответов — на каждый запрос, для страниц лент в кэше — один раз при
+# перестройке, поэтому выше. brotli работает, если установлен пакет brotli
+COMPRESSION_MIN_LENGTH = 200
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
+CACHED_PAGE_GZIP_LEVEL = 9
+CACHED_PAGE_BROTLI_QUALITY = 11
+
+# Время жизни отрисованной карточки поста: ключ меняется при каждом
+# изменении поста, так что это лишь срок вытеснения неиспользуемых
+POST_CARD_TIMEOUT = 60 * 60 * 24
+
+# Миниатюры картинок постов, которые строятся заранее после загрузки.
+# Первая — миниатюра карточки в лентах; геометрии и параметры должны
+# совпадать с тегами thumbnail в шаблонах
+POST_THUMBNAILS = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+# Каждая миниатюра строится во всех этих форматах; браузер, который
+# понимает WebP, выбирает его в теге <picture>
+POST_THUMBNAIL_FORMATS = ('JPEG', 'WEBP')
+# Загруженные картинки уменьшаются до этого размера
+POST_IMAGE_MAX_SIZE = (1920, 1920)
+# Число процессов, в которых строятся миниатюры
+THUMBNAIL_WORKERS = 2
+
+# Число запросов к базе, их время и повторы в заголовках X-Query-*
+QUERY_COUNT_HEADERS = DEBUG
+# Превышение бюджета запросов view (core.queries.query_budget) —
+# исключение вместо предупреждения в логе; включается в тестах
+QUERY_BUDGET_STRICT = False
+# Метрики Prometheus: каждый процесс пишет свой файл в METRICS_DIR не
+# чаще раза в METRICS_FLUSH_INTERVAL секунд, /metrics/ складывает файлы
+METRICS_DIR = os.path.join(tempfile.gettempdir(), 'yatube-metrics')
+METRICS_FLUSH_INTERVAL = 1
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+# Заголовок Server-Timing включается подписанным токеном из команды
+# server_timing_token в заголовке X-Server-Timing или cookie, которую
+# получают сотрудники; токен действует SERVER_TIMING_TOKEN_MAX_AGE секунд
+SERVER_TIMING_COOKIE_NAME = 'server_timing'
+SERVER_TIMING_TOKEN_MAX_AGE = 60 * 60 * 24
+# Профилирование запросов (core.profiling): подписанный заголовок
+# X-Profile или доля PROFILE_SAMPLE_RATE всех запросов; в PROFILE_DIR
+# хранятся последние PROFILE_KEEP профилей
+PROFILE_DIR = os.path.join(tempfile.gettempdir(), 'yatube-profiles')
+PROFILE_KEEP = 50
+PROFILE_SAMPLE_RATE = 0
+PROFILE_TOKEN_MAX_AGE = 60 * 60
+PROFILE_TRACEMALLOC_FRAMES = 10
+# Журнал запросов к базе дольше SLOW_QUERY_THRESHOLD_MS миллисекунд
+# с планами выполнения (core.slowqueries, команда slow_queries)
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_LOG = os.path.join(tempfile.gettempdir(), 'yatube-slow-queries.log')
+# Поиск N+1 в view и шаблонах (core.lazyloads): 'log', 'raise' или None
+LAZY_LOAD_CHECK = 'log' if DEBUG else None
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SLOW_QUERY_LOG,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'encoding': 'utf-8',
+            'delay': True,
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'core.slowqueries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+# Двухуровневый кэш (core.cache): L1 в памяти каждого воркера и общий
+# для всех процессов L2 в файле SQLite. Изменения рассылаются по шине на
+# unix-сокетах в каталоге LOCATION, и другие воркеры сбрасывают свой L1
+CACHE_DIR = os.path.join(tempfile.gettempdir(), 'yatube-cache')
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TieredCache',
+        'LOCATION': os.path.join(CACHE_DIR, 'bus'),
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_BYTES': 16 * 1024 * 1024,
+            'LOCAL_MAX_ENTRY_BYTES': 1024 * 1024,
+            'LOCAL_TIMEOUT': 60,
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(CACHE_DIR, 'shared.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
 }
+# Тесты получают свой каталог кэша (core.testing)
+TEST_RUNNER = 'core.testing.TestRunner'